@@ -2,6 +2,7 @@ import aiohttp
 import json
 import logging
 from app.core.config import settings
+from app.core.tracing import tracer
 
 logger = logging.getLogger(__name__)
 
@@ -25,20 +26,23 @@ class GraphQLClient:
             payload["variables"] = variables
             
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    url=self.api_url,
-                    headers=self.headers,
-                    data=json.dumps(payload)
-                ) as response:
-                    response.raise_for_status()
-                    data = await response.json()
+            with tracer.span("graphql.query") as span:
+                async with aiohttp.ClientSession() as session:
+                    async with session.post(
+                        url=self.api_url,
+                        headers=self.headers,
+                        data=json.dumps(payload)
+                    ) as response:
+                        response.raise_for_status()
+                        body = await response.read()
+                        span.set(status=response.status, bytes=len(body))
+                        data = json.loads(body)
                     
-                    if "errors" in data:
-                        logger.error(f"GraphQL query error: {data['errors']}")
-                        raise Exception(f"GraphQL error: {data['errors'][0]['message']}")
+                        if "errors" in data:
+                            logger.error(f"GraphQL query error: {data['errors']}")
+                            raise Exception(f"GraphQL error: {data['errors'][0]['message']}")
                         
-                    return data.get("data")
+                        return data.get("data")
                     
         except aiohttp.ClientError as e:
             logger.error(f"HTTP error: {str(e)}")
@@ -0,0 +1,176 @@
+"""
+Fingerprinted, precompressed static assets.
+
+    python -m app.core.assets build [--source static] [--out static/dist]
+
+The build copies every asset under static/ (scripts, styles, images) to
+`<out>/assets/<path>.<hash>.<ext>` with its content hash in the name,
+writes `.gz` and `.br` variants next to it, and rewrites the `/static/...`
+references in the HTML pages (and in url(...) in stylesheets) to
+`/assets/...` names. The rewritten pages and `manifest.json`, which maps
+each source path to its built name, go to <out> itself.
+
+At runtime /assets is served by AssetFiles: the client gets the smallest
+precompressed variant it accepts, and since a name changes whenever its
+content does, every asset is cached for a year as immutable. The pages
+themselves are served from the build with no-cache, so a deploy is picked
+up on the next load. Without a build the app serves the sources from
+/static as before.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import shutil
+from typing import Dict, Optional
+
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.staticfiles import StaticFiles
+
+from app.core.http_cache import accepted_encodings
+
+try:
+    import brotli
+except ImportError:  # .gz variants only
+    brotli = None
+
+PAGES = ("index.html", "dashboard.html")
+
+COMPRESSIBLE = (".js", ".css", ".svg", ".json", ".txt", ".map")
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+# /static/<path> in src="", href="" and url() references
+REFERENCE = re.compile(r"""(?P<prefix>(?:src|href)\s*=\s*["']|url\(\s*["']?)/static/(?P<path>[^"')?#\s]+)""")
+
+VARIANTS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def fingerprint(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+def hashed_name(path: str, digest: str) -> str:
+    root, ext = os.path.splitext(path)
+    return f"{root}.{digest}{ext}"
+
+
+def rewrite(text: str, manifest: Dict[str, str]) -> str:
+    """Point /static references at built names; unknown paths are left alone"""
+    def replace(match):
+        built = manifest.get(match.group("path"))
+        if built is None:
+            return match.group(0)
+        return f"{match.group('prefix')}/assets/{built}"
+    return REFERENCE.sub(replace, text)
+
+
+def write_variants(path: str, data: bytes):
+    # mtime=0 so rebuilding the same content gives byte-identical .gz files
+    with open(path + ".gz", "wb") as f:
+        f.write(gzip.compress(data, 9, mtime=0))
+    if brotli is not None:
+        with open(path + ".br", "wb") as f:
+            f.write(brotli.compress(data, quality=11))
+
+
+def build(source: str = "static", out: str = "static/dist") -> Dict[str, str]:
+    """Build fingerprinted assets and rewritten pages; returns the manifest"""
+    source, out = os.path.abspath(source), os.path.abspath(out)
+    if os.path.exists(out):
+        shutil.rmtree(out)
+    os.makedirs(out)
+
+    assets = []
+    for directory, subdirs, files in os.walk(source):
+        subdirs[:] = [d for d in subdirs if os.path.join(directory, d) != out]
+        for name in files:
+            rel = os.path.relpath(os.path.join(directory, name), source).replace(os.sep, "/")
+            if rel not in PAGES:
+                assets.append(rel)
+
+    # Stylesheets may reference other assets, so they are hashed after those
+    manifest: Dict[str, str] = {}
+    for rel in sorted(assets, key=lambda rel: (rel.endswith(".css"), rel)):
+        with open(os.path.join(source, rel), "rb") as f:
+            data = f.read()
+        if rel.endswith(".css"):
+            data = rewrite(data.decode(), manifest).encode()
+        built = hashed_name(rel, fingerprint(data))
+        target = os.path.join(out, "assets", built)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, "wb") as f:
+            f.write(data)
+        if rel.endswith(COMPRESSIBLE):
+            write_variants(target, data)
+        manifest[rel] = built
+
+    for page in PAGES:
+        path = os.path.join(source, page)
+        if not os.path.exists(path):
+            continue
+        with open(path) as f:
+            html = rewrite(f.read(), manifest)
+        with open(os.path.join(out, page), "w") as f:
+            f.write(html)
+
+    with open(os.path.join(out, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def page_path(page: str, source: str = "static", out: str = "static/dist") -> str:
+    """The built page when a build exists, the source page otherwise"""
+    built = os.path.join(out, page)
+    return built if os.path.exists(built) else os.path.join(source, page)
+
+
+class AssetFiles(StaticFiles):
+    """StaticFiles for built assets: precompressed variants and immutable caching"""
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200) -> Response:
+        accepted = accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+        media_type = mimetypes.guess_type(str(full_path))[0] or "application/octet-stream"
+        served_encoding: Optional[str] = None
+        # Highest q-value first; VARIANTS order breaks ties
+        for name, suffix in sorted(VARIANTS, key=lambda variant: -accepted.get(variant[0], 0)):
+            if accepted.get(name, 0) > 0:
+                try:
+                    stat_result = os.stat(str(full_path) + suffix)
+                except FileNotFoundError:
+                    continue
+                full_path, served_encoding = str(full_path) + suffix, name
+                break
+
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        response.headers["Cache-Control"] = IMMUTABLE
+        if str(full_path).endswith(COMPRESSIBLE + tuple(suffix for _, suffix in VARIANTS)):
+            response.headers["Vary"] = "Accept-Encoding"
+        if served_encoding is not None:
+            response.headers["Content-Encoding"] = served_encoding
+        if response.status_code == 200:
+            response.headers["Content-Type"] = media_type
+        return response
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m app.core.assets", description="Build fingerprinted static assets")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_parser = commands.add_parser("build")
+    build_parser.add_argument("--source", default="static")
+    build_parser.add_argument("--out", default="static/dist")
+    args = parser.parse_args()
+
+    manifest = build(args.source, args.out)
+    for rel, built in sorted(manifest.items()):
+        print(f"{rel} -> {built}")
+    if brotli is None:
+        print("brotli is not installed: wrote .gz variants only")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+"""
+Conditional requests, cache lifetimes and compression for the JSON API.
+
+An endpoint describes what its response is built from with a `Freshness`:
+the version of the underlying data, when that data last changed and how
+long clients may reuse it. `check()` answers a matching If-None-Match (or
+If-Modified-Since) with 304 before any query runs; HttpCacheMiddleware
+stamps ETag, Last-Modified and Cache-Control on the full 200 response.
+
+Buckets that ended more than HTTP_CACHE_SETTLE_SECONDS ago (yesterday's
+hourly counts, past daily ranges) no longer change, so they are versioned
+by their URL alone and cached for a long time. Everything touching the live
+bucket is versioned by a change counter bumped by the ingest write
+listeners (other workers adopt the version the ingest leader announces),
+and kept for a few seconds only.
+
+The middleware also compresses JSON and text bodies over a size threshold,
+with brotli when the client accepts it and the module is installed, gzip
+otherwise. Compressed representations get the encoding appended to their
+ETag so every strong validator still names exactly one byte sequence.
+"""
+import hashlib
+import uuid
+import zlib
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Dict, List, NamedTuple, Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+from starlette.datastructures import Headers, MutableHeaders
+
+from app.core.config import settings
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript")
+
+ENCODING_SUFFIXES = {"br": "-br", "gzip": "-gz"}
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class DataVersions:
+    """Change counters for the tables responses are built from, one set per process"""
+
+    def __init__(self):
+        # A restarted worker must not reuse the validators of the old one
+        self.boot = uuid.uuid4().hex[:8]
+        self.started = _utcnow()
+        self.counters: Dict[str, int] = {}
+        self.changed_at: Dict[str, datetime] = {}
+        self.adopted: Dict[str, str] = {}
+
+    def bump(self, name: str, rows=None):
+        """Record a change to `name`; usable as an ingest write listener via functools.partial"""
+        self.counters[name] = self.counters.get(name, 0) + 1
+        self.changed_at[name] = _utcnow()
+        self.adopted.pop(name, None)
+
+    def adopt(self, name: str, version: Optional[str]):
+        """Take over the version another worker assigned to a change it made"""
+        if version is not None:
+            self.adopted[name] = version
+        self.changed_at[name] = _utcnow()
+
+    def version(self, name: str) -> str:
+        adopted = self.adopted.get(name)
+        return adopted if adopted is not None else f"{self.boot}.{self.counters.get(name, 0)}"
+
+    def last_modified(self, name: str) -> datetime:
+        return self.changed_at.get(name, self.started)
+
+
+class Freshness(NamedTuple):
+    etag: str
+    last_modified: datetime  # naive UTC
+    cache_control: str
+
+    def headers(self) -> Dict[str, str]:
+        return {
+            "ETag": self.etag,
+            "Last-Modified": format_datetime(self.last_modified.replace(microsecond=0, tzinfo=timezone.utc),
+                                             usegmt=True),
+            "Cache-Control": self.cache_control,
+        }
+
+
+def freshness(request: Request, version: str, last_modified: datetime, max_age: int,
+              immutable: bool = False) -> Freshness:
+    """Validators for the response to `request` built from data at `version`"""
+    # Python and Postgres rendering produce different bytes for the same data
+    key = f"{request.url.path}?{request.url.query}|{version}|{settings.JSON_RENDERING}"
+    etag = '"' + hashlib.sha1(key.encode()).hexdigest()[:24] + '"'
+    cache_control = f"public, max-age={max_age}" + (", immutable" if immutable else "")
+    return Freshness(etag, last_modified, cache_control)
+
+
+def settled(bucket_end: datetime, settle_seconds: float) -> bool:
+    """Whether a time bucket ending at `bucket_end` (naive UTC) can no longer change"""
+    return _utcnow() >= bucket_end + timedelta(seconds=settle_seconds)
+
+
+def _validators(request: Request) -> List[str]:
+    """The entity tags of If-None-Match, weak ones compared as strong"""
+    tags = [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]
+    return [tag[2:] if tag.startswith("W/") else tag for tag in tags]
+
+
+def _strip_encoding(tag: str) -> str:
+    for suffix in ENCODING_SUFFIXES.values():
+        if tag.endswith(suffix + '"'):
+            return tag[:-len(suffix) - 1] + '"'
+    return tag
+
+
+def _matches(request: Request, fresh: Freshness) -> bool:
+    if "if-none-match" in request.headers:
+        tags = [_strip_encoding(tag) for tag in _validators(request)]
+        return "*" in tags or fresh.etag in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is not None:
+            since = since.astimezone(timezone.utc).replace(tzinfo=None)
+        return fresh.last_modified.replace(microsecond=0) <= since
+    return False
+
+
+def check(request: Request, fresh: Freshness) -> Optional[Response]:
+    """
+    Attach `fresh` to the request for the middleware, and return the 304 to
+    send instead of the response when the client already holds this version.
+    """
+    request.state.freshness = fresh
+    if _matches(request, fresh):
+        return Response(status_code=304, headers={**fresh.headers(), "ETag": _representation_etag(request, fresh)})
+    return None
+
+
+def _representation_etag(request: Request, fresh: Freshness) -> str:
+    """The ETag the 200 would carry: with the suffix of the coding the middleware picks for this request"""
+    encoding = negotiate(request.headers.get("accept-encoding", ""))
+    if encoding is None:
+        return fresh.etag
+    suffixed = fresh.etag[:-1] + ENCODING_SUFFIXES[encoding] + '"'
+    # Bodies under the compression threshold go out as they are; the client's validator says which one it holds
+    held = _validators(request)
+    if fresh.etag in held and suffixed not in held:
+        return fresh.etag
+    return suffixed
+
+
+def accepted_encodings(accept_encoding: str) -> Dict[str, float]:
+    """Content codings of an Accept-Encoding header with their q-values"""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip().lower()] = q
+    return accepted
+
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    """
+    The content coding we can produce with the highest q-value in an
+    Accept-Encoding header, brotli on a tie; none when the header ranks
+    identity above it
+    """
+    accepted = accepted_encodings(accept_encoding)
+    best, best_q = None, 0.0
+    for coding in ("br", "gzip") if brotli is not None else ("gzip",):
+        q = accepted.get(coding, accepted.get("*", 0))
+        if q > best_q:
+            best, best_q = coding, q
+    if accepted.get("identity", 0) > best_q:
+        return None
+    return best
+
+
+class _Encoder:
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=brotli_quality)
+            self._compress, self._finish = self._compressor.process, self._compressor.finish
+        else:
+            self._compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+            self._compress, self._finish = self._compressor.compress, self._compressor.flush
+
+    def compress(self, data: bytes, last: bool) -> bytes:
+        out = self._compress(data) if data else b""
+        return out + self._finish() if last else out
+
+
+class HttpCacheMiddleware:
+    """Pure ASGI middleware applying `check()` validators and compressing responses"""
+
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 5, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""))
+        start = None
+        encoder: Optional[_Encoder] = None
+
+        async def send_wrapper(message):
+            nonlocal start, encoder
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body" or start is None:
+                await send(message)
+                return
+
+            body, more = message.get("body", b""), message.get("more_body", False)
+            if start.get("sent"):
+                if encoder is not None:
+                    body = encoder.compress(body, not more)
+                await send({"type": "http.response.body", "body": body, "more_body": more})
+                return
+
+            headers = MutableHeaders(raw=list(start["headers"]))
+            ok = start["status"] == 200
+            fresh = scope.get("state", {}).get("freshness")
+            if ok and fresh is not None:
+                for name, value in fresh.headers().items():
+                    headers[name] = value
+
+            compressible = (ok and "content-encoding" not in headers
+                            and headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES))
+            if compressible and "accept-encoding" not in headers.get("vary", "").lower():
+                headers.add_vary_header("Accept-Encoding")
+            if compressible and encoding is not None and (more or len(body) >= self.minimum_size):
+                encoder = _Encoder(encoding, self.gzip_level, self.brotli_quality)
+                body = encoder.compress(body, not more)
+                headers["Content-Encoding"] = encoding
+                if "etag" in headers:
+                    headers["ETag"] = headers["etag"][:-1] + ENCODING_SUFFIXES[encoding] + '"'
+                if more:
+                    del headers["content-length"]
+                else:
+                    headers["Content-Length"] = str(len(body))
+
+            await send({**start, "headers": headers.raw})
+            start = {"sent": True}
+            await send({"type": "http.response.body", "body": body, "more_body": more})
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,17 @@
+import json
+import logging
+import random
+
+
+def log_sampled(logger: logging.Logger, rate: float, event: str, **fields):
+    """
+    Log a structured JSON event with probability `rate`.
+
+    Used on hot paths where logging every occurrence would cost more than
+    the work being logged; the rate is part of the record so counts can be
+    scaled back up.
+    """
+    if rate <= 0 or (rate < 1 and random.random() >= rate):
+        return
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps({"event": event, "sample_rate": rate, **fields}, default=str))
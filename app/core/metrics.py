@@ -0,0 +1,144 @@
+import time
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+from app.db.queries import NAMES
+
+# Ingest
+FETCH_SECONDS = Histogram(
+    "ingest_fetch_seconds", "Time to fetch one live feed payload", ["feed"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30),
+)
+PAYLOAD_BYTES = Histogram(
+    "ingest_payload_bytes", "Size of one live feed payload", ["feed"],
+    buckets=(1e3, 1e4, 1e5, 5e5, 1e6, 5e6, 1e7, 5e7),
+)
+CYCLE_ROWS = Histogram(
+    "ingest_cycle_rows", "Rows per fetch cycle by outcome", ["feed", "outcome"],
+    buckets=(0, 10, 100, 500, 1000, 2500, 5000, 10000, 50000),
+)
+ROWS = Counter("ingest_rows", "Live feed rows by outcome", ["feed", "outcome"])
+
+# Database
+QUERY_SECONDS = Histogram(
+    "db_query_seconds", "Postgres statement latency", ["statement"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+QUERY_ERRORS = Counter("db_query_errors", "Postgres statements that raised", ["statement"])
+POOL_ACQUIRE_SECONDS = Histogram(
+    "db_pool_acquire_seconds", "Time spent waiting for a pool connection", ["pool"],
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5),
+)
+POOL_ACQUIRE_TIMEOUTS = Counter("db_pool_acquire_timeouts", "Acquires that gave up waiting", ["pool"])
+
+# HTTP
+HTTP_SECONDS = Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ["method", "route", "status"],
+)
+
+
+def statement_name(sql: str) -> str:
+    """Bounded metric label for a SQL statement"""
+    name = NAMES.get(sql)
+    if name is None:
+        # Statements outside app.db.queries are labelled by their leading keywords
+        name = " ".join(sql.split()[:3]).lower()
+    return name
+
+
+def observe_query(record):
+    """asyncpg query logger callback"""
+    name = statement_name(record.query)
+    QUERY_SECONDS.labels(name).observe(record.elapsed)
+    if record.exception is not None:
+        QUERY_ERRORS.labels(name).inc()
+
+
+class AppCollector:
+    """Exports gauges read straight from the running app: pipelines and connection pools"""
+
+    def __init__(self, app):
+        self.app = app
+
+    def collect(self):
+        depth = GaugeMetricFamily("ingest_stage_queue_depth", "Items waiting in a stage's input queue",
+                                  labels=["feed", "stage"])
+        latency = GaugeMetricFamily("ingest_stage_latency_seconds", "Moving average time per stage pass",
+                                    labels=["feed", "stage"])
+        dropped = CounterMetricFamily("ingest_stage_dropped", "Items dropped by a stage",
+                                      labels=["feed", "stage"])
+        since_sync = GaugeMetricFamily("ingest_seconds_since_last_sync",
+                                       "Seconds since the last successful write", labels=["feed"])
+        spooled = GaugeMetricFamily("ingest_spool_bytes", "Bytes held in the disk spool", labels=["feed"])
+
+        now = time.time()
+        for name, pipeline in getattr(self.app.state, "pipelines", {}).items():
+            for stage in pipeline.stages.values():
+                depth.add_metric([name, stage.name], stage.queue.qsize() if stage.queue is not None else 0)
+                latency.add_metric([name, stage.name], stage.avg_latency)
+                dropped.add_metric([name, stage.name], stage.dropped)
+            if pipeline.last_write_at is not None:
+                since_sync.add_metric([name], now - pipeline.last_write_at)
+            if pipeline.spool is not None:
+                spooled.add_metric([name], pipeline.spool.size)
+        yield from (depth, latency, dropped, since_sync, spooled)
+
+        gauges = {
+            "db_pool_size": GaugeMetricFamily("db_pool_size", "Open connections in the pool", labels=["pool"]),
+            "db_pool_max_size": GaugeMetricFamily("db_pool_max_size", "Maximum connections in the pool",
+                                                  labels=["pool"]),
+            "db_pool_idle": GaugeMetricFamily("db_pool_idle", "Idle connections in the pool", labels=["pool"]),
+            "db_pool_in_use": GaugeMetricFamily("db_pool_in_use", "Checked-out connections in the pool",
+                                                labels=["pool"]),
+            "db_pool_waiting": GaugeMetricFamily("db_pool_waiting", "Tasks waiting for a pool connection",
+                                                 labels=["pool"]),
+        }
+        for name, pool in getattr(self.app.state, "pools", {}).items():
+            gauges["db_pool_size"].add_metric([name], pool.get_size())
+            gauges["db_pool_max_size"].add_metric([name], pool.get_max_size())
+            gauges["db_pool_idle"].add_metric([name], pool.get_idle_size())
+            gauges["db_pool_in_use"].add_metric([name], pool.get_size() - pool.get_idle_size())
+            gauges["db_pool_waiting"].add_metric([name], pool.waiting)
+        yield from gauges.values()
+
+
+def register_app_collector(app):
+    collector = AppCollector(app)
+    REGISTRY.register(collector)
+    return collector
+
+
+def render():
+    """Prometheus text exposition of every registered metric"""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording per-route latency and status counts"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # The matched route template keeps label cardinality bounded
+            route = scope.get("route")
+            path = getattr(route, "path", None)
+            if path is None:
+                path = "/static" if scope["path"].startswith("/static/") else "unmatched"
+            HTTP_SECONDS.labels(scope["method"], path, str(status[0])).observe(time.perf_counter() - started)
@@ -0,0 +1,300 @@
+"""
+Opt-in request profiling and slow statement capture.
+
+A request is profiled when it sends an ``X-Profile: 1`` header, a
+``profile=1`` query parameter, or is picked by the sampling rate. For a
+profiled request ProfilingMiddleware
+
+- adds up named phases (``with profiling.phase("encode"): ...``) and the
+  time spent in Postgres statements, and returns them in a Server-Timing
+  header,
+- samples the event loop thread's stack and writes it in the folded format
+  read by flamegraph.pl, inferno and speedscope (``<id>.folded``),
+- writes a JSON summary of the phases and statements (``<id>.json``).
+
+The stack sampler sees the whole event loop, so work of other requests
+running at the same time shows up in the flamegraph too.
+
+SlowQueryLog works independently of profiling: every statement slower than
+its threshold is re-run under EXPLAIN (ANALYZE, BUFFERS) on a dedicated
+connection and appended to ``slow_queries.jsonl``.
+"""
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Optional
+from urllib.parse import parse_qs
+
+import asyncpg
+
+from app.core.metrics import statement_name
+
+logger = logging.getLogger(__name__)
+
+_current: contextvars.ContextVar[Optional["Profile"]] = contextvars.ContextVar("profile", default=None)
+
+TRUTHY = {"1", "true", "yes", "on"}
+
+
+class Profile:
+    """Timing collected for one profiled request"""
+
+    def __init__(self, method: str, path: str):
+        self.id = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+        self.method = method
+        self.path = path
+        self.route = None
+        self.status = None
+        self.started = time.perf_counter()
+        self.first_byte = None
+        self.total = None
+        self.phases = defaultdict(float)
+        self.statements = []
+
+    def add_statement(self, record):
+        self.phases["db"] += record.elapsed
+        self.statements.append({
+            "statement": statement_name(record.query),
+            "seconds": round(record.elapsed, 6),
+            "error": repr(record.exception) if record.exception else None,
+        })
+
+    def server_timing(self) -> str:
+        elapsed = time.perf_counter() - self.started
+        parts = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.phases.items()]
+        parts.append(f"total;dur={elapsed * 1000:.2f}")
+        return ", ".join(parts)
+
+    def summary(self) -> dict:
+        accounted = sum(self.phases.values())
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "route": self.route,
+            "status": self.status,
+            "total_seconds": round(self.total, 6),
+            "first_byte_seconds": round(self.first_byte, 6) if self.first_byte is not None else None,
+            "phases": {name: round(seconds, 6) for name, seconds in self.phases.items()},
+            "unaccounted_seconds": round(max(self.total - accounted, 0.0), 6),
+            "statements": self.statements,
+        }
+
+
+@contextmanager
+def phase(name: str):
+    """Add the time spent in the block to the current profile; free when not profiling"""
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.phases[name] += time.perf_counter() - started
+
+
+def observe_query(record):
+    """asyncpg query logger callback: charge the statement to the current profile"""
+    profile = _current.get()
+    if profile is not None:
+        profile.add_statement(record)
+
+
+class StackSampler:
+    """Samples one thread's Python stack on a background thread and counts folded stacks"""
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class ProfilingMiddleware:
+    """ASGI middleware profiling requests that ask for it, or a random share of all requests"""
+
+    def __init__(self, app, directory: str, sample_rate: float = 0.0, interval: float = 0.005):
+        self.app = app
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.interval = interval
+
+    def wanted(self, scope) -> bool:
+        for key, value in scope["headers"]:
+            if key == b"x-profile":
+                return value.decode("latin-1").lower() in TRUTHY
+        if b"profile" in scope["query_string"]:
+            values = parse_qs(scope["query_string"].decode("latin-1")).get("profile", [])
+            if values:
+                return values[-1].lower() in TRUTHY
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.wanted(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile = Profile(scope["method"], scope["path"])
+        token = _current.set(profile)
+        sampler = StackSampler(threading.get_ident(), self.interval)
+        sampler.start()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+                profile.first_byte = time.perf_counter() - profile.started
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", profile.server_timing().encode("latin-1")))
+                headers.append((b"x-profile-id", profile.id.encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profile.total = time.perf_counter() - profile.started
+            sampler.stop()
+            _current.reset(token)
+            profile.route = getattr(scope.get("route"), "path", None)
+            try:
+                await asyncio.to_thread(self._write, profile, sampler)
+            except OSError as e:
+                logger.error(f"Could not write profile {profile.id}: {e}")
+
+    def _write(self, profile: Profile, sampler: StackSampler):
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, profile.id)
+        with open(base + ".folded", "w") as f:
+            f.write(sampler.folded())
+        with open(base + ".json", "w") as f:
+            json.dump({**profile.summary(), "samples": sum(sampler.stacks.values()),
+                       "sample_interval": self.interval}, f, indent=2)
+
+
+class SlowQueryLog:
+    """
+    Captures statements slower than `threshold` seconds with their EXPLAIN
+    (ANALYZE, BUFFERS) plan.
+
+    The plan is taken on a dedicated connection without query loggers,
+    inside a transaction that is always rolled back. Only read statements
+    are explained, since ANALYZE executes the statement; others are logged
+    with their timing alone. Each statement text is explained at most once
+    per `cooldown` seconds so a slow endpoint under load does not double
+    the load on Postgres.
+    """
+
+    def __init__(self, dsn: str, threshold: float, directory: str, cooldown: float = 300,
+                 max_pending: int = 16, explain_timeout: float = 30):
+        self.dsn = dsn
+        self.threshold = threshold
+        self.directory = directory
+        self.cooldown = cooldown
+        self.explain_timeout = explain_timeout
+        self.queue: asyncio.Queue = asyncio.Queue(max_pending)
+        self.explained_at = {}
+        self.captured = 0
+        self.skipped = 0
+
+    def observe(self, record):
+        """asyncpg query logger callback"""
+        if self.threshold <= 0 or record.elapsed < self.threshold:
+            return
+        profile = _current.get()
+        now = time.monotonic()
+        if now - self.explained_at.get(record.query, float("-inf")) < self.cooldown:
+            self.skipped += 1
+            return
+        self.explained_at[record.query] = now
+        try:
+            self.queue.put_nowait((record, profile.id if profile is not None else None))
+        except asyncio.QueueFull:
+            self.skipped += 1
+
+    async def run(self):
+        conn = None
+        while True:
+            record, profile_id = await self.queue.get()
+            entry = {
+                "at": datetime.now(timezone.utc).isoformat(),
+                "statement": statement_name(record.query),
+                "seconds": round(record.elapsed, 6),
+                "profile_id": profile_id,
+                "query": record.query,
+                "args": [repr(arg) for arg in record.args],
+                "plan": None,
+            }
+            if self._is_read(record.query):
+                try:
+                    if conn is None or conn.is_closed():
+                        conn = await asyncpg.connect(self.dsn)
+                    entry["plan"] = await self._explain(conn, record)
+                except Exception as e:
+                    entry["explain_error"] = repr(e)
+            await asyncio.to_thread(self._append, entry)
+            self.captured += 1
+
+    async def _explain(self, conn, record):
+        transaction = conn.transaction()
+        await transaction.start()
+        try:
+            await conn.execute(f"SET LOCAL statement_timeout = {int(self.explain_timeout * 1000)}")
+            plan = await conn.fetchval(
+                f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {record.query}", *record.args
+            )
+        finally:
+            await transaction.rollback()
+        return json.loads(plan) if isinstance(plan, str) else plan
+
+    @staticmethod
+    def _is_read(sql: str) -> bool:
+        words = sql.split(None, 1)
+        return bool(words) and words[0].upper() in ("SELECT", "WITH", "VALUES", "TABLE")
+
+    def _append(self, entry):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, "slow_queries.jsonl"), "a") as f:
+            f.write(json.dumps(entry, default=str) + "\n")
+
+    def stats(self):
+        return {
+            "threshold": self.threshold,
+            "captured": self.captured,
+            "skipped": self.skipped,
+            "pending": self.queue.qsize(),
+        }
@@ -5,6 +5,7 @@ import logging
 import atexit
 
 from app.core.config import settings
+from app.core.tracing import init_tracing, shutdown_tracing, tracer
 from app.services.digitransit_service import DigitransitService
 from app.services.data_services import DataService
 
@@ -15,17 +16,21 @@ scheduler = BackgroundScheduler()
 
 def collect_vehicle_data():
     """Collect and store vehicle data from Digitransit API"""
-    try:
-        logger.info("Collecting vehicle data")
-        digitransit_service = DigitransitService()
-        data_service = DataService()
-        
-        vehicles = digitransit_service.get_vehicles()
-        if vehicles:
-            data_service.store_vehicle_data(vehicles)
-            logger.info(f"Stored {len(vehicles)} vehicle records")
-    except Exception as e:
-        logger.error(f"Error collecting vehicle data: {str(e)}")
+    with tracer.span("collect_vehicle_data") as cycle:
+        try:
+            logger.info("Collecting vehicle data")
+            digitransit_service = DigitransitService()
+            data_service = DataService()
+
+            with tracer.span("get_vehicles") as span:
+                vehicles = digitransit_service.get_vehicles()
+                span.set(vehicles=len(vehicles))
+            if vehicles:
+                data_service.store_vehicle_data(vehicles)
+                logger.info(f"Stored {len(vehicles)} vehicle records")
+        except Exception as e:
+            cycle.fail(e)
+            logger.error(f"Error collecting vehicle data: {str(e)}")
 
 def cleanup_old_data():
     """Clean up old data from the database"""
@@ -40,6 +45,8 @@ def cleanup_old_data():
 
 def start_scheduler():
     """Start the scheduler with the defined jobs"""
+    init_tracing(settings.TRACE_FILE, settings.TRACE_FORMAT, settings.TRACE_SAMPLE_RATE)
+
     # Add jobs
     scheduler.add_job(
         func=collect_vehicle_data,
@@ -62,5 +69,6 @@ def start_scheduler():
         
         # Shut down the scheduler when exiting the app
         atexit.register(lambda: scheduler.shutdown())
+        atexit.register(shutdown_tracing)
     else:
         logger.info("Scheduler already running")
\ No newline at end of file
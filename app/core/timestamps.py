@@ -0,0 +1,15 @@
+from datetime import datetime, timezone
+from typing import Union
+
+# Timestamps are stored as naive UTC, so epoch seconds are counted from a naive epoch
+EPOCH = datetime(1970, 1, 1)
+
+
+def epoch_seconds(value: Union[int, float, str]) -> float:
+    """Seconds since the epoch of a feed timestamp: already in seconds, or ISO 8601 (UTC unless it has an offset)"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    ts = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return (ts - EPOCH).total_seconds()
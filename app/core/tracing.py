@@ -0,0 +1,245 @@
+"""
+Lightweight span tracing for the ingest loops.
+
+Spans have a trace id, a parent, wall-clock start/end and attributes, and
+nest through a context variable, so a span opened inside another one (in
+the same task or thread) becomes its child. Work handed between tasks
+through a queue carries its span along and passes it as `parent`.
+
+Finished spans go to a bounded in-memory buffer that a background thread
+flushes to a local file, either as flat JSON lines (``jsonl``) or in the
+OTLP/JSON file format written by the OpenTelemetry collector's file
+exporter (``otlp``). Recording a span costs a few microseconds and never
+touches the disk on the caller's path; when the buffer is full new spans
+are counted and dropped. Until init_tracing() is called every span is a
+no-op.
+
+    with tracer.span("vehicles.cycle", feed="vehicles") as cycle:
+        with tracer.span("fetch") as span:
+            ...
+            span.set(bytes=len(body), rows=len(data))
+"""
+import contextvars
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ("jsonl", "otlp")
+
+_current: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("span", default=None)
+
+
+class Span:
+    __slots__ = ("tracer", "name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns",
+                 "attributes", "error", "sampled")
+
+    def __init__(self, tracer, name: str, trace_id: str, parent_id: Optional[str],
+                 attributes: Dict[str, Any], sampled: bool):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes
+        self.error = None
+        self.sampled = sampled
+
+    def set(self, **attributes):
+        if self.sampled:
+            self.attributes.update(attributes)
+
+    def fail(self, error: BaseException):
+        self.error = f"{type(error).__name__}: {error}"
+
+    def end(self):
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            if self.sampled:
+                self.tracer.export(self)
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end - self.start_ns) / 1e6
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class Tracer:
+    """Creates spans and buffers finished ones for the exporter thread"""
+
+    def __init__(self):
+        self.exporter: Optional["FileExporter"] = None
+        self.sample_rate = 1.0
+        self.buffer = deque()
+        self.max_buffer = 10000
+        self.dropped = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    def start_span(self, name: str, parent: Optional[Span] = None, **attributes) -> Span:
+        """Start a span without making it current; end it with span.end()"""
+        if parent is None:
+            parent = _current.get()
+        if parent is not None:
+            return Span(self, name, parent.trace_id, parent.span_id, attributes, parent.sampled)
+        # The sampling decision is taken once per trace, at its root
+        sampled = self.enabled and (self.sample_rate >= 1 or random.random() < self.sample_rate)
+        return Span(self, name, f"{random.getrandbits(128):032x}", None, attributes, sampled)
+
+    @contextmanager
+    def span(self, name: str, parent: Optional[Span] = None, **attributes):
+        """Start a span, make it current for the block and end it on exit"""
+        span = self.start_span(name, parent, **attributes)
+        token = _current.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.fail(e)
+            raise
+        finally:
+            _current.reset(token)
+            span.end()
+
+    def export(self, span: Span):
+        if len(self.buffer) >= self.max_buffer:
+            self.dropped += 1
+            return
+        self.buffer.append(span)
+
+    def drain(self):
+        spans = []
+        while self.buffer:
+            spans.append(self.buffer.popleft())
+        return spans
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+class FileExporter:
+    """Background thread appending buffered spans to a local file, rolling it over at max_bytes"""
+
+    def __init__(self, tracer: Tracer, path: str, export_format: str = "jsonl",
+                 interval: float = 1.0, max_bytes: int = 64 * 1024 * 1024, service: str = "helsinki-transport"):
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown trace export format: {export_format}")
+        self.tracer = tracer
+        self.path = path
+        self.format = export_format
+        self.interval = interval
+        self.max_bytes = max_bytes
+        self.service = service
+        self.exported = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+
+    def start(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._thread.start()
+
+    def shutdown(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+        self.flush()
+
+    def flush(self):
+        spans = self.tracer.drain()
+        if not spans:
+            return
+        if self.format == "otlp":
+            lines = [json.dumps(self._otlp(spans), default=str)]
+        else:
+            lines = [json.dumps(span.to_dict(), default=str) for span in spans]
+        try:
+            if os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_bytes:
+                os.replace(self.path, self.path + ".1")
+            with open(self.path, "a") as f:
+                f.write("\n".join(lines) + "\n")
+            self.exported += len(spans)
+        except OSError as e:
+            logger.error(f"Could not write {len(spans)} spans to {self.path}: {e}")
+
+    def _otlp(self, spans):
+        """One OTLP/JSON ExportTraceServiceRequest holding a batch of spans"""
+        return {"resourceSpans": [{
+            "resource": {"attributes": [otlp_attribute("service.name", self.service)]},
+            "scopeSpans": [{
+                "scope": {"name": __name__},
+                "spans": [{
+                    "traceId": span.trace_id,
+                    "spanId": span.span_id,
+                    "parentSpanId": span.parent_id or "",
+                    "name": span.name,
+                    "kind": 1,
+                    "startTimeUnixNano": str(span.start_ns),
+                    "endTimeUnixNano": str(span.end_ns),
+                    "attributes": [otlp_attribute(k, v) for k, v in span.attributes.items()],
+                    "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+                } for span in spans],
+            }],
+        }]}
+
+
+def otlp_attribute(key: str, value: Any):
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+
+tracer = Tracer()
+
+
+def init_tracing(path: str, export_format: str = "jsonl", sample_rate: float = 1.0) -> Optional[FileExporter]:
+    """Start exporting spans to `path`; an empty path leaves tracing off"""
+    if not path:
+        return None
+    if tracer.exporter is not None:
+        return tracer.exporter
+    exporter = FileExporter(tracer, path, export_format)
+    exporter.start()
+    tracer.sample_rate = sample_rate
+    tracer.exporter = exporter
+    return exporter
+
+
+def shutdown_tracing():
+    exporter, tracer.exporter = tracer.exporter, None
+    if exporter is not None:
+        exporter.shutdown()
@@ -0,0 +1,90 @@
+"""
+Check that every hot endpoint query can be answered from an index.
+
+Run against a database migrated to head:
+
+    python -m app.db.explain_check [DATABASE_URL]
+
+Sequential scans are disabled for the session, so the planner picks an
+index whenever one applies, even on small tables. A plan that still
+contains a Seq Scan means the query has no usable index. Exits with
+status 1 if any query fails the check.
+"""
+import asyncio
+import json
+import sys
+from datetime import date, datetime, timedelta
+
+import asyncpg
+
+from app.core.config import settings
+from app.db import queries
+
+INDEX_NODES = {"Index Scan", "Index Only Scan", "Bitmap Index Scan"}
+
+# Left out on purpose: queries.ALL_VEHICLES (/api/vehicles returns the whole table),
+# queries.COUNTS_BY_TYPE_VIEW (one row per vehicle type, always read in full) and
+# queries.CATALOG_STATIONS (the whole stations table, read by the background catalog rebuild)
+CHECKS = [
+    ("/api/stats/by_type", queries.COUNTS_BY_TYPE, ()),
+    ("/api/stats/hourly", queries.HOURLY_COUNTS, (date.today(),)),
+    ("/api/stats/daily", queries.DAILY_COUNTS, (date.today() - timedelta(days=6), date.today())),
+    ("/api/stats/by_station", queries.TOP_STATIONS, (10,)),
+    ("/api/stats/by_station (view)", queries.TOP_STATIONS_VIEW, (10,)),
+    ("/api/stations/search", queries.SEARCH_STATIONS, ("%kamp%",)),
+    ("/api/station/{station_id}", queries.STATION_DETAIL, (1,)),
+    ("/api/trajectories (vehicle)", queries.TRAJECTORY_BY_VEHICLE,
+     ("1", datetime.utcnow() - timedelta(minutes=70), datetime.utcnow() - timedelta(hours=1), datetime.utcnow())),
+    ("/api/trajectories (bbox)", queries.TRAJECTORIES_IN_BBOX,
+     (datetime.utcnow() - timedelta(minutes=70), datetime.utcnow() - timedelta(hours=1), datetime.utcnow(),
+      24.9, 60.15, 25.0, 60.2)),
+    ("/api/replay", queries.TRAJECTORY_BUCKET, (datetime(2024, 1, 1, 6),)),
+    ("/api/stats/routes (latest)", queries.ROUTE_STATS_LATEST, ()),
+    ("/api/stats/routes", queries.ROUTE_STATS_WINDOW, (datetime.utcnow() - timedelta(minutes=15),)),
+    ("/api/stats/routes/{route_id}", queries.ROUTE_STATS_SLOTS, ("HSL:1001", datetime.utcnow() - timedelta(hours=1))),
+    ("/api/stats/bunching", queries.BUNCHING_EVENTS, (100,)),
+    ("/api/stats/bunching?route_id=", queries.ROUTE_BUNCHING_EVENTS, ("HSL:1001", 100)),
+    ("/tiles (stations, hour)", queries.STATION_ACTIVITY,
+     (datetime.utcnow() - timedelta(hours=1), datetime.utcnow())),
+    ("/tiles (stations)", queries.STATION_ACTIVITY_TOTAL, ()),
+]
+
+
+def plan_nodes(plan):
+    """Yield every node type in an EXPLAIN (FORMAT JSON) plan tree"""
+    yield plan["Node Type"]
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+async def explain(conn, sql, args):
+    result = await conn.fetchval(f"EXPLAIN (FORMAT JSON) {sql}", *args)
+    return json.loads(result)[0]["Plan"]
+
+
+async def run_checks(dsn):
+    """Return (name, passed, node types) for every checked query"""
+    conn = await asyncpg.connect(dsn)
+    try:
+        await conn.execute("SET enable_seqscan = off")
+        results = []
+        for name, sql, args in CHECKS:
+            nodes = set(plan_nodes(await explain(conn, sql, args)))
+            passed = "Seq Scan" not in nodes and bool(nodes & INDEX_NODES)
+            results.append((name, passed, sorted(nodes)))
+        return results
+    finally:
+        await conn.close()
+
+
+def main():
+    dsn = sys.argv[1] if len(sys.argv) > 1 else settings.DATABASE_URL
+    results = asyncio.run(run_checks(dsn))
+    for name, passed, nodes in results:
+        print(f"{'OK  ' if passed else 'FAIL'} {name}: {', '.join(nodes)}")
+    if not all(passed for _, passed, _ in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Response bodies rendered to JSON by Postgres.
+
+The *_JSON queries in app.db.queries wrap the usual statements in json_agg,
+so a response arrives as one text value per query (or per page) instead of
+one Record per row that is then turned into a dict, has its timestamps
+isoformatted and is re-encoded by JSONResponse. The Python side only
+encodes that text to bytes and hands it to the response.
+"""
+from typing import AsyncIterator
+
+from fastapi.responses import Response, StreamingResponse
+
+from app.db import queries
+
+
+async def fetch_json(db, sql: str, *args) -> bytes:
+    """Body of a query that returns a single JSON array"""
+    text = await db.fetchval(sql, *args)
+    return text.encode()
+
+
+def join_arrays(*arrays: bytes) -> bytes:
+    """Concatenate JSON arrays without parsing them"""
+    items = [array[1:-1] for array in arrays if len(array) > 2]
+    return b"[" + b",".join(items) + b"]"
+
+
+async def vehicle_pages(db, page_rows: int) -> AsyncIterator[bytes]:
+    """
+    Every vehicle row as one JSON array, one keyset page at a time. The pages
+    are read inside a single repeatable-read transaction so the response is
+    a consistent snapshot, and memory stays at one page however large the
+    table is. The connection is held until the client has read the body.
+    """
+    async with db.acquire() as conn:
+        async with conn.transaction(isolation="repeatable_read", readonly=True):
+            yield b"["
+            last_id, first = 0, True
+            while True:
+                page, last_id = await conn.fetchrow(queries.ALL_VEHICLES_JSON_PAGE, last_id, page_rows)
+                if last_id is None:
+                    break
+                yield (b"" if first else b",") + page[1:-1].encode()
+                first = False
+            yield b"]"
+
+
+def json_body(content: bytes, headers=None) -> Response:
+    return Response(content, media_type="application/json", headers=headers)
+
+
+def stream_vehicles(db, page_rows: int) -> StreamingResponse:
+    return StreamingResponse(vehicle_pages(db, page_rows), media_type="application/json")
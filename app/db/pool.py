@@ -0,0 +1,107 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+import asyncpg
+
+from app.core import metrics, profiling
+from app.core.metrics import observe_query
+
+
+class PoolTimeout(Exception):
+    """No connection became free within the pool's acquire timeout"""
+
+
+class Pool:
+    """
+    asyncpg pool with a bounded wait for connections and saturation
+    counters. Exposes the subset of the asyncpg.Pool API the app uses, so it
+    drops in wherever a pool was passed before.
+    """
+
+    def __init__(self, name: str, pool: asyncpg.Pool, acquire_timeout: float = None):
+        self.name = name
+        self.acquire_timeout = acquire_timeout
+        self.waiting = 0
+        self.timeouts = 0
+        self._pool = pool
+
+    @asynccontextmanager
+    async def acquire(self):
+        self.waiting += 1
+        started = time.perf_counter()
+        try:
+            conn = await self._pool.acquire(timeout=self.acquire_timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            metrics.POOL_ACQUIRE_TIMEOUTS.labels(self.name).inc()
+            raise PoolTimeout(f"No {self.name} connection free within {self.acquire_timeout}s") from None
+        finally:
+            self.waiting -= 1
+            metrics.POOL_ACQUIRE_SECONDS.labels(self.name).observe(time.perf_counter() - started)
+        try:
+            yield conn
+        finally:
+            await self._pool.release(conn)
+
+    async def execute(self, query: str, *args, timeout: float = None) -> str:
+        async with self.acquire() as conn:
+            return await conn.execute(query, *args, timeout=timeout)
+
+    async def executemany(self, command: str, args, timeout: float = None):
+        async with self.acquire() as conn:
+            return await conn.executemany(command, args, timeout=timeout)
+
+    async def fetch(self, query: str, *args, timeout: float = None):
+        async with self.acquire() as conn:
+            return await conn.fetch(query, *args, timeout=timeout)
+
+    async def fetchrow(self, query: str, *args, timeout: float = None):
+        async with self.acquire() as conn:
+            return await conn.fetchrow(query, *args, timeout=timeout)
+
+    async def fetchval(self, query: str, *args, column: int = 0, timeout: float = None):
+        async with self.acquire() as conn:
+            return await conn.fetchval(query, *args, column=column, timeout=timeout)
+
+    def get_size(self) -> int:
+        return self._pool.get_size()
+
+    def get_max_size(self) -> int:
+        return self._pool.get_max_size()
+
+    def get_idle_size(self) -> int:
+        return self._pool.get_idle_size()
+
+    async def close(self):
+        await self._pool.close()
+
+    def stats(self):
+        return {
+            "size": self.get_size(),
+            "max_size": self.get_max_size(),
+            "in_use": self.get_size() - self.get_idle_size(),
+            "waiting": self.waiting,
+            "acquire_timeouts": self.timeouts,
+        }
+
+
+async def create_pool(dsn: str, slow_queries: "profiling.SlowQueryLog" = None, name: str = "db",
+                      acquire_timeout: float = None, statement_timeout_ms: int = 0, **kwargs) -> Pool:
+    """
+    asyncpg pool whose connections report statement latency to the metrics
+    registry and the current request profile, and hand slow statements to
+    `slow_queries` when given. Statements running longer than
+    `statement_timeout_ms` are cancelled by the server (0 disables that).
+    """
+    async def init_connection(conn):
+        conn.add_query_logger(observe_query)
+        conn.add_query_logger(profiling.observe_query)
+        if slow_queries is not None:
+            conn.add_query_logger(slow_queries.observe)
+
+    server_settings = {"application_name": f"helsinki-transport-{name}"}
+    if statement_timeout_ms:
+        server_settings["statement_timeout"] = str(statement_timeout_ms)
+    pool = await asyncpg.create_pool(dsn, init=init_connection, server_settings=server_settings, **kwargs)
+    return Pool(name, pool, acquire_timeout)
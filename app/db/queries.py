@@ -0,0 +1,161 @@
+# SQL behind the main.py endpoints. Kept in one place so that
+# app.db.explain_check can verify every hot query is served by an index.
+
+ALL_VEHICLES = "SELECT * FROM vehicles"
+
+COUNTS_BY_TYPE = "SELECT type, COUNT(*) as count FROM vehicles GROUP BY type"
+
+COUNTS_BY_TYPE_VIEW = "SELECT type, count FROM vehicle_counts_by_type"
+
+# Range predicates instead of DATE(timestamp) = ... so the timestamp indexes apply
+HOURLY_COUNTS = """
+    SELECT date_trunc('hour', timestamp) as timestamp, COUNT(*) as count
+    FROM vehicles
+    WHERE timestamp >= $1::date AND timestamp < $1::date + 1
+    GROUP BY 1
+    ORDER BY 1
+"""
+
+DAILY_COUNTS = """
+    SELECT DATE(timestamp) as timestamp, COUNT(*) as count
+    FROM vehicles
+    WHERE timestamp >= $1::date AND timestamp < $2::date + 1
+    GROUP BY 1
+    ORDER BY 1
+"""
+
+TOP_STATIONS = """
+    SELECT s.station_name, COUNT(*) as count
+    FROM vehicles v
+    JOIN stations s ON v.station_id = s.id
+    GROUP BY s.station_name
+    ORDER BY count DESC
+    LIMIT $1
+"""
+
+TOP_STATIONS_VIEW = """
+    SELECT station_name, count
+    FROM vehicle_counts_by_station
+    ORDER BY count DESC
+    LIMIT $1
+"""
+
+SEARCH_STATIONS = """
+    SELECT id, station_name AS name, latitude, longitude, zone_id
+    FROM stations
+    WHERE station_name ILIKE $1
+"""
+
+STATION_DETAIL = """
+    SELECT id, station_name AS name, zone_id, platform_code, latitude, longitude
+    FROM stations
+    WHERE id = $1
+"""
+
+# Every station, read in full when the station catalog is rebuilt
+CATALOG_STATIONS = """
+    SELECT id, station_name, platform_code, zone_id, latitude, longitude
+    FROM stations
+    ORDER BY id
+"""
+
+# Trajectory chunks with samples in [start, end]. The lower bucket bound (start minus one bucket)
+# lets the primary key / bucket index bound the scan; first_at and last_at drop the chunks outside it.
+TRAJECTORY_BY_VEHICLE = """
+    SELECT vehicle_id, bucket, route_id, mode, data
+    FROM vehicle_trajectories
+    WHERE vehicle_id = $1 AND bucket > $2 AND bucket <= $4 AND last_at >= $3 AND first_at <= $4
+    ORDER BY bucket
+"""
+
+TRAJECTORIES_IN_BBOX = """
+    SELECT vehicle_id, bucket, route_id, mode, data
+    FROM vehicle_trajectories
+    WHERE bucket > $1 AND bucket <= $3 AND last_at >= $2 AND first_at <= $3
+      AND max_lon >= $4 AND min_lon <= $6 AND max_lat >= $5 AND min_lat <= $7
+    ORDER BY vehicle_id, bucket
+"""
+
+# The whole fleet's chunks of one bucket, read in turn by the replays
+TRAJECTORY_BUCKET = """
+    SELECT vehicle_id, route_id, mode, data
+    FROM vehicle_trajectories
+    WHERE bucket = $1
+"""
+
+
+# Route analytics as persisted by the ingest leader, for the workers that do not ingest
+ROUTE_STATS_LATEST = "SELECT MAX(bucket) FROM route_stats"
+
+ROUTE_STATS_WINDOW = """
+    SELECT route_id, SUM(speed_sum) AS speed_sum, SUM(speed_count) AS speed_count, SUM(headway_sum) AS headway_sum,
+           SUM(headway_sq) AS headway_sq, SUM(headway_count) AS headway_count, SUM(bunching) AS bunching
+    FROM route_stats
+    WHERE bucket > $1
+    GROUP BY route_id
+    ORDER BY route_id
+"""
+
+ROUTE_STATS_SLOTS = """
+    SELECT bucket, speed_sum, speed_count, headway_sum, headway_sq, headway_count, bunching
+    FROM route_stats
+    WHERE route_id = $1 AND bucket > $2
+    ORDER BY bucket
+"""
+
+BUNCHING_EVENTS = """
+    SELECT route_id, at, vehicle_a, vehicle_b, distance_m
+    FROM bunching_events
+    ORDER BY at DESC
+    LIMIT $1
+"""
+
+ROUTE_BUNCHING_EVENTS = """
+    SELECT route_id, at, vehicle_a, vehicle_b, distance_m
+    FROM bunching_events
+    WHERE route_id = $1
+    ORDER BY at DESC
+    LIMIT $2
+"""
+
+# Per-station event counts behind the station activity tiles when the recent window cannot answer
+STATION_ACTIVITY = """
+    SELECT station_id, COUNT(*) AS count
+    FROM vehicles
+    WHERE timestamp >= $1 AND timestamp < $2 AND station_id IS NOT NULL
+    GROUP BY station_id
+"""
+
+STATION_ACTIVITY_TOTAL = """
+    SELECT station_id, COUNT(*) AS count
+    FROM vehicles
+    WHERE station_id IS NOT NULL
+    GROUP BY station_id
+"""
+
+# The same queries rendered to a JSON array by Postgres, so responses skip
+# per-row Record/dict/isoformat work in Python. Keys match the Python path.
+def _json_array(sql: str, element: str = "r") -> str:
+    return f"SELECT COALESCE(json_agg({element}), '[]')::text FROM ({sql}) r"
+
+
+# Keyset pages, so /api/vehicles streams in bounded chunks: ($1 = last id, $2 = page rows)
+ALL_VEHICLES_JSON_PAGE = """
+    SELECT COALESCE(json_agg(v ORDER BY v.id), '[]')::text, MAX(v.id)
+    FROM (SELECT * FROM vehicles WHERE id > $1 ORDER BY id LIMIT $2) v
+"""
+
+HOURLY_COUNTS_JSON = _json_array(HOURLY_COUNTS)
+
+DAILY_COUNTS_JSON = _json_array(DAILY_COUNTS)
+
+_TOP_STATIONS_ELEMENT = "json_build_object('details', json_build_object('station_name', r.station_name), 'count', r.count)"
+
+TOP_STATIONS_JSON = _json_array(TOP_STATIONS, _TOP_STATIONS_ELEMENT)
+
+TOP_STATIONS_VIEW_JSON = _json_array(TOP_STATIONS_VIEW, _TOP_STATIONS_ELEMENT)
+
+SEARCH_STATIONS_JSON = _json_array(SEARCH_STATIONS)
+
+# Statement name by SQL text, used to label query latency metrics
+NAMES = {sql: name.lower() for name, sql in list(globals().items()) if name.isupper() and isinstance(sql, str)}
@@ -0,0 +1,102 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Dashboard aggregates kept as materialized views. Each needs a unique index
+# so it can be refreshed CONCURRENTLY without blocking readers.
+VIEWS = {
+    "vehicle_counts_by_type": (
+        """
+        CREATE MATERIALIZED VIEW IF NOT EXISTS vehicle_counts_by_type AS
+        SELECT type, COUNT(*) AS count
+        FROM vehicles
+        GROUP BY type
+        WITH NO DATA
+        """,
+        [
+            "CREATE UNIQUE INDEX IF NOT EXISTS vehicle_counts_by_type_type ON vehicle_counts_by_type (type)",
+        ],
+    ),
+    "vehicle_counts_by_station": (
+        """
+        CREATE MATERIALIZED VIEW IF NOT EXISTS vehicle_counts_by_station AS
+        SELECT s.station_name, COUNT(*) AS count
+        FROM vehicles v
+        JOIN stations s ON v.station_id = s.id
+        GROUP BY s.station_name
+        WITH NO DATA
+        """,
+        [
+            "CREATE UNIQUE INDEX IF NOT EXISTS vehicle_counts_by_station_name ON vehicle_counts_by_station (station_name)",
+            "CREATE INDEX IF NOT EXISTS vehicle_counts_by_station_count ON vehicle_counts_by_station (count DESC)",
+        ],
+    ),
+}
+
+REFRESHES_TABLE = """
+    CREATE TABLE IF NOT EXISTS materialized_view_refreshes (
+        view_name VARCHAR PRIMARY KEY,
+        refreshed_at TIMESTAMP NOT NULL
+    )
+"""
+
+
+async def ensure_views(db):
+    """Create the materialized views and populate the ones that have never been refreshed"""
+    await db.execute(REFRESHES_TABLE)
+    for name, (create, indexes) in VIEWS.items():
+        await db.execute(create)
+        for index in indexes:
+            await db.execute(index)
+        populated = await db.fetchval("SELECT ispopulated FROM pg_matviews WHERE matviewname = $1", name)
+        if not populated:
+            # CONCURRENTLY only works on a view that already holds data
+            await refresh_view(db, name, concurrently=False)
+        elif await refreshed_at(db, name) is None:
+            # Populated without a refresh being recorded, as an earlier run of the views migration left it
+            await refresh_view(db, name)
+
+
+async def refresh_view(db, name: str, concurrently: bool = True) -> datetime:
+    """Refresh one view and record when it happened"""
+    if name not in VIEWS:
+        raise ValueError(f"Unknown materialized view: {name}")
+    mode = "CONCURRENTLY " if concurrently else ""
+    await db.execute(f"REFRESH MATERIALIZED VIEW {mode}{name}")
+    return await db.fetchval("""
+        INSERT INTO materialized_view_refreshes (view_name, refreshed_at)
+        VALUES ($1, now() AT TIME ZONE 'UTC')
+        ON CONFLICT (view_name) DO UPDATE SET refreshed_at = EXCLUDED.refreshed_at
+        RETURNING refreshed_at
+    """, name)
+
+
+async def refreshed_at(db, name: str) -> Optional[datetime]:
+    """When a view was last refreshed, in UTC"""
+    return await db.fetchval(
+        "SELECT refreshed_at FROM materialized_view_refreshes WHERE view_name = $1", name
+    )
+
+
+async def views_populated(db) -> bool:
+    """Whether every view exists and holds data, for workers that do not create them"""
+    count = await db.fetchval(
+        "SELECT COUNT(*) FROM pg_matviews WHERE matviewname = ANY($1::text[]) AND ispopulated", list(VIEWS)
+    )
+    return count == len(VIEWS)
+
+
+async def refresh_views_loop(db, interval: float, on_refresh: Optional[Callable[[], None]] = None):
+    """Refresh every view on a fixed cadence, calling `on_refresh` after each round"""
+    while True:
+        await asyncio.sleep(interval)
+        for name in VIEWS:
+            try:
+                await refresh_view(db, name)
+            except Exception as e:
+                logger.error(f"Error refreshing materialized view {name}: {str(e)}")
+        if on_refresh is not None:
+            on_refresh()
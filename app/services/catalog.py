@@ -0,0 +1,395 @@
+"""
+Station and route catalog kept as a memory-mapped binary snapshot.
+
+Station search, station detail and the station route lookup are answered
+from a StationCatalog: the stations table, the Digitransit routes and their
+patterns (stops mapped onto stations by name and platform) and a
+case-insensitive name index, all as flat NumPy arrays. Strings are stored
+as one UTF-8 blob plus an offsets array.
+
+The catalog is saved to CATALOG_PATH after every rebuild and on shutdown:
+
+    magic | header length | JSON header (version, build time, array table) | arrays
+
+and at boot the file is mapped and its arrays are used in place, so the
+endpoints work from the first request without a query or a Digitransit
+call. CatalogStore rebuilds it in the background when the stations change
+(and fetches the routes again every CATALOG_ROUTES_REFRESH_INTERVAL);
+until a first catalog exists the endpoints fall back to SQL.
+"""
+import asyncio
+import json
+import logging
+import mmap
+import os
+import struct
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.api.graphql_client import GraphQLClient
+from app.db import queries
+from app.models.transport import VehicleMode
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"HTCATLG1"
+PREAMBLE = struct.Struct("<8sI")
+
+MODES = [mode.value for mode in VehicleMode]
+
+ROUTES_QUERY = """
+{
+  routes {
+    gtfsId
+    shortName
+    longName
+    mode
+    patterns {
+      id
+      name
+      stops {
+        gtfsId
+      }
+    }
+  }
+}
+"""
+
+STOPS_QUERY = """
+{
+  stops {
+    gtfsId
+    name
+    platformCode
+  }
+}
+"""
+
+
+def _align(n: int) -> int:
+    return (n + 7) & ~7
+
+
+def pack_strings(values: Sequence[Optional[str]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """offsets, UTF-8 blob and null flags of a string column"""
+    encoded = [(value or "").encode() for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    blob = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    nulls = np.array([value is None for value in values], dtype=np.uint8)
+    return offsets, blob, nulls
+
+
+class Strings:
+    """Read side of a pack_strings column"""
+
+    def __init__(self, offsets: np.ndarray, blob: np.ndarray, nulls: np.ndarray):
+        self.offsets = offsets
+        self.blob = blob
+        self.nulls = nulls
+
+    def __len__(self):
+        return len(self.nulls)
+
+    def __getitem__(self, i: int) -> Optional[str]:
+        if self.nulls[i]:
+            return None
+        return self.blob[self.offsets[i]:self.offsets[i + 1]].tobytes().decode()
+
+
+class StationCatalog:
+    """Stations, routes, patterns and the name index as flat arrays"""
+
+    STRINGS = ("name", "platform", "zone", "route_id", "route_short", "route_long", "pattern_id", "pattern_name")
+
+    def __init__(self, arrays: Dict[str, np.ndarray], version: str, built_at: str, source: Any = None):
+        self.arrays = arrays
+        self.version = version
+        self.built_at = built_at
+        # Keeps the mapping alive while the arrays point into it
+        self._source = source
+        for name in self.STRINGS:
+            setattr(self, name + "s", Strings(arrays[name + "_offsets"], arrays[name], arrays[name + "_null"]))
+        self.station_id = arrays["station_id"]
+        self.latitude = arrays["latitude"]
+        self.longitude = arrays["longitude"]
+        self._by_name: Optional[Dict[str, List[int]]] = None
+        self._search: Optional[bytes] = None
+
+    def __len__(self):
+        return len(self.station_id)
+
+    # Building
+
+    @classmethod
+    def build(cls, stations: Sequence[tuple], routes: Sequence[Dict[str, Any]],
+              stops: Sequence[Dict[str, Any]], version: str) -> "StationCatalog":
+        """
+        `stations` are (id, station_name, platform_code, zone_id, latitude,
+        longitude) rows ordered by id; `routes` and `stops` are Digitransit
+        GraphQL objects (ROUTES_QUERY, STOPS_QUERY) and may be empty.
+        """
+        arrays: Dict[str, np.ndarray] = {}
+        ids, names, platforms, zones, lats, lons = (list(col) for col in zip(*stations)) if stations else ([],) * 6
+        arrays["station_id"] = np.array(ids, dtype=np.int64)
+        arrays["latitude"] = np.array(lats, dtype=np.float64)
+        arrays["longitude"] = np.array(lons, dtype=np.float64)
+        for name, values in (("name", names), ("platform", platforms), ("zone", zones)):
+            arrays[name + "_offsets"], arrays[name], arrays[name + "_null"] = pack_strings(values)
+        # Lower-cased names joined by NUL, so a substring match can never span two stations
+        arrays["search_offsets"], arrays["search"], _ = pack_strings([(n or "").lower() + "\0" for n in names])
+
+        # Stops are matched to stations the way the stations are keyed: name and platform
+        index = {(name, platform): i for i, (name, platform) in enumerate(zip(names, platforms))}
+        stop_station = {}
+        for stop in stops:
+            i = index.get((stop.get("name"), stop.get("platformCode")))
+            if i is not None:
+                stop_station[stop.get("gtfsId")] = i
+
+        route_rows, pattern_rows = [], []
+        for route in routes:
+            route_index = len(route_rows)
+            route_rows.append((route.get("gtfsId"), route.get("shortName"), route.get("longName"),
+                               MODES.index(route["mode"]) if route.get("mode") in MODES else 0))
+            for pattern in route.get("patterns") or []:
+                stations_on = [stop_station[s["gtfsId"]] for s in pattern.get("stops") or [] if s.get("gtfsId") in stop_station]
+                pattern_rows.append((pattern.get("id"), pattern.get("name"), route_index, stations_on))
+
+        for name, values in (("route_id", [r[0] for r in route_rows]), ("route_short", [r[1] for r in route_rows]),
+                             ("route_long", [r[2] for r in route_rows]), ("pattern_id", [p[0] for p in pattern_rows]),
+                             ("pattern_name", [p[1] for p in pattern_rows])):
+            arrays[name + "_offsets"], arrays[name], arrays[name + "_null"] = pack_strings(values)
+        arrays["route_mode"] = np.array([r[3] for r in route_rows], dtype=np.uint8)
+        arrays["pattern_route"] = np.array([p[2] for p in pattern_rows], dtype=np.int32)
+        arrays["pattern_offsets"] = np.zeros(len(pattern_rows) + 1, dtype=np.int64)
+        np.cumsum([len(p[3]) for p in pattern_rows], out=arrays["pattern_offsets"][1:])
+        arrays["pattern_stops"] = np.array([s for p in pattern_rows for s in p[3]], dtype=np.int32)
+
+        # Routes calling at each station, as CSR arrays
+        pairs = sorted({(s, p[2]) for p in pattern_rows for s in p[3]})
+        arrays["station_route_offsets"] = np.searchsorted(
+            np.array([s for s, _ in pairs], dtype=np.int64), np.arange(len(ids) + 1)
+        ).astype(np.int64)
+        arrays["station_routes"] = np.array([r for _, r in pairs], dtype=np.int32)
+
+        built_at = datetime.now(timezone.utc).isoformat()
+        return cls(arrays, version, built_at)
+
+    # Persistence
+
+    def save(self, path: str):
+        """Write the catalog to `path` atomically"""
+        table, offset = {}, 0
+        for name, array in self.arrays.items():
+            table[name] = [array.dtype.str, offset, len(array)]
+            offset = _align(offset + array.nbytes)
+        header = json.dumps({"version": self.version, "built_at": self.built_at, "arrays": table}).encode()
+        start = _align(PREAMBLE.size + len(header))
+
+        tmp = f"{path}.{os.getpid()}.tmp"
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(tmp, "wb") as f:
+            f.write(PREAMBLE.pack(MAGIC, len(header)) + header)
+            for name, array in self.arrays.items():
+                f.seek(start + table[name][1])
+                f.write(np.ascontiguousarray(array).tobytes())
+            f.truncate(start + offset)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "StationCatalog":
+        """Map a saved catalog; the arrays are read-only views of the file"""
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, header_length = PREAMBLE.unpack_from(mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a station catalog")
+        header = json.loads(mm[PREAMBLE.size:PREAMBLE.size + header_length])
+        start = _align(PREAMBLE.size + header_length)
+        arrays = {
+            name: np.frombuffer(mm, dtype=np.dtype(dtype), count=count, offset=start + offset)
+            for name, (dtype, offset, count) in header["arrays"].items()
+        }
+        return cls(arrays, header["version"], header["built_at"], source=mm)
+
+    # Queries
+
+    def index_of(self, station_id: int) -> Optional[int]:
+        i = int(np.searchsorted(self.station_id, station_id))
+        return i if i < len(self.station_id) and self.station_id[i] == station_id else None
+
+    def search(self, query: str) -> List[dict]:
+        """Stations whose name contains `query`, ignoring case (SEARCH_STATIONS)"""
+        if self._search is None:
+            self._search = self.arrays["search"].tobytes()
+        needle, offsets = query.lower().encode(), self.arrays["search_offsets"]
+        matches, position = [], self._search.find(needle)
+        while position != -1:
+            i = int(np.searchsorted(offsets, position, side="right")) - 1
+            matches.append(i)
+            # Continue after this station's name: one match per station
+            position = self._search.find(needle, int(offsets[i + 1]))
+        return [{
+            "id": int(self.station_id[i]),
+            "name": self.names[i],
+            "latitude": float(self.latitude[i]),
+            "longitude": float(self.longitude[i]),
+            "zone_id": self.zones[i],
+        } for i in matches]
+
+    def routes_at(self, i: int) -> List[str]:
+        offsets = self.arrays["station_route_offsets"]
+        return [self.route_ids[int(r)] for r in self.arrays["station_routes"][offsets[i]:offsets[i + 1]]]
+
+    def detail(self, station_id: int) -> Optional[dict]:
+        """STATION_DETAIL as the endpoint returns it, with the routes calling at the station"""
+        i = self.index_of(station_id)
+        if i is None:
+            return None
+        return {
+            "id": station_id,
+            "name": self.names[i],
+            "zone_id": self.zones[i],
+            "platform_code": self.platforms[i],
+            "position": {"lat": float(self.latitude[i]), "lng": float(self.longitude[i])},
+            "routes": self.routes_at(i),
+        }
+
+    def named(self, name: str) -> List[int]:
+        """Indices of the stations called `name`, ignoring case"""
+        if self._by_name is None:
+            by_name: Dict[str, List[int]] = {}
+            for i in range(len(self)):
+                by_name.setdefault((self.names[i] or "").lower(), []).append(i)
+            self._by_name = by_name
+        return self._by_name.get(name.lower(), [])
+
+    def stats(self):
+        return {
+            "version": self.version,
+            "built_at": self.built_at,
+            "mapped": self._source is not None,
+            "stations": len(self),
+            "routes": len(self.route_ids),
+            "patterns": len(self.pattern_ids),
+        }
+
+
+async def fetch_routes(client: Optional[GraphQLClient] = None) -> Tuple[List[dict], List[dict]]:
+    """Routes with their patterns and the stops they call at, from Digitransit"""
+    client = client or GraphQLClient()
+    routes = (await client.execute_query(ROUTES_QUERY) or {}).get("routes") or []
+    stops = (await client.execute_query(STOPS_QUERY) or {}).get("stops") or []
+    return routes, stops
+
+
+class CatalogStore:
+    """The current catalog of this worker, loaded from disk and rebuilt in the background"""
+
+    def __init__(self, db, path: str, stations_version: Callable[[], str],
+                 interval: float = 30, routes_interval: float = 3600):
+        self.db = db
+        self.path = path
+        self.stations_version = stations_version
+        self.interval = interval
+        self.routes_interval = routes_interval
+        self.current: Optional[StationCatalog] = None
+        self.builds = 0
+        self.errors = 0
+        self.last_build_ms = 0.0
+        self._routes: Optional[Tuple[List[dict], List[dict]]] = None
+        # Monotonic time the routes are next fetched; failed fetches back off up to routes_interval
+        self._routes_due = 0.0
+        self._route_failures = 0
+        self._saved = True
+        # Callbacks run with every catalog that becomes current
+        self.listeners: List[Callable[[StationCatalog], None]] = []
+
+    def _changed(self):
+        for listener in self.listeners:
+            try:
+                listener(self.current)
+            except Exception as e:
+                logger.error(f"[catalog] Listener error: {e}")
+
+    def load(self) -> bool:
+        """Map the saved catalog if there is one; cheap enough to call before serving"""
+        if not self.path or not os.path.exists(self.path):
+            return False
+        try:
+            self.current = StationCatalog.load(self.path)
+        except Exception as e:
+            logger.error(f"[catalog] Could not load {self.path}: {e}")
+            return False
+        logger.info(f"[catalog] Loaded {len(self.current)} stations built at {self.current.built_at}")
+        self._changed()
+        return True
+
+    async def refresh_routes(self) -> bool:
+        """Fetch the routes again; whether they were replaced"""
+        try:
+            routes = await fetch_routes()
+        except Exception as e:
+            self._route_failures += 1
+            delay = min(self.routes_interval, self.interval * 2 ** self._route_failures)
+            self._routes_due = time.monotonic() + delay
+            logger.error(f"[catalog] Route fetch failed, keeping the previous routes, next try in {delay:.0f}s: {e}")
+            return False
+        self._routes = routes
+        self._route_failures = 0
+        self._routes_due = time.monotonic() + self.routes_interval
+        return True
+
+    async def rebuild(self):
+        started = time.perf_counter()
+        if self._routes is None or time.monotonic() >= self._routes_due:
+            await self.refresh_routes()
+        if self._routes is None:
+            self._routes = ([], [])
+        version = self.stations_version()
+        rows = await self.db.fetch(queries.CATALOG_STATIONS)
+        catalog = await asyncio.to_thread(StationCatalog.build, [tuple(row) for row in rows], *self._routes, version)
+        self.current = catalog
+        self._saved = False
+        self._changed()
+        self.builds += 1
+        self.last_build_ms = (time.perf_counter() - started) * 1000
+        await asyncio.to_thread(self.save)
+
+    def save(self):
+        """Persist the current catalog unless it already is"""
+        if self._saved or self.current is None or not self.path:
+            return
+        try:
+            self.current.save(self.path)
+            self._saved = True
+        except OSError as e:
+            logger.error(f"[catalog] Could not save {self.path}: {e}")
+
+    async def run(self):
+        """Rebuild whenever the stations changed or the routes are due, checking every interval"""
+        while True:
+            try:
+                stale = self.current is None or self.current.version != self.stations_version()
+                # A failed route fetch changes nothing, so it only rebuilds when the stations changed
+                if not stale and time.monotonic() >= self._routes_due:
+                    stale = await self.refresh_routes()
+                if stale:
+                    await self.rebuild()
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"[catalog] Rebuild failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def stats(self):
+        return {
+            "catalog": self.current.stats() if self.current is not None else None,
+            "builds": self.builds,
+            "errors": self.errors,
+            "last_build_ms": round(self.last_build_ms, 3),
+            "route_failures": self._route_failures,
+        }
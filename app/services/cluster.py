@@ -0,0 +1,215 @@
+"""
+Coordination between workers of one deployment (`uvicorn main:app --workers N`).
+
+Exactly one worker ingests. Every worker runs a LeaderElection that keeps
+trying `pg_try_advisory_lock` on its own connection; the one holding the
+lock is the leader and runs the ingest pipelines and view refreshes. The
+lock lives as long as that connection, so if the leader dies or loses the
+database another worker takes over within one retry interval.
+
+The leader publishes what followers need to keep their in-memory state
+current over LISTEN/NOTIFY: every written vehicle batch (for the recent
+window), station writes and view refreshes (cache invalidation), each with
+the data version the leader assigned so ETags agree across workers.
+Followers subscribe with a Subscriber. NOTIFY payloads are capped at 8000
+bytes, so vehicle batches are sent as compact [type, station_id, epoch]
+triples split over as many messages as needed.
+
+Notifications are not queued for a disconnected listener. When the
+subscriber reconnects, or the leader had to drop messages, followers are
+told to resync and reload their window from the database.
+"""
+import asyncio
+import json
+import logging
+import uuid
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+import asyncpg
+
+from app.core.timestamps import EPOCH
+
+logger = logging.getLogger(__name__)
+
+MAX_PAYLOAD = 7900  # bytes; Postgres rejects NOTIFY payloads of 8000 and up
+
+WORKER_ID = uuid.uuid4().hex[:12]
+
+
+def encode_vehicle_rows(rows: Sequence[tuple]) -> List[list]:
+    """(type, station_id, timestamp, status) rows as [type, station_id, epoch seconds]"""
+    return [[row[0], row[1], int((row[2] - EPOCH).total_seconds())] for row in rows]
+
+
+def decode_vehicle_rows(rows: Sequence[list]) -> List[tuple]:
+    return [(mode, station, EPOCH + timedelta(seconds=ts), None) for mode, station, ts in rows]
+
+
+def payloads(kind: str, data: Any, version: Optional[str] = None) -> List[str]:
+    """JSON messages carrying `data`, a list when it has to be split, each under MAX_PAYLOAD"""
+    message = json.dumps({"w": WORKER_ID, "k": kind, "v": version, "d": data}, separators=(",", ":"))
+    if len(message.encode()) <= MAX_PAYLOAD:
+        return [message]
+    if not isinstance(data, list) or len(data) < 2:
+        raise ValueError(f"{kind} message of {len(message)} bytes cannot be split")
+    middle = len(data) // 2
+    return payloads(kind, data[:middle], version) + payloads(kind, data[middle:], version)
+
+
+class LeaderElection:
+    """Holds a session-level advisory lock while this worker is the ingest leader"""
+
+    def __init__(self, dsn: str, key: int, retry_interval: float = 5,
+                 on_elected: Callable[[], Awaitable[None]] = None,
+                 on_demoted: Callable[[], Awaitable[None]] = None):
+        self.dsn = dsn
+        self.key = key
+        self.retry_interval = retry_interval
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        self.is_leader = False
+        self.elections = 0
+
+    async def run(self):
+        while True:
+            conn = None
+            try:
+                conn = await asyncpg.connect(self.dsn)
+                while not await conn.fetchval("SELECT pg_try_advisory_lock($1)", self.key):
+                    await asyncio.sleep(self.retry_interval)
+                await self._elected()
+                # The lock is ours for as long as this connection lives
+                while True:
+                    await asyncio.sleep(self.retry_interval)
+                    await conn.fetchval("SELECT 1", timeout=self.retry_interval)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"[leader] Election connection error: {e}")
+            finally:
+                await self._demoted()
+                if conn is not None:
+                    conn.terminate()
+            await asyncio.sleep(self.retry_interval)
+
+    async def _elected(self):
+        self.is_leader = True
+        self.elections += 1
+        logger.info(f"[leader] Worker {WORKER_ID} is the ingest leader")
+        if self.on_elected is not None:
+            await self.on_elected()
+
+    async def _demoted(self):
+        if not self.is_leader:
+            return
+        self.is_leader = False
+        logger.warning(f"[leader] Worker {WORKER_ID} lost the ingest lock")
+        if self.on_demoted is not None:
+            await self.on_demoted()
+
+    def stats(self):
+        return {"worker": WORKER_ID, "leader": self.is_leader, "elections": self.elections}
+
+
+class Publisher:
+    """Leader side: queues messages from sync callbacks and sends them with pg_notify"""
+
+    def __init__(self, db, channel: str, max_pending: int = 1000):
+        self.db = db
+        self.channel = channel
+        self.queue: asyncio.Queue = asyncio.Queue(max_pending)
+        self.sent = 0
+        self.dropped = 0
+        self._resync = False
+
+    def publish(self, kind: str, data: Any = None, version: Optional[str] = None):
+        """Queue a message; safe to call from ingest write listeners"""
+        try:
+            self.queue.put_nowait((kind, data, version))
+        except asyncio.QueueFull:
+            # Followers have missed something; tell them to reload once there is room
+            self.dropped += 1
+            self._resync = True
+
+    async def run(self):
+        while True:
+            kind, data, version = await self.queue.get()
+            try:
+                for payload in payloads(kind, data, version):
+                    await self.db.execute("SELECT pg_notify($1, $2)", self.channel, payload)
+                    self.sent += 1
+                if self._resync and self.queue.empty():
+                    self._resync = False
+                    await self.db.execute("SELECT pg_notify($1, $2)", self.channel, payloads("resync", None)[0])
+            except Exception as e:
+                logger.error(f"[publisher] NOTIFY error: {e}")
+                self._resync = True
+
+    def stats(self):
+        return {"sent": self.sent, "dropped": self.dropped, "pending": self.queue.qsize()}
+
+
+class Subscriber:
+    """Follower side: LISTENs on a dedicated connection and dispatches messages by kind"""
+
+    def __init__(self, dsn: str, channel: str, handlers: Dict[str, Callable[[Any, Optional[str]], None]],
+                 on_resync: Callable[[], Awaitable[None]] = None, health_interval: float = 5):
+        self.dsn = dsn
+        self.channel = channel
+        self.handlers = handlers
+        self.on_resync = on_resync
+        self.health_interval = health_interval
+        self.received = 0
+        self.reconnects = 0
+        self._pending_resync: Optional[asyncio.Task] = None
+
+    def _on_notification(self, conn, pid, channel, payload):
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            logger.error(f"[subscriber] Unreadable notification: {payload[:100]}")
+            return
+        if message.get("w") == WORKER_ID:
+            return
+        self.received += 1
+        if message["k"] == "resync":
+            self._resync()
+            return
+        handler = self.handlers.get(message["k"])
+        if handler is not None:
+            try:
+                handler(message["d"], message.get("v"))
+            except Exception as e:
+                logger.error(f"[subscriber] {message['k']} handler error: {e}")
+
+    def _resync(self):
+        if self.on_resync is not None and (self._pending_resync is None or self._pending_resync.done()):
+            self._pending_resync = asyncio.create_task(self.on_resync())
+
+    async def run(self):
+        first = True
+        while True:
+            conn = None
+            try:
+                conn = await asyncpg.connect(self.dsn)
+                await conn.add_listener(self.channel, self._on_notification)
+                if not first:
+                    # Anything sent while we were disconnected is gone
+                    self.reconnects += 1
+                    self._resync()
+                first = False
+                while True:
+                    await asyncio.sleep(self.health_interval)
+                    await conn.fetchval("SELECT 1", timeout=self.health_interval)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"[subscriber] LISTEN connection error: {e}")
+            finally:
+                if conn is not None:
+                    conn.terminate()
+            await asyncio.sleep(self.health_interval)
+
+    def stats(self):
+        return {"received": self.received, "reconnects": self.reconnects}
@@ -0,0 +1,814 @@
+"""
+Timetable journeys over a GTFS feed with the Connection Scan Algorithm.
+
+A Timetable is read from a directory of GTFS files (agency, stops, routes,
+trips, stop_times, calendar and/or calendar_dates, optionally transfers)
+and kept as flat arrays:
+
+- connections: one row per pair of consecutive calls of a trip (departure
+  stop and time, arrival stop and time, trip), sorted by departure time,
+- calls (CSR by trip): the stops and times of every trip, for describing
+  the rides of a journey,
+- footpaths (CSR by stop): walks between stops within walking distance of
+  each other, and the transfers.txt minimum transfer times.
+
+Parsing stop_times.txt takes a while for a whole region, so the compiled
+arrays are saved to a cache file and reused for as long as the GTFS files
+are unchanged.
+
+Each service day gets its own connections table: the connections of the
+trips running that day, plus the after-midnight part of the previous day's
+trips, still sorted by departure. Two queries run over it:
+
+- earliest_arrival: one forward scan from the departure time, stopping as
+  soon as the next connection departs after the best arrival found,
+- profile: one backward scan over a departure window, keeping for every
+  stop the Pareto set of (departure, arrival) pairs towards the targets, so
+  every journey in the window that no later departure beats comes out of
+  a single pass.
+
+Both loops run over memoryviews of the day's arrays, which index to plain
+ints without the cost of NumPy scalars.
+"""
+import csv
+import json
+import logging
+import os
+import time
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+from app.services.transit_graph import haversine
+
+logger = logging.getLogger(__name__)
+
+FORMAT = 1
+INF = 1 << 30
+DAY = 86400
+WALK = -1  # first element of the back pointer of a stop reached on foot
+
+WALK_SPEED = 1.25  # m/s
+MAX_JOURNEY = 4 * 3600  # longest journey looked for, in seconds
+DAYS_CACHED = 3
+
+GTFS_FILES = ("agency.txt", "stops.txt", "routes.txt", "trips.txt", "stop_times.txt", "calendar.txt",
+              "calendar_dates.txt", "transfers.txt")
+
+ROUTE_TYPES = {0: "TRAM", 1: "SUBWAY", 2: "TRAIN", 3: "BUS", 4: "FERRY", 5: "TRAM", 7: "TRAIN", 11: "BUS", 12: "TRAIN"}
+# Extended (Google) route types used by HSL: 1xx rail, 4xx metro, 7xx bus, 9xx tram, 1000/1200 ferry
+EXTENDED_ROUTE_TYPES = ((100, "TRAIN"), (400, "SUBWAY"), (700, "BUS"), (900, "TRAM"), (1000, "FERRY"), (1100, None),
+                        (1200, "FERRY"), (1300, None))
+
+
+def route_mode(route_type: str) -> Optional[str]:
+    value = int(route_type)
+    if value < 100:
+        return ROUTE_TYPES.get(value)
+    mode = None
+    for start, name in EXTENDED_ROUTE_TYPES:
+        if value >= start:
+            mode = name
+    return mode
+
+
+def gtfs_seconds(text: str) -> int:
+    """Seconds since the start of the service day of an H:MM:SS time (which may pass 24:00:00)"""
+    hours, minutes, seconds = text.strip().split(":")
+    return int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+
+
+def read_table(directory: str, name: str):
+    """Rows of a GTFS file as lists, and a column name -> position map; None if the file is missing"""
+    path = os.path.join(directory, name)
+    if not os.path.exists(path):
+        return None, None
+    handle = open(path, newline="", encoding="utf-8-sig")
+    reader = csv.reader(handle)
+    header = next(reader, [])
+    columns = {column.strip(): i for i, column in enumerate(header)}
+
+    def rows():
+        with handle:
+            yield from reader
+    return rows(), columns
+
+
+def signature(directory: str, max_walk_m: float) -> dict:
+    files = {}
+    for name in GTFS_FILES:
+        path = os.path.join(directory, name)
+        if os.path.exists(path):
+            info = os.stat(path)
+            files[name] = [info.st_size, info.st_mtime_ns]
+    return {"format": FORMAT, "directory": os.path.abspath(directory), "files": files, "max_walk_m": max_walk_m}
+
+
+class Day:
+    """Connections running on one service date, sorted by departure; trips from the day before are numbered after the others"""
+
+    def __init__(self, service_date: date, arrays: Dict[str, np.ndarray]):
+        self.date = service_date
+        self.arrays = arrays
+        self.dep_time = arrays["dep_time"]
+        self.views = tuple(memoryview(arrays[column]) for column in ("dep_time", "arr_time", "dep_stop", "arr_stop", "trip"))
+
+    def __len__(self):
+        return len(self.dep_time)
+
+
+class Timetable:
+    def __init__(self, arrays: Dict[str, np.ndarray], meta: dict):
+        self.arrays = arrays
+        self.meta = meta
+        self.stop_ids: List[str] = meta["stop_ids"]
+        self.stop_names: List[str] = meta["stop_names"]
+        self.route_ids: List[str] = meta["route_ids"]
+        self.route_shorts: List[str] = meta["route_shorts"]
+        self.route_modes: List[Optional[str]] = meta["route_modes"]
+        self.trip_ids: List[str] = meta["trip_ids"]
+        self.timezone = ZoneInfo(meta["timezone"])
+        self.trip_count = len(self.trip_ids)
+        self.connections = len(arrays["dep_time"])
+        # Footpaths as (stop, seconds) lists per stop: the scans walk them once per improved stop
+        offsets, to, seconds = (arrays[name].tolist() for name in ("foot_offsets", "foot_to", "foot_time"))
+        self.footpaths: List[List[Tuple[int, int]]] = [
+            list(zip(to[offsets[i]:offsets[i + 1]], seconds[offsets[i]:offsets[i + 1]])) for i in range(len(offsets) - 1)
+        ]
+        self._names: Optional[Dict[str, List[int]]] = None
+        self._max_speed: Optional[float] = meta.get("max_speed")
+        self._days: "OrderedDict[date, Day]" = OrderedDict()
+        self.load_ms = 0.0
+        self.source = meta.get("source", "gtfs")
+
+    # Loading
+
+    @classmethod
+    def load(cls, directory: str, cache_path: str = "", max_walk_m: float = 400) -> "Timetable":
+        """Timetable of the GTFS feed in `directory`, from `cache_path` when it was compiled from the same files"""
+        started = time.perf_counter()
+        expected = signature(directory, max_walk_m)
+        timetable = None
+        if cache_path and os.path.exists(cache_path):
+            try:
+                timetable = cls.load_cache(cache_path)
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"[timetable] Ignoring unreadable cache {cache_path}: {e}")
+            else:
+                if timetable.meta.get("signature") != expected:
+                    timetable = None
+        if timetable is None:
+            timetable = cls.compile(directory, max_walk_m)
+            timetable.meta["signature"] = expected
+            if cache_path:
+                timetable.save_cache(cache_path)
+        timetable.load_ms = (time.perf_counter() - started) * 1000
+        logger.info(f"[timetable] {len(timetable.stop_ids)} stops, {timetable.trip_count} trips, "
+                    f"{timetable.connections} connections from {timetable.source} in {timetable.load_ms:.0f} ms")
+        return timetable
+
+    @classmethod
+    def load_cache(cls, path: str) -> "Timetable":
+        with np.load(path) as data:
+            arrays = {name: data[name] for name in data.files if name != "meta"}
+            meta = json.loads(data["meta"].tobytes())
+        meta["source"] = "cache"
+        return cls(arrays, meta)
+
+    def save_cache(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        meta = {k: v for k, v in self.meta.items() if k != "source"}
+        tmp = f"{path}.tmp.npz"
+        np.savez(tmp, meta=np.frombuffer(json.dumps(meta).encode(), dtype=np.uint8), **self.arrays)
+        os.replace(tmp, path)
+
+    @classmethod
+    def compile(cls, directory: str, max_walk_m: float = 400) -> "Timetable":
+        """Parse the GTFS files into connection, call and footpath arrays"""
+        rows, columns = read_table(directory, "agency.txt")
+        timezone = "Europe/Helsinki"
+        if rows is not None:
+            for row in rows:
+                timezone = row[columns["agency_timezone"]] or timezone
+                break
+            rows.close()
+
+        rows, columns = read_table(directory, "stops.txt")
+        if rows is None:
+            raise FileNotFoundError(os.path.join(directory, "stops.txt"))
+        stop_ids, stop_names, lat, lon = [], [], [], []
+        for row in rows:
+            stop_ids.append(row[columns["stop_id"]])
+            stop_names.append(row[columns["stop_name"]])
+            lat.append(float(row[columns["stop_lat"]] or "nan"))
+            lon.append(float(row[columns["stop_lon"]] or "nan"))
+        stop_index = {stop_id: i for i, stop_id in enumerate(stop_ids)}
+
+        rows, columns = read_table(directory, "routes.txt")
+        route_ids, route_shorts, route_modes = [], [], []
+        for row in rows:
+            route_ids.append(row[columns["route_id"]])
+            short = row[columns["route_short_name"]] if "route_short_name" in columns else ""
+            long = row[columns["route_long_name"]] if "route_long_name" in columns else ""
+            route_shorts.append(short or long)
+            route_modes.append(route_mode(row[columns["route_type"]]))
+        route_index = {route_id: i for i, route_id in enumerate(route_ids)}
+
+        services: Dict[str, int] = {}
+        weekdays, starts, ends = [], [], []
+
+        def service(service_id):
+            if service_id not in services:
+                services[service_id] = len(services)
+                weekdays.append([0] * 7)
+                starts.append(0)
+                ends.append(0)
+            return services[service_id]
+
+        rows, columns = read_table(directory, "calendar.txt")
+        if rows is not None:
+            days = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+            for row in rows:
+                i = service(row[columns["service_id"]])
+                weekdays[i] = [int(row[columns[day]]) for day in days]
+                starts[i] = int(row[columns["start_date"]])
+                ends[i] = int(row[columns["end_date"]])
+        exceptions: Dict[str, Dict[str, int]] = {}
+        rows, columns = read_table(directory, "calendar_dates.txt")
+        if rows is not None:
+            for row in rows:
+                i = service(row[columns["service_id"]])
+                # 1 adds the service on that date, 2 removes it
+                exceptions.setdefault(row[columns["date"]], {})[str(i)] = int(row[columns["exception_type"]])
+
+        rows, columns = read_table(directory, "trips.txt")
+        trip_ids, trip_route, trip_service = [], [], []
+        for row in rows:
+            trip_ids.append(row[columns["trip_id"]])
+            trip_route.append(route_index[row[columns["route_id"]]])
+            trip_service.append(service(row[columns["service_id"]]))
+        trip_index = {trip_id: i for i, trip_id in enumerate(trip_ids)}
+
+        rows, columns = read_table(directory, "stop_times.txt")
+        c_trip, c_stop, c_arrival, c_departure, c_sequence = (columns[name] for name in (
+            "trip_id", "stop_id", "arrival_time", "departure_time", "stop_sequence"))
+        parsed: Dict[str, int] = {}  # the same few thousand clock times recur throughout the file
+        call_trip, call_stop, call_arrival, call_departure, call_sequence = [], [], [], [], []
+        for row in rows:
+            arrival, departure = row[c_arrival], row[c_departure]
+            # Untimed calls are skipped: GTFS leaves them to be interpolated, and a scan needs times
+            if not arrival and not departure:
+                continue
+            arrival = arrival or departure
+            departure = departure or arrival
+            a = parsed.get(arrival)
+            if a is None:
+                a = parsed[arrival] = gtfs_seconds(arrival)
+            d = parsed.get(departure)
+            if d is None:
+                d = parsed[departure] = gtfs_seconds(departure)
+            call_trip.append(trip_index[row[c_trip]])
+            call_stop.append(stop_index[row[c_stop]])
+            call_arrival.append(a)
+            call_departure.append(d)
+            call_sequence.append(int(row[c_sequence]))
+
+        call_trip = np.array(call_trip, dtype=np.int32)
+        order = np.lexsort((np.array(call_sequence, dtype=np.int64), call_trip))
+        call_trip = call_trip[order]
+        call_stop = np.array(call_stop, dtype=np.int32)[order]
+        call_arrival = np.array(call_arrival, dtype=np.int32)[order]
+        call_departure = np.array(call_departure, dtype=np.int32)[order]
+        trip_offsets = np.searchsorted(call_trip, np.arange(len(trip_ids) + 1)).astype(np.int64)
+
+        # A connection leaves every call that has a next call on the same trip
+        leaves = np.flatnonzero(call_trip[:-1] == call_trip[1:])
+        connections = {
+            "dep_stop": call_stop[leaves],
+            "arr_stop": call_stop[leaves + 1],
+            "dep_time": call_departure[leaves],
+            "arr_time": call_arrival[leaves + 1],
+            "trip": call_trip[leaves],
+            "position": (leaves - trip_offsets[call_trip[leaves]]).astype(np.int32),
+        }
+        by_departure = np.lexsort((connections["arr_time"], connections["dep_time"]))
+        connections = {name: column[by_departure] for name, column in connections.items()}
+
+        lat, lon = np.array(lat), np.array(lon)
+        foot = cls._footpaths(directory, stop_index, lat, lon, max_walk_m)
+
+        arrays = {
+            "stop_lat": lat,
+            "stop_lon": lon,
+            "trip_route": np.array(trip_route, dtype=np.int32),
+            "trip_service": np.array(trip_service, dtype=np.int32),
+            "trip_offsets": trip_offsets,
+            "call_stop": call_stop,
+            "call_arrival": call_arrival,
+            "call_departure": call_departure,
+            "service_weekdays": np.array(weekdays, dtype=np.bool_).reshape(-1, 7),
+            "service_start": np.array(starts, dtype=np.int32),
+            "service_end": np.array(ends, dtype=np.int32),
+            **connections,
+            **foot,
+        }
+        meta = {
+            "timezone": timezone,
+            "stop_ids": stop_ids,
+            "stop_names": stop_names,
+            "route_ids": route_ids,
+            "route_shorts": route_shorts,
+            "route_modes": route_modes,
+            "trip_ids": trip_ids,
+            "service_ids": list(services),
+            "exceptions": exceptions,
+        }
+        timetable = cls(arrays, meta)
+        # Saved with the cache, so loading it skips measuring every connection again
+        meta["max_speed"] = timetable.max_speed()
+        return timetable
+
+    @staticmethod
+    def _footpaths(directory: str, stop_index: Dict[str, int], lat: np.ndarray, lon: np.ndarray,
+                   max_walk_m: float) -> Dict[str, np.ndarray]:
+        """Walks between stops within max_walk_m, with the transfers.txt minimum times taking precedence"""
+        walks: Dict[Tuple[int, int], int] = {}
+        located = np.flatnonzero(~np.isnan(lat) & ~np.isnan(lon))
+        chunk = 256
+        for start in range(0, len(located), chunk):
+            rows = located[start:start + chunk]
+            distance = haversine(lat[rows, None], lon[rows, None], lat[None, located], lon[None, located])
+            near_rows, near_columns = np.nonzero(distance <= max_walk_m)
+            for i, j in zip(near_rows.tolist(), near_columns.tolist()):
+                a, b = int(rows[i]), int(located[j])
+                if a != b:
+                    walks[a, b] = int(np.ceil(distance[i, j] / WALK_SPEED))
+        rows, columns = read_table(directory, "transfers.txt")
+        if rows is not None:
+            for row in rows:
+                a, b = stop_index.get(row[columns["from_stop_id"]]), stop_index.get(row[columns["to_stop_id"]])
+                minimum = row[columns["min_transfer_time"]] if "min_transfer_time" in columns else ""
+                # Type 2 gives the time needed to change between two stops
+                if a is None or b is None or a == b or row[columns["transfer_type"]] != "2" or not minimum:
+                    continue
+                walks[a, b] = int(minimum)
+
+        pairs = sorted(walks)
+        origin = np.array([a for a, _ in pairs], dtype=np.int32)
+        return {
+            "foot_offsets": np.searchsorted(origin, np.arange(len(lat) + 1)).astype(np.int64),
+            "foot_to": np.array([b for _, b in pairs], dtype=np.int32),
+            "foot_time": np.array([walks[pair] for pair in pairs], dtype=np.int32),
+        }
+
+    # Service days
+
+    def running(self, service_date: date) -> np.ndarray:
+        """Boolean per service: whether it runs on `service_date`"""
+        stamp = int(service_date.strftime("%Y%m%d"))
+        arrays = self.arrays
+        active = (arrays["service_weekdays"][:, service_date.weekday()]
+                  & (arrays["service_start"] <= stamp) & (stamp <= arrays["service_end"]))
+        for service, kind in self.meta["exceptions"].get(str(stamp), {}).items():
+            active[int(service)] = kind == 1
+        return active
+
+    def day(self, service_date: date) -> Day:
+        """Connections table of one service date, built on first use and kept for the last few dates"""
+        cached = self._days.get(service_date)
+        if cached is not None:
+            self._days.move_to_end(service_date)
+            return cached
+        arrays = self.arrays
+        trip_service = arrays["trip_service"]
+        today = self.running(service_date)[trip_service][arrays["trip"]]
+        yesterday = self.running(service_date - timedelta(days=1))[trip_service][arrays["trip"]]
+        yesterday &= arrays["dep_time"] >= DAY
+        parts = []
+        for mask, shift, offset in ((today, 0, 0), (yesterday, DAY, self.trip_count)):
+            index = np.flatnonzero(mask)
+            parts.append({
+                "dep_time": arrays["dep_time"][index] - shift,
+                "arr_time": arrays["arr_time"][index] - shift,
+                "dep_stop": arrays["dep_stop"][index],
+                "arr_stop": arrays["arr_stop"][index],
+                "trip": arrays["trip"][index] + offset,
+                "connection": index.astype(np.int32),
+            })
+        merged = {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+        order = np.argsort(merged["dep_time"], kind="stable")
+        built = Day(service_date, {name: np.ascontiguousarray(column[order]) for name, column in merged.items()})
+        self._days[service_date] = built
+        while len(self._days) > DAYS_CACHED:
+            self._days.popitem(last=False)
+        return built
+
+    def service_time(self, moment: datetime) -> Tuple[date, int]:
+        """Service date and seconds since its midnight of a moment (naive moments are local time)"""
+        if moment.tzinfo is not None:
+            moment = moment.astimezone(self.timezone).replace(tzinfo=None)
+        return moment.date(), moment.hour * 3600 + moment.minute * 60 + moment.second
+
+    def moment(self, service_date: date, seconds: int) -> str:
+        local = datetime.combine(service_date, datetime.min.time()) + timedelta(seconds=seconds)
+        return local.replace(tzinfo=self.timezone).isoformat()
+
+    # Lookup
+
+    def named(self, name: str) -> List[int]:
+        """Stops with this name, ignoring case"""
+        if self._names is None:
+            names: Dict[str, List[int]] = {}
+            for i, stop_name in enumerate(self.stop_names):
+                names.setdefault(stop_name.lower(), []).append(i)
+            self._names = names
+        return self._names.get(name.strip().lower(), [])
+
+    def _walks_to(self, targets: Sequence[int]) -> Dict[int, int]:
+        """Seconds from each stop to the nearest target on foot (0 at the targets)"""
+        walks = {t: 0 for t in targets}
+        for t in targets:
+            for stop, seconds in self.footpaths[t]:
+                if seconds < walks.get(stop, INF):
+                    walks[stop] = seconds
+        return walks
+
+    # Earliest arrival
+
+    def earliest_arrival(self, sources: Sequence[int], targets: Sequence[int], service_date: date,
+                         departure: int) -> Optional[dict]:
+        """Journey reaching any of `targets` earliest when leaving any of `sources` at `departure` seconds"""
+        day = self.day(service_date)
+        arrival, stop, on_foot, rode, walked, _ = self._scan(day, sources, self._walks_to(targets), departure)
+        if stop < 0:
+            return None
+        legs = self._trace(day, set(sources), rode, walked, stop, on_foot)
+        return self._describe(day, legs, departure, arrival, stop, targets)
+
+    def _scan(self, day: Day, sources: Sequence[int], walks_to: Dict[int, int], departure: int):
+        """
+        Forward scan from `departure`. A journey walks only from a source or
+        after a ride (never twice in a row), so arrivals by ride are kept
+        apart from arrivals on foot: walks start from the former, boarding
+        needs either. Returns the earliest arrival at the targets and its stop
+        (-1 when there is none), the back pointers and the arrival at every
+        stop, exact up to the one at the targets.
+        """
+        dep_time, arr_time, dep_stop, arr_stop, trip = day.views
+        footpaths = self.footpaths
+        arrival = [INF] * len(self.stop_ids)
+        ridden = [INF] * len(self.stop_ids)
+        # Back pointers: stop -> (boarding connection, alighting connection) of the ride reaching it,
+        # and stop -> stop walked from, for the stops whose earliest arrival is on foot
+        rode: Dict[int, Tuple[int, int]] = {}
+        walked: Dict[int, int] = {}
+        boarded: Dict[int, int] = {}
+        best, best_stop, on_foot = INF, -1, False
+
+        for s in sources:
+            arrival[s] = departure
+        for s in sources:
+            if s in walks_to and departure + walks_to[s] < best:
+                best, best_stop = departure + walks_to[s], s
+            for q, seconds in footpaths[s]:
+                w = departure + seconds
+                if w < arrival[q]:
+                    arrival[q] = w
+                    walked[q] = s
+                    if walks_to.get(q) == 0 and w < best:
+                        best, best_stop, on_foot = w, q, True
+
+        limit = departure + MAX_JOURNEY
+        for c in range(int(np.searchsorted(day.dep_time, departure)), len(day)):
+            d = dep_time[c]
+            if d >= best or d > limit:
+                break
+            t = trip[c]
+            b = boarded.get(t)
+            if b is None:
+                if arrival[dep_stop[c]] > d:
+                    continue
+                boarded[t] = b = c
+            a, s = arr_time[c], arr_stop[c]
+            if a >= ridden[s]:
+                continue
+            ridden[s] = a
+            rode[s] = (b, c)
+            if a < arrival[s]:
+                arrival[s] = a
+                walked.pop(s, None)
+            walk = walks_to.get(s)
+            if walk is not None and a + walk < best:
+                best, best_stop, on_foot = a + walk, s, False
+            for q, seconds in footpaths[s]:
+                w = a + seconds
+                if w < arrival[q]:
+                    arrival[q] = w
+                    walked[q] = s
+                    if walks_to.get(q) == 0 and w < best:
+                        best, best_stop, on_foot = w, q, True
+        return best, best_stop, on_foot, rode, walked, arrival
+
+    def _trace(self, day: Day, sources: set, rode: Dict[int, Tuple[int, int]], walked: Dict[int, int], stop: int,
+               on_foot: bool) -> List[tuple]:
+        """Legs from the sources to `stop`, following the back pointers of a scan"""
+        dep_stop = day.views[2]
+        legs = []
+        for _ in range(len(self.stop_ids)):
+            if on_foot:
+                legs.append((WALK, walked[stop], stop))
+                stop, on_foot = walked[stop], False
+                continue
+            if stop in sources:
+                break
+            board, alight = rode[stop]
+            legs.append((board, alight, stop))
+            # Boarding needs the earliest arrival at the stop, on foot or by a ride
+            stop = dep_stop[board]
+            on_foot = stop in walked
+        return legs[::-1]
+
+    # Profile
+
+    def profile(self, sources: Sequence[int], targets: Sequence[int], service_date: date, start: int,
+                end: int) -> List[dict]:
+        """
+        Every journey with at least one ride leaving any of `sources` between
+        `start` and `end` seconds that no later departure beats, after the walk
+        all the way when the targets are within reach on foot
+        """
+        day = self.day(service_date)
+        walks_to = self._walks_to(targets)
+        # Walking takes as long whenever one leaves, so it beats every ride not arriving sooner than it would
+        walker = min((s for s in set(sources) if s in walks_to), key=walks_to.get, default=None)
+        walking = walks_to[walker] if walker is not None else INF
+        # Leaving after the window gets there by `horizon`, beating whatever in the window arrives no sooner
+        horizon, _, _, _, _, after = self._scan(day, sources, walks_to, end + 1)
+        horizon = min(horizon, end + 1 + MAX_JOURNEY)
+
+        # Only connections some journey from the sources can reach matter, and only stops a ride can reach in time
+        ridden, usable = self._reach(day, sources, start, self._cone(day, sources, targets, start, horizon, after))
+
+        dep_time, arr_time, dep_stop, arr_stop, trip = day.views
+        footpaths = self.footpaths
+        # stop -> ([-departure, ...], [arrival, ...], [pointer, ...]), departures and arrivals both decreasing
+        profiles: Dict[int, Tuple[list, list, list]] = {}
+        trip_best: Dict[int, Tuple[int, int]] = {}
+        boarding: Dict[int, int] = {}
+
+        def insert(stop, departure, arrival, pointer):
+            entry = profiles.get(stop)
+            if entry is None:
+                profiles[stop] = ([-departure], [arrival], [pointer])
+                return True
+            keys, arrivals, pointers = entry
+            after = bisect_right(keys, -departure)
+            if after and arrivals[after - 1] <= arrival:
+                return False
+            at = bisect_left(keys, -departure)
+            dominated = at
+            while dominated < len(keys) and arrivals[dominated] >= arrival:
+                dominated += 1
+            keys[at:dominated] = [-departure]
+            arrivals[at:dominated] = [arrival]
+            pointers[at:dominated] = [pointer]
+            return True
+
+        profiles_get, walks_to_get, trip_best_get, boarding_get = (profiles.get, walks_to.get, trip_best.get,
+                                                                   boarding.get)
+        for c in reversed(usable):
+            a = arr_time[c]
+            if a >= horizon:
+                continue
+            s = arr_stop[c]
+            best, alight = INF, c
+            walk = walks_to_get(s)
+            if walk is not None:
+                best = a + walk
+            entry = profiles_get(s)
+            if entry is not None:
+                k = bisect_right(entry[0], -a)
+                if k and entry[1][k - 1] < best:
+                    best = entry[1][k - 1]
+            t = trip[c]
+            stay = trip_best_get(t)
+            if stay is not None and stay[0] <= best:
+                best, alight = stay
+            elif best < INF:
+                trip_best[t] = (best, c)
+            if best >= horizon:
+                continue
+            d, p = dep_time[c], dep_stop[c]
+            # Pairs at a stop are looked up after a ride into it (or at a source); walks are pointed to below
+            if ridden[p] <= d:
+                insert(p, d, best, (c, alight))
+            # Rides from p are seen latest departure first: one arriving no earlier than those already seen
+            # gives the stops around p nothing they do not have
+            if best >= boarding_get(p, INF):
+                continue
+            boarding[p] = best
+            for q, seconds in footpaths[p]:
+                # A walk to p is only ever started after a ride into q, or at a source
+                leave = d - seconds
+                if ridden[q] > leave:
+                    continue
+                entry = profiles_get(q)
+                if entry is not None:
+                    k = bisect_right(entry[0], -leave)
+                    if k and entry[1][k - 1] <= best:
+                        continue
+                insert(q, leave, best, (WALK, p, c, alight))
+
+        options = []
+        for s in set(sources):
+            entry = profiles.get(s)
+            if entry is not None:
+                options += [(-key, arrival, s) for key, arrival in zip(entry[0], entry[1]) if -key >= start]
+        options.sort(key=lambda option: (-option[0], option[1]))
+        journeys, earliest = [], INF
+        for departure, arrival, s in options:
+            if arrival < earliest:
+                earliest = arrival
+                if departure <= end and arrival < departure + walking:
+                    journeys.append((departure, arrival, self._follow(day, profiles, walks_to, s, departure, arrival)))
+        described = [self._describe(day, legs, departure, arrival, legs[-1][-1] if legs else None, targets)
+                     for departure, arrival, legs in reversed(journeys)]
+        if walker is not None:
+            described.insert(0, self._describe(day, [], start, start + walking, walker, targets))
+        return described
+
+    def max_speed(self) -> float:
+        """
+        Fastest straight-line speed of any ride or walk in m/s (infinite when one
+        covers a distance in no time): no journey gets anywhere sooner
+        """
+        if self._max_speed is None:
+            arrays = self.arrays
+            lat, lon = arrays["stop_lat"], arrays["stop_lon"]
+            walk_from = np.repeat(np.arange(len(lat)), np.diff(arrays["foot_offsets"]))
+            fastest = 0.0
+            for a, b, seconds in ((arrays["dep_stop"], arrays["arr_stop"], arrays["arr_time"] - arrays["dep_time"]),
+                                  (walk_from, arrays["foot_to"], arrays["foot_time"])):
+                distance = np.nan_to_num(haversine(lat[a], lon[a], lat[b], lon[b]))
+                moving = distance > 0
+                if (seconds[moving] <= 0).any():
+                    fastest = float("inf")
+                    break
+                fastest = max(fastest, float((distance[moving] / seconds[moving]).max(initial=0)))
+            self._max_speed = fastest
+        return self._max_speed
+
+    def _cone(self, day: Day, sources: Sequence[int], targets: Sequence[int], start: int, horizon: int,
+              after: List[int]) -> List[int]:
+        """
+        Connections departing from `start` to `horizon` whose departure stop the
+        sources can reach in time, and from whose arrival stop the targets can be
+        reached by `horizon`, going no faster than max_speed(). Leaving later and
+        arriving at each stop by `after` catches the others as well, so every
+        journey riding them is beaten.
+        """
+        lo = int(np.searchsorted(day.dep_time, start))
+        hi = int(np.searchsorted(day.dep_time, horizon, side="right"))
+        arrays = day.arrays
+        dep_time, dep_stop = arrays["dep_time"][lo:hi], arrays["dep_stop"][lo:hi]
+        keep = dep_time < np.asarray(after)[dep_stop]
+        speed = self.max_speed()
+        if np.isfinite(speed) and speed > 0:
+            lat, lon = self.arrays["stop_lat"], self.arrays["stop_lon"]
+
+            def seconds_from(stops):
+                # Per stop; stops without coordinates could be anywhere
+                distance = np.min([haversine(lat[s], lon[s], lat, lon) for s in set(stops)], axis=0)
+                return np.nan_to_num(distance, nan=0.0) / speed
+
+            # A second of slack for rounding
+            keep &= dep_time + 1 >= start + seconds_from(sources)[dep_stop]
+            keep &= arrays["arr_time"][lo:hi] + seconds_from(targets)[arrays["arr_stop"][lo:hi]] <= horizon + 1
+        return (lo + np.flatnonzero(keep)).tolist()
+
+    def _reach(self, day: Day, sources: Sequence[int], start: int, candidates: List[int]) -> Tuple[List[int], List[int]]:
+        """Earliest arrival at every stop by a ride (`start` at the sources) when leaving at `start`, and the
+        candidate connections that can be ridden"""
+        dep_time, arr_time, dep_stop, arr_stop, trip = day.views
+        footpaths = self.footpaths
+        arrival = [INF] * len(self.stop_ids)
+        for s in sources:
+            arrival[s] = start
+        ridden = list(arrival)
+        for s in sources:
+            for q, seconds in footpaths[s]:
+                arrival[q] = min(arrival[q], start + seconds)
+        boarded = set()
+        usable = []
+        for c in candidates:
+            t = trip[c]
+            if t not in boarded:
+                if arrival[dep_stop[c]] > dep_time[c]:
+                    continue
+                boarded.add(t)
+            usable.append(c)
+            a, s = arr_time[c], arr_stop[c]
+            if a < ridden[s]:
+                ridden[s] = a
+                arrival[s] = min(arrival[s], a)
+                for q, seconds in footpaths[s]:
+                    w = a + seconds
+                    if w < arrival[q]:
+                        arrival[q] = w
+        return ridden, usable
+
+    def _follow(self, day: Day, profiles, walks_to: Dict[int, int], stop: int, at: int, arrival: int) -> List[tuple]:
+        """Legs of the profile journey leaving `stop` at `at` and arriving at `arrival`"""
+        arr_time, arr_stop = day.views[1], day.views[3]
+        legs = []
+        for _ in range(len(self.stop_ids)):
+            walk = walks_to.get(stop)
+            if walk is not None and at + walk <= arrival and (walk == 0 or legs):
+                break
+            keys, arrivals, pointers = profiles[stop]
+            k = bisect_right(keys, -at) - 1
+            pointer = pointers[k]
+            if pointer[0] == WALK:
+                # A walk to the stop of the ride that follows it
+                _, to, board, alight = pointer
+                legs.append((WALK, stop, to))
+            else:
+                board, alight = pointer
+            legs.append((board, alight, arr_stop[alight]))
+            at, stop = arr_time[alight], arr_stop[alight]
+        return legs
+
+    def _walk_time(self, a: int, b: int) -> int:
+        for stop, seconds in self.footpaths[a]:
+            if stop == b:
+                return seconds
+        return 0
+
+    # Output
+
+    def _describe(self, day: Day, legs: List[tuple], departure: int, arrival: int, last_stop: Optional[int],
+                  targets: Sequence[int]) -> dict:
+        arrays, day_arrays = self.arrays, day.arrays
+        described = []
+        at = departure
+        for leg in legs:
+            if leg[0] == WALK:
+                _, a, b = leg
+                walked = self._walk_time(a, b)
+                described.append({
+                    "from": self.stop_names[a], "to": self.stop_names[b], "walk": True,
+                    "stops": [self.stop_ids[a], self.stop_ids[b]],
+                    "departure": self.moment(day.date, at), "arrival": self.moment(day.date, at + walked),
+                })
+                at += walked
+                continue
+            board, alight, _ = leg
+            first, last = (int(day_arrays["connection"][c]) for c in (board, alight))
+            t = int(arrays["trip"][first])
+            calls = int(arrays["trip_offsets"][t])
+            stops = arrays["call_stop"][calls + arrays["position"][first]:calls + arrays["position"][last] + 2]
+            route = int(arrays["trip_route"][t])
+            leaves, reaches = int(day_arrays["dep_time"][board]), int(day_arrays["arr_time"][alight])
+            described.append({
+                "from": self.stop_names[stops[0]], "to": self.stop_names[stops[-1]],
+                "stops": [self.stop_ids[s] for s in stops.tolist()],
+                "departure": self.moment(day.date, leaves), "arrival": self.moment(day.date, reaches),
+                "route_id": self.route_ids[route], "route": self.route_shorts[route], "mode": self.route_modes[route],
+                "trip_id": self.trip_ids[t],
+            })
+            at = reaches
+        if last_stop is not None and last_stop not in targets:
+            # The last stop reached is a walk away from the nearest target
+            target = min((t for t in targets if self._walk_time(last_stop, t)),
+                         key=lambda t: self._walk_time(last_stop, t))
+            described.append({
+                "from": self.stop_names[last_stop], "to": self.stop_names[target], "walk": True,
+                "stops": [self.stop_ids[last_stop], self.stop_ids[target]],
+                "departure": self.moment(day.date, at), "arrival": self.moment(day.date, arrival),
+            })
+        rides = sum(1 for leg in described if not leg.get("walk"))
+        return {
+            "departure": self.moment(day.date, departure),
+            "arrival": self.moment(day.date, arrival),
+            "duration_s": arrival - departure,
+            "rides": rides,
+            "transfers": max(0, rides - 1),
+            "legs": described,
+        }
+
+    def stats(self):
+        return {
+            "stops": len(self.stop_ids),
+            "trips": self.trip_count,
+            "connections": self.connections,
+            "footpaths": len(self.arrays["foot_to"]),
+            "days_cached": [d.isoformat() for d in self._days],
+            "source": self.source,
+            "load_ms": round(self.load_ms, 3),
+        }
@@ -0,0 +1,143 @@
+"""
+The dashboard's four charts as one payload.
+
+/api/dashboard/summary replaces the by_type, hourly, daily and by_station
+requests the dashboard used to make every minute. The components are read
+concurrently (each query on its own pool connection), share one snapshot
+time that fixes "today" for all of them, and the encoded result is cached
+for the refresh interval so every open dashboard in that minute gets the
+same bytes. Concurrent misses for the same parameters wait on one build.
+"""
+import asyncio
+from datetime import date, datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+from fastapi.responses import JSONResponse
+
+from app.db import queries
+from app.services.recent_window import RecentWindow
+
+Summary = Tuple[datetime, bytes]  # snapshot time, encoded payload
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class DashboardSummary:
+    def __init__(self, db, window: RecentWindow, views_ready: Callable[[], bool],
+                 ttl: float = 60, max_entries: int = 64):
+        self.db = db
+        self.window = window
+        self.views_ready = views_ready
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._cache: Dict[tuple, Tuple[float, Summary]] = {}
+        self._building: Dict[tuple, asyncio.Future] = {}
+        self.hits = 0
+        self.builds = 0
+
+    async def get(self, day: Optional[date] = None, days: int = 7, limit: int = 10) -> Summary:
+        """Cached summary for `day` (today when None) and the `days` days up to it"""
+        key = (day, days, limit)
+        loop = asyncio.get_running_loop()
+        cached = self._cache.get(key)
+        if cached is not None and cached[0] > loop.time():
+            self.hits += 1
+            return cached[1]
+
+        building = self._building.get(key)
+        if building is not None:
+            self.hits += 1
+            return await asyncio.shield(building)
+
+        future = self._building[key] = loop.create_future()
+        try:
+            summary = await self._build(day, days, limit)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Waiters get the error; nobody else may be listening
+            future.exception()
+            raise
+        else:
+            future.set_result(summary)
+            self._store(key, summary, loop.time() + self.ttl)
+            return summary
+        finally:
+            del self._building[key]
+
+    def expires_in(self, day: Optional[date], days: int, limit: int) -> float:
+        cached = self._cache.get((day, days, limit))
+        return max(0.0, cached[0] - asyncio.get_running_loop().time()) if cached else 0.0
+
+    def _store(self, key: tuple, summary: Summary, expires: float):
+        now = asyncio.get_running_loop().time()
+        for stale in [k for k, (until, _) in self._cache.items() if until <= now]:
+            del self._cache[stale]
+        while len(self._cache) >= self.max_entries:
+            del self._cache[next(iter(self._cache))]
+        self._cache[key] = (expires, summary)
+
+    async def _build(self, day: Optional[date], days: int, limit: int) -> Summary:
+        self.builds += 1
+        snapshot = _utcnow()
+        day = day or snapshot.date()
+        by_type, hourly, daily, by_station = await asyncio.gather(
+            self.by_type(),
+            self.hourly(day),
+            self.daily(day - timedelta(days=days - 1), day),
+            self.by_station(limit),
+        )
+        payload = {
+            "generated_at": snapshot.replace(tzinfo=timezone.utc).isoformat(),
+            "date": day.isoformat(),
+            "by_type": by_type,
+            "hourly": hourly,
+            "daily": daily,
+            "by_station": by_station,
+        }
+        return snapshot, JSONResponse(payload).body
+
+    async def by_type(self) -> List[dict]:
+        if self.window.ready:
+            counts = self.window.counts_by_mode()
+        else:
+            query = queries.COUNTS_BY_TYPE_VIEW if self.views_ready() else queries.COUNTS_BY_TYPE
+            counts = [(row["type"], row["count"]) for row in await self.db.fetch(query)]
+        return [{"details": {"mode": mode}, "count": count} for mode, count in counts]
+
+    async def hourly(self, day: date) -> List[dict]:
+        counts = self.window.hourly(day)
+        if counts is None:
+            counts = [(row["timestamp"], row["count"]) for row in await self.db.fetch(queries.HOURLY_COUNTS, day)]
+        return [{"timestamp": ts.isoformat(), "count": count} for ts, count in counts]
+
+    async def daily(self, start: date, end: date) -> List[dict]:
+        # Days held in the recent window are counted in memory, only older days go to SQL
+        recent = []
+        first_day = self.window.first_covered_day()
+        if first_day is not None and end >= first_day:
+            counts = self.window.daily(max(start, first_day), end)
+            if counts is not None:
+                recent = counts
+                end = first_day - timedelta(days=1)
+        older = []
+        if start <= end:
+            older = [(row["timestamp"], row["count"]) for row in await self.db.fetch(queries.DAILY_COUNTS, start, end)]
+        return [{"timestamp": day.isoformat(), "count": count} for day, count in older + recent]
+
+    async def by_station(self, limit: int) -> List[dict]:
+        if self.window.ready:
+            if self.window.names_stale:
+                await self.window.refresh_station_names(self.db)
+            counts = self.window.top_stations(limit)
+        else:
+            query = queries.TOP_STATIONS_VIEW if self.views_ready() else queries.TOP_STATIONS
+            counts = [(row["station_name"], row["count"]) for row in await self.db.fetch(query, limit)]
+        return [{"details": {"station_name": name}, "count": count} for name, count in counts]
+
+    def stats(self):
+        return {"entries": len(self._cache), "hits": self.hits, "builds": self.builds, "ttl": self.ttl}
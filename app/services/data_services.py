@@ -4,6 +4,7 @@ import logging
 from models import db, Vehicle as DBVehicle, Position as DBPosition
 from models import TransportStats as DBTransportStats, VehicleMode
 from app.models.transport import Vehicle, Position, TransportStats, TransportCount
+from app.core.tracing import tracer
 import json
 
 logger = logging.getLogger(__name__)
@@ -15,6 +16,8 @@ class DataService:
     
     def store_vehicle_data(self, vehicles: List[Vehicle]):
         """Store vehicle data in PostgreSQL database"""
+        store_span = tracer.start_span("store_vehicle_data", rows=len(vehicles))
+        upsert_span = tracer.start_span("upsert", parent=store_span, rows=len(vehicles))
         try:
             for vehicle_data in vehicles:
                 # Check if vehicle already exists
@@ -65,18 +68,27 @@ class DataService:
                         )
                         vehicle.position = position
             
+            upsert_span.end()
+
             # Commit all changes
-            db.session.commit()
+            with tracer.span("commit", parent=store_span):
+                db.session.commit()
             
             # Update statistics
-            self._update_hourly_stats(vehicles)
-            self._update_type_stats(vehicles)
+            with tracer.span("hourly_stats", parent=store_span):
+                self._update_hourly_stats(vehicles)
+            with tracer.span("type_stats", parent=store_span):
+                self._update_type_stats(vehicles)
             
             return len(vehicles)
         except Exception as e:
             db.session.rollback()
+            store_span.fail(e)
             logger.error(f"Error storing vehicle data: {str(e)}")
             raise
+        finally:
+            upsert_span.end()
+            store_span.end()
     
     def _update_hourly_stats(self, vehicles: List[Vehicle]):
         """Update hourly vehicle count statistics"""
@@ -1,6 +1,7 @@
 from typing import List, Optional, Dict, Any
 import logging
 from app.api.graphql_client import GraphQLClient
+from app.core.tracing import tracer
 from app.models.transport import Vehicle, Position, Station, Route, RoutePattern, VehicleMode
 
 logger = logging.getLogger(__name__)
@@ -43,6 +44,7 @@ class DigitransitService:
             vehicles_data = result.get("vehicles", [])
             
             vehicles = []
+            parse_span = tracer.start_span("parse_vehicles", entries=len(vehicles_data))
             for vehicle_data in vehicles_data:
                 try:
                     # Get route info if available
@@ -93,6 +95,8 @@ class DigitransitService:
                     logger.error(f"Error processing vehicle data: {str(e)}")
                     continue
             
+            parse_span.set(vehicles=len(vehicles))
+            parse_span.end()
             return vehicles
         except Exception as e:
             logger.error(f"Error fetching vehicles: {str(e)}")
@@ -0,0 +1,325 @@
+"""
+Live fleet snapshot shared by every worker on the host.
+
+The ingest leader keeps the latest report of each vehicle from the live
+feed and, after every fetch, publishes the whole fleet into a memory-mapped
+file (on /dev/shm by default) in a fixed columnar layout:
+
+    header   magic, capacity, active buffer
+    buffer 0 seq, count, version, generated_at, then one column per field
+    buffer 1 the same
+
+The writer fills the inactive buffer and then flips `active`, so readers
+always find a complete snapshot. Each buffer carries a sequence number that
+is odd while it is being written; readers map the file read-only, take
+NumPy views of the active buffer's columns without copying, and re-read if
+the sequence moved while they were using it (the writer came round to the
+same buffer again).
+
+API workers serve /api/vehicles/live and its bbox filter from these views
+instead of each keeping a copy of the fleet. Workers on another host than
+the leader find no fresh snapshot and answer 503.
+"""
+import logging
+import mmap
+import os
+import struct
+import time
+from datetime import timedelta
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from fastapi.responses import JSONResponse
+
+from app.core.timestamps import EPOCH, epoch_seconds
+from app.models.transport import VehicleMode
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"HTFLEET1"
+
+# magic, capacity, active buffer
+HEADER = struct.Struct("<8sII")
+# seq, count, version, generated_at (epoch seconds)
+BUFFER_HEADER = struct.Struct("<QIxxxxQd")
+HEADER_BYTES = 64
+
+COLUMNS = (
+    ("id", "S32"),
+    ("route_id", "S32"),
+    ("mode", "u1"),
+    ("station_id", "i4"),
+    ("latitude", "f8"),
+    ("longitude", "f8"),
+    ("timestamp", "f8"),  # epoch seconds
+    ("speed", "f4"),  # NaN when not reported
+    ("heading", "i2"),  # -1 when not reported
+)
+
+MODES = [mode.value for mode in VehicleMode]
+_MODE_CODES = {mode: code for code, mode in enumerate(MODES)}
+UNKNOWN_MODE = 255
+
+BBox = Tuple[float, float, float, float]  # min lon, min lat, max lon, max lat
+
+
+def _align(n: int) -> int:
+    return (n + 7) & ~7
+
+
+def layout(capacity: int) -> Tuple[Dict[str, int], int]:
+    """Column offsets within a buffer and the size of one buffer"""
+    offsets = {}
+    offset = HEADER_BYTES
+    for name, dtype in COLUMNS:
+        offsets[name] = offset
+        offset += _align(capacity * np.dtype(dtype).itemsize)
+    return offsets, offset
+
+
+def fleet_row(entry: Dict[str, Any]) -> tuple:
+    """A /live/vehicles entry as a tuple in COLUMNS order"""
+    speed, heading, station = entry.get("speed"), entry.get("heading"), entry.get("station_id")
+    return (
+        str(entry["id"]).encode()[:32],
+        str(entry.get("route_id") or "").encode()[:32],
+        _MODE_CODES.get(entry.get("type"), UNKNOWN_MODE),
+        int(station) if station is not None else -1,
+        float(entry["latitude"]),
+        float(entry["longitude"]),
+        epoch_seconds(entry["timestamp"]),
+        float(speed) if speed is not None else np.nan,
+        int(heading) if heading is not None else -1,
+    )
+
+
+def _columns(buf, base: int, capacity: int, count: int) -> Dict[str, np.ndarray]:
+    offsets, _ = layout(capacity)
+    return {
+        name: np.frombuffer(buf, dtype=dtype, count=count, offset=base + offsets[name])
+        for name, dtype in COLUMNS
+    }
+
+
+class FleetSnapshotWriter:
+    """Leader side: latest report per vehicle, published after every fetch"""
+
+    def __init__(self, path: str, capacity: int = 20000, vehicle_ttl: float = 120):
+        self.path = path
+        self.capacity = capacity
+        self.vehicle_ttl = vehicle_ttl
+        self.latest: Dict[bytes, tuple] = {}
+        self.seen: Dict[bytes, float] = {}
+        self.version = 0
+        self.publishes = 0
+        self.errors = 0
+        self.truncated = 0
+        self.last_publish_ms = 0.0
+        self._buffer_bytes = layout(capacity)[1]
+        self._mm = self._open()
+
+    def _open(self) -> mmap.mmap:
+        size = HEADER_BYTES + 2 * self._buffer_bytes
+        try:
+            with open(self.path, "r+b") as f:
+                mm = mmap.mmap(f.fileno(), 0)
+            magic, capacity, _ = HEADER.unpack_from(mm, 0)
+            if magic == MAGIC and capacity == self.capacity and len(mm) == size:
+                # Carry on from the previous leader's version so ETags never repeat
+                self.version = max(self._buffer_header(mm, i)[2] for i in (0, 1))
+                return mm
+            mm.close()
+        except (FileNotFoundError, ValueError, struct.error):
+            pass
+
+        # New layout: build the file aside so readers never map a half-sized one
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.truncate(size)
+        with open(tmp, "r+b") as f:
+            mm = mmap.mmap(f.fileno(), 0)
+        HEADER.pack_into(mm, 0, MAGIC, self.capacity, 0)
+        os.replace(tmp, self.path)
+        return mm
+
+    def _base(self, index: int) -> int:
+        return HEADER_BYTES + index * self._buffer_bytes
+
+    def _buffer_header(self, mm, index: int) -> tuple:
+        return BUFFER_HEADER.unpack_from(mm, self._base(index))
+
+    def update(self, entries: List[Dict[str, Any]]):
+        """Fold a fetched /live/vehicles payload into the fleet and publish it; a fetch listener"""
+        now = time.time()
+        for entry in entries:
+            try:
+                row = fleet_row(entry)
+            except Exception:
+                self.errors += 1
+                continue
+            self.latest[row[0]] = row
+            self.seen[row[0]] = now
+        cutoff = now - self.vehicle_ttl
+        for key in [key for key, seen in self.seen.items() if seen < cutoff]:
+            del self.latest[key], self.seen[key]
+        self.publish()
+
+    def publish(self):
+        started = time.perf_counter()
+        rows = list(self.latest.values())
+        if len(rows) > self.capacity:
+            self.truncated += len(rows) - self.capacity
+            rows = rows[:self.capacity]
+
+        _, _, active = HEADER.unpack_from(self._mm, 0)
+        index = 1 - active
+        base = self._base(index)
+        seq = self._buffer_header(self._mm, index)[0]
+        # Odd while writing: a reader that sees it, or sees it change, reads again
+        struct.pack_into("<Q", self._mm, base, seq + 1)
+        columns = _columns(self._mm, base, self.capacity, len(rows))
+        if rows:
+            for (name, _), values in zip(COLUMNS, zip(*rows)):
+                columns[name][:] = values
+        self.version += 1
+        BUFFER_HEADER.pack_into(self._mm, base, seq + 2, len(rows), self.version, time.time())
+        HEADER.pack_into(self._mm, 0, MAGIC, self.capacity, index)
+
+        self.publishes += 1
+        self.last_publish_ms = (time.perf_counter() - started) * 1000
+
+    def close(self):
+        self._mm.close()
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "vehicles": len(self.latest),
+            "capacity": self.capacity,
+            "version": self.version,
+            "publishes": self.publishes,
+            "errors": self.errors,
+            "truncated": self.truncated,
+            "last_publish_ms": round(self.last_publish_ms, 3),
+        }
+
+
+class FleetView(NamedTuple):
+    version: int
+    generated_at: float  # epoch seconds
+    columns: Dict[str, np.ndarray]  # read-only views into the mapping, `count` long
+
+
+class FleetSnapshotReader:
+    """Worker side: read-only mapping of the snapshot the leader publishes"""
+
+    def __init__(self, path: str, max_age: float = 60, retries: int = 5):
+        self.path = path
+        self.max_age = max_age
+        self.retries = retries
+        self.reads = 0
+        self.retried = 0
+        self.remaps = 0
+        self._mm: Optional[mmap.mmap] = None
+        self._inode: Optional[int] = None
+        self._capacity = 0
+        self._buffer_bytes = 0
+        self._body: Tuple[int, bytes] = (0, b"")
+
+    def _mapping(self) -> Optional[mmap.mmap]:
+        try:
+            inode = os.stat(self.path).st_ino
+        except FileNotFoundError:
+            self._mm = self._inode = None
+            return None
+        if inode != self._inode:
+            # The leader replaced the file with a new layout; views of the old
+            # mapping keep it alive until they are dropped
+            with open(self.path, "rb") as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, capacity, _ = HEADER.unpack_from(mm, 0)
+            if magic != MAGIC:
+                return None
+            self._mm, self._inode, self._capacity = mm, inode, capacity
+            self._buffer_bytes = layout(capacity)[1]
+            # A new file restarts the version count
+            self._body = (0, b"")
+            self.remaps += 1
+        return self._mm
+
+    def read(self, use: Callable[[FleetView], Any]) -> Optional[Any]:
+        """
+        Call `use` with the current snapshot and return its result, or None
+        when there is no fresh snapshot. `use` must copy out what it needs:
+        the views are only valid until it returns.
+        """
+        mm = self._mapping()
+        if mm is None:
+            return None
+        self.reads += 1
+        # Called on the event loop, so no sleeping between tries: a changed sequence means the writer
+        # came round to this buffer again, and by then `active` points at the other, complete one
+        for _ in range(self.retries):
+            _, _, active = HEADER.unpack_from(mm, 0)
+            base = HEADER_BYTES + active * self._buffer_bytes
+            seq, count, version, generated_at = BUFFER_HEADER.unpack_from(mm, base)
+            if seq % 2 == 0:
+                if version == 0 or time.time() - generated_at > self.max_age:
+                    return None
+                result = use(FleetView(version, generated_at, _columns(mm, base, self._capacity, count)))
+                if BUFFER_HEADER.unpack_from(mm, base)[0] == seq:
+                    return result
+            self.retried += 1
+        logger.warning("[fleet] Snapshot kept changing under the reader")
+        return None
+
+    def current(self) -> Optional[Tuple[int, float]]:
+        """(version, generated_at) of the fresh snapshot, if there is one"""
+        return self.read(lambda view: (view.version, view.generated_at))
+
+    def vehicles(self, bbox: Optional[BBox] = None) -> Optional[Tuple[int, float, bytes]]:
+        """(version, generated_at, JSON body) of the fleet, optionally within `bbox`"""
+        if bbox is None:
+            version, body = self._body
+            current = self.current()
+            if current is not None and current[0] == version:
+                return version, current[1], body
+        result = self.read(lambda view: (view.version, view.generated_at, vehicle_dicts(view, bbox)))
+        if result is None:
+            return None
+        version, generated_at, vehicles = result
+        body = JSONResponse(vehicles).body
+        if bbox is None:
+            # Every worker re-encodes the whole fleet once per version at most
+            self._body = (version, body)
+        return version, generated_at, body
+
+    def stats(self):
+        return {"path": self.path, "mapped": self._mm is not None, "reads": self.reads,
+                "retried": self.retried, "remaps": self.remaps}
+
+
+def vehicle_dicts(view: FleetView, bbox: Optional[BBox] = None) -> List[dict]:
+    """The snapshot's vehicles (inside `bbox` when given) in the map's vehicle shape"""
+    columns = view.columns
+    if bbox is not None:
+        min_lon, min_lat, max_lon, max_lat = bbox
+        lon, lat = columns["longitude"], columns["latitude"]
+        index = np.flatnonzero((lon >= min_lon) & (lon <= max_lon) & (lat >= min_lat) & (lat <= max_lat))
+        columns = {name: column[index] for name, column in columns.items()}
+    speed = columns["speed"].astype(np.float64).round(2)
+    speeds = np.where(np.isnan(speed), None, speed.astype(object)).tolist()
+    return [{
+        "id": vehicle_id.decode(),
+        "route_id": route_id.decode() or None,
+        "mode": MODES[mode] if mode < len(MODES) else None,
+        "station_id": station if station >= 0 else None,
+        "position": {"latitude": latitude, "longitude": longitude},
+        "speed": speed,
+        "heading": heading if heading >= 0 else None,
+        "timestamp": (EPOCH + timedelta(seconds=ts)).isoformat(),
+    } for vehicle_id, route_id, mode, station, latitude, longitude, ts, speed, heading in zip(
+        columns["id"].tolist(), columns["route_id"].tolist(), columns["mode"].tolist(),
+        columns["station_id"].tolist(), columns["latitude"].tolist(), columns["longitude"].tolist(),
+        columns["timestamp"].tolist(), speeds, columns["heading"].tolist(),
+    )]
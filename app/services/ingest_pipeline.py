@@ -0,0 +1,453 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional
+
+import asyncpg
+import httpx
+
+from app.core import metrics
+from app.core.log_sampling import log_sampled
+from app.core.tracing import Span, tracer
+from app.db.pool import PoolTimeout
+from app.services.spool import Spool
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_POLICIES = ("merge", "drop_oldest", "drop_newest")
+
+# Write errors of the database being out of reach rather than of the rows: the same rows go through later
+TRANSIENT_ERRORS = (
+    OSError, asyncio.TimeoutError, PoolTimeout, asyncpg.PostgresConnectionError, asyncpg.InterfaceError,
+    asyncpg.QueryCanceledError, asyncpg.TooManyConnectionsError, asyncpg.CannotConnectNowError,
+)
+
+
+class StageStats:
+    """Queue depth and latency gauges for one pipeline stage"""
+
+    def __init__(self, name: str, queue: Optional[asyncio.Queue] = None, workers: int = 1):
+        self.name = name
+        self.queue = queue
+        # Tasks meant to run the stage, and those running it now (not waiting to restart after a crash)
+        self.workers = workers
+        self.running = 0
+        self.restarts = 0
+        self.last_error: Optional[str] = None
+        self.processed = 0
+        self.dropped = 0
+        self.merged = 0
+        self.errors = 0
+        self.last_latency = 0.0
+        self.avg_latency = 0.0
+        self.max_latency = 0.0
+
+    def observe(self, seconds: float, items: int = 1):
+        """Record one pass of the stage and the number of items it handled"""
+        self.processed += items
+        self.last_latency = seconds
+        # Exponentially weighted so the gauge follows recent load
+        self.avg_latency = seconds if self.avg_latency == 0.0 else 0.8 * self.avg_latency + 0.2 * seconds
+        self.max_latency = max(self.max_latency, seconds)
+
+    def to_dict(self):
+        return {
+            "stage": self.name,
+            "queue_depth": self.queue.qsize() if self.queue is not None else 0,
+            "queue_capacity": self.queue.maxsize if self.queue is not None else 0,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "merged": self.merged,
+            "errors": self.errors,
+            "workers": self.workers,
+            "running": self.running,
+            "restarts": self.restarts,
+            "last_error": self.last_error,
+            "last_latency_ms": round(self.last_latency * 1000, 3),
+            "avg_latency_ms": round(self.avg_latency * 1000, 3),
+            "max_latency_ms": round(self.max_latency * 1000, 3),
+        }
+
+
+class RecentKeys:
+    """Bounded set of recently written dedupe keys that expire after a TTL"""
+
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._keys: "OrderedDict[Hashable, float]" = OrderedDict()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, key: Hashable, now: float) -> bool:
+        """Remember a key, returning False if it was already seen"""
+        expires = self._keys.get(key)
+        if expires is not None and expires > now:
+            return False
+        self._keys[key] = now + self.ttl
+        self._keys.move_to_end(key)
+        self._evict(now)
+        return True
+
+    def forget(self, keys: Iterable[Hashable]):
+        """Drop keys whose write failed so a later payload can retry them"""
+        for key in keys:
+            self._keys.pop(key, None)
+
+    def _evict(self, now: float):
+        # Keys are kept in insertion order, so expired ones sit at the front
+        while self._keys:
+            key, expires = next(iter(self._keys.items()))
+            if expires > now and len(self._keys) <= self.max_size:
+                break
+            self._keys.popitem(last=False)
+
+
+class IngestPipeline:
+    """
+    Polls a live feed endpoint and writes its rows through bounded stages:
+    fetch -> decode -> dedupe -> batch write.
+
+    Only the fetch stage is non-blocking. When the writers fall behind,
+    the bounded queues fill up from the back and the fetch stage applies
+    the overflow policy to its output queue instead of waiting, so the
+    polling cadence stays steady while the database is slow.
+
+    With a spool attached, batches the writers cannot take right away and
+    batches whose write failed are appended to disk instead, and a replay
+    stage drains them in bulk once writes succeed again. A spooled record
+    the database keeps rejecting (bad data rather than an outage) is moved
+    to the spool's quarantine file after `replay_attempts` tries, so it
+    does not hold up the records behind it.
+    """
+
+    def __init__(self,
+                 name: str,
+                 url: str,
+                 normalise: Callable[[Dict[str, Any]], Any],
+                 key: Callable[[Any], Hashable],
+                 write: Callable[[List[Any]], Awaitable[List[Any]]],
+                 interval: float = 5,
+                 writers: int = 2,
+                 batch_size: int = 500,
+                 queue_size: int = 4,
+                 overflow_policy: str = "merge",
+                 max_pending_rows: int = 100000,
+                 dedupe_ttl: float = 3600,
+                 dedupe_max_keys: int = 200000,
+                 spool: Optional[Spool] = None,
+                 replay_batch_rows: int = 5000,
+                 replay_interval: float = 5,
+                 replay_attempts: int = 3,
+                 log_sample_rate: float = 0.01):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow_policy}")
+
+        self.name = name
+        self.url = url
+        self.normalise = normalise
+        self.key = key
+        self.write = write
+        self.interval = interval
+        self.writers = writers
+        self.batch_size = batch_size
+        self.overflow_policy = overflow_policy
+        self.max_pending_rows = max_pending_rows
+        self.recent_keys = RecentKeys(dedupe_ttl, dedupe_max_keys)
+        self.spool = spool
+        self.replay_batch_rows = replay_batch_rows
+        self.replay_interval = replay_interval
+        self.replay_attempts = replay_attempts
+        self.log_sample_rate = log_sample_rate
+
+        self.raw_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.row_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.write_queue: asyncio.Queue = asyncio.Queue(maxsize=max(writers * 2, 1))
+
+        self.stages = {
+            "fetch": StageStats("fetch"),
+            "decode": StageStats("decode", self.raw_queue),
+            "dedupe": StageStats("dedupe", self.row_queue),
+            "write": StageStats("write", self.write_queue, writers),
+            "replay": StageStats("replay", workers=1 if spool is not None else 0),
+        }
+        self.last_fetch_at: Optional[float] = None
+        self.last_write_at: Optional[float] = None
+        # Callbacks run with every fetched payload, before it is decoded
+        self.fetch_listeners: List[Callable[[List[Dict[str, Any]]], None]] = []
+        # Callbacks run with the rows of every batch that were new, once it has been written
+        self.write_listeners: List[Callable[[List[Any]], None]] = []
+        self._tasks: List[asyncio.Task] = []
+
+    async def run(self):
+        """Run every stage until cancelled"""
+        self._tasks = [
+            asyncio.create_task(self._supervise("fetch", self._fetch_stage)),
+            asyncio.create_task(self._supervise("decode", self._decode_stage)),
+            asyncio.create_task(self._supervise("dedupe", self._dedupe_stage)),
+        ]
+        self._tasks += [asyncio.create_task(self._supervise("write", self._write_stage)) for _ in range(self.writers)]
+        if self.spool is not None:
+            self._tasks.append(asyncio.create_task(self._supervise("replay", self._replay_stage)))
+        try:
+            await asyncio.gather(*self._tasks)
+        finally:
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _supervise(self, name: str, stage: Callable[[], Awaitable[None]], max_delay: float = 60):
+        """
+        Run a stage, restarting it after an error it did not handle itself:
+        one failing stage must not take the others down with it. The delay
+        doubles while it keeps failing right after a restart.
+        """
+        stats = self.stages[name]
+        delay = 0.5
+        while True:
+            started = time.monotonic()
+            stats.running += 1
+            try:
+                return await stage()
+            except Exception as e:
+                delay = 1.0 if time.monotonic() - started > max_delay else min(delay * 2, max_delay)
+                stats.errors += 1
+                stats.restarts += 1
+                stats.last_error = f"{type(e).__name__}: {e}"
+                logger.exception(f"[{self.name}] {name} stage failed, restarting in {delay:.0f}s: {e}")
+            finally:
+                stats.running -= 1
+            await asyncio.sleep(delay)
+
+    def stats(self):
+        """Snapshot of the per-stage gauges"""
+        return {
+            "name": self.name,
+            # Stages with a task down, waiting to be restarted
+            "dead_stages": [stage.name for stage in self.stages.values() if stage.running < stage.workers],
+            "overflow_policy": self.overflow_policy,
+            "dedupe_keys": len(self.recent_keys),
+            "last_fetch_at": self.last_fetch_at,
+            "last_write_at": self.last_write_at,
+            "stages": [stage.to_dict() for stage in self.stages.values()],
+            "spool": self.spool.stats() if self.spool is not None else None,
+        }
+
+    async def _fetch_stage(self):
+        stats = self.stages["fetch"]
+        async with httpx.AsyncClient() as client:
+            while True:
+                started = time.monotonic()
+                # Root span of the cycle; the decode, dedupe and write spans of its payload
+                # are its children and may end after it
+                cycle = tracer.start_span(f"{self.name}.cycle", feed=self.name)
+                try:
+                    with tracer.span("fetch", parent=cycle) as span:
+                        response = await client.get(self.url)
+                        response.raise_for_status()
+                        span.set(status=response.status_code, bytes=len(response.content))
+                    with tracer.span("parse", parent=cycle) as span:
+                        data = response.json()
+                        span.set(rows=len(data))
+                except Exception as e:
+                    stats.errors += 1
+                    cycle.fail(e)
+                    cycle.end()
+                    logger.error(f"[{self.name}] Sync error: {e}")
+                    await asyncio.sleep(10)
+                    continue
+
+                elapsed = time.monotonic() - started
+                stats.observe(elapsed, len(data))
+                self.last_fetch_at = time.time()
+                metrics.FETCH_SECONDS.labels(self.name).observe(elapsed)
+                metrics.PAYLOAD_BYTES.labels(self.name).observe(len(response.content))
+                metrics.ROWS.labels(self.name, "received").inc(len(data))
+                metrics.CYCLE_ROWS.labels(self.name, "received").observe(len(data))
+                log_sampled(logger, self.log_sample_rate, "fetched", feed=self.name,
+                            rows=len(data), bytes=len(response.content), seconds=round(elapsed, 4))
+                for listener in self.fetch_listeners:
+                    try:
+                        listener(data)
+                    except Exception as e:
+                        logger.error(f"[{self.name}] Fetch listener error: {e}")
+                self._offer(data, cycle)
+                cycle.end()
+
+                # Sleep only for what is left of the interval to keep the cadence steady
+                await asyncio.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def _offer(self, data: List[Dict[str, Any]], span: Span):
+        """Queue a fetched payload without blocking, applying the overflow policy when full"""
+        stats = self.stages["fetch"]
+        try:
+            self.raw_queue.put_nowait((data, span))
+            span.set(offer="queued")
+            return
+        except asyncio.QueueFull:
+            pass
+
+        if self.overflow_policy == "drop_newest":
+            stats.dropped += len(data)
+            span.set(offer="dropped", dropped_rows=len(data))
+            return
+
+        oldest, oldest_span = self.raw_queue.get_nowait()
+        if self.overflow_policy == "drop_oldest":
+            stats.dropped += len(oldest)
+            span.set(offer="queued", dropped_rows=len(oldest), dropped_trace=oldest_span.trace_id)
+            self.raw_queue.put_nowait((data, span))
+            return
+
+        # merge: fold the oldest pending payload into the new one; dedupe removes the overlap
+        merged = oldest + data
+        overflow = len(merged) - self.max_pending_rows
+        if overflow > 0:
+            merged = merged[overflow:]
+            stats.dropped += overflow
+        stats.merged += 1
+        span.set(offer="merged", merged_rows=len(oldest), merged_trace=oldest_span.trace_id)
+        self.raw_queue.put_nowait((merged, span))
+
+    async def _decode_stage(self):
+        stats = self.stages["decode"]
+        while True:
+            data, cycle = await self.raw_queue.get()
+            started = time.monotonic()
+            with tracer.span("decode", parent=cycle, rows=len(data)) as span:
+                rows = []
+                for entry in data:
+                    try:
+                        rows.append(self.normalise(entry))
+                    except Exception as e:
+                        stats.errors += 1
+                        logger.error(f"[{self.name}] Decode error: {e}")
+                span.set(errors=len(data) - len(rows))
+            stats.observe(time.monotonic() - started, len(data))
+            await self.row_queue.put((rows, cycle))
+
+    async def _dedupe_stage(self):
+        stats = self.stages["dedupe"]
+        while True:
+            rows, cycle = await self.row_queue.get()
+            started = time.monotonic()
+            now = time.monotonic()
+            with tracer.span("dedupe", parent=cycle, rows=len(rows)) as span:
+                fresh = [row for row in rows if self.recent_keys.add(self.key(row), now)]
+                span.set(fresh=len(fresh))
+            stats.dropped += len(rows) - len(fresh)
+            stats.observe(time.monotonic() - started, len(rows))
+            metrics.ROWS.labels(self.name, "deduped").inc(len(rows) - len(fresh))
+            metrics.CYCLE_ROWS.labels(self.name, "deduped").observe(len(rows) - len(fresh))
+
+            for i in range(0, len(fresh), self.batch_size):
+                batch = fresh[i:i + self.batch_size]
+                if self.spool is None:
+                    await self.write_queue.put((batch, cycle))
+                    continue
+                # Writers are behind: park the batch on disk instead of blocking
+                try:
+                    self.write_queue.put_nowait((batch, cycle))
+                except asyncio.QueueFull:
+                    with tracer.span("spool", parent=cycle, rows=len(batch), reason="backlog"):
+                        await self._spool(batch)
+
+    async def _write_stage(self):
+        stats = self.stages["write"]
+        while True:
+            batch, cycle = await self.write_queue.get()
+            started = time.monotonic()
+            try:
+                with tracer.span("write", parent=cycle, rows=len(batch)) as span:
+                    inserted = await self.write(batch)
+                    span.set(inserted=len(inserted))
+            except Exception as e:
+                stats.errors += 1
+                logger.error(f"[{self.name}] Insert error: {e}")
+                if self.spool is not None:
+                    with tracer.span("spool", parent=cycle, rows=len(batch), reason="write_error"):
+                        await self._spool(batch)
+                else:
+                    self.recent_keys.forget(self.key(row) for row in batch)
+                continue
+            stats.observe(time.monotonic() - started, len(batch))
+            self._written(batch, inserted)
+
+    async def _spool(self, batch: List[Any]):
+        """Append a batch to the spool, falling back to forgetting its keys when the spool is full"""
+        if await asyncio.to_thread(self.spool.append, batch):
+            return
+        self.stages["write"].dropped += len(batch)
+        self.recent_keys.forget(self.key(row) for row in batch)
+        logger.error(f"[{self.name}] Spool full, dropped {len(batch)} rows")
+
+    async def _replay_stage(self):
+        stats = self.stages["replay"]
+        # After a bulk the database rejected, records go one at a time so the bad one can be set aside
+        isolating = False
+        # Rejections of the record at the checkpoint
+        attempts = 0
+        while True:
+            await asyncio.sleep(self.replay_interval)
+            while self.spool.has_pending():
+                started = time.monotonic()
+                with tracer.span(f"{self.name}.replay", feed=self.name) as span:
+                    rows, position = await asyncio.to_thread(
+                        self.spool.read, 1 if isolating else self.replay_batch_rows
+                    )
+                    # Each dedupe key is written at most once per bulk; the write statements
+                    # skip keys already stored, so a batch replayed twice after a crash is a no-op
+                    unique = list({self.key(row): row for row in rows}.values())
+                    span.set(rows=len(rows), unique=len(unique))
+                    inserted = []
+                    try:
+                        if unique:
+                            inserted = await self.write(unique)
+                    except TRANSIENT_ERRORS as e:
+                        stats.errors += 1
+                        span.fail(e)
+                        logger.error(f"[{self.name}] Replay error, retrying later: {e}")
+                        break
+                    except Exception as e:
+                        stats.errors += 1
+                        span.fail(e)
+                        if not isolating:
+                            logger.error(f"[{self.name}] Replay rejected, retrying record by record: {e}")
+                            isolating = True
+                            continue
+                        attempts += 1
+                        if attempts < self.replay_attempts:
+                            logger.error(f"[{self.name}] Replay rejected ({attempts}/{self.replay_attempts}): {e}")
+                            break
+                        await asyncio.to_thread(self.spool.quarantine, position, rows)
+                        stats.dropped += len(rows)
+                        attempts, isolating = 0, False
+                        logger.error(f"[{self.name}] Quarantined {len(rows)} spooled rows the database rejects: {e}")
+                        continue
+                    attempts = 0
+                    span.set(inserted=len(inserted))
+                    await asyncio.to_thread(self.spool.commit, position, len(unique))
+                stats.dropped += len(rows) - len(unique)
+                stats.observe(time.monotonic() - started, len(unique))
+                self._written(unique, inserted)
+            else:
+                isolating = False
+
+    def _written(self, rows: List[Any], inserted: List[Any]):
+        self.last_write_at = time.time()
+        # Writers return the rows that were new; the rest already existed in the table
+        # (a restart, or a spooled batch replayed after it was committed) and must not reach
+        # the listeners, which count what they are given
+        metrics.ROWS.labels(self.name, "inserted").inc(len(inserted))
+        metrics.ROWS.labels(self.name, "deduped").inc(len(rows) - len(inserted))
+        log_sampled(logger, self.log_sample_rate, "inserted", feed=self.name,
+                    rows=len(rows), inserted=len(inserted), sample=rows[0] if rows else None)
+        if not inserted:
+            return
+        for listener in self.write_listeners:
+            try:
+                listener(inserted)
+            except Exception as e:
+                logger.error(f"[{self.name}] Write listener error: {e}")
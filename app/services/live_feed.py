@@ -0,0 +1,77 @@
+from datetime import datetime
+from typing import Any, Dict, List, Tuple
+
+# Rows are plain tuples so batches can be handed to asyncpg column-wise
+VehicleRow = Tuple[str, int, datetime, str]
+StationRow = Tuple[str, Any, Any, float, float]
+
+
+def normalise_vehicle(entry: Dict[str, Any]) -> VehicleRow:
+    """Convert a /live/vehicles entry into a vehicles row"""
+    ts = entry["timestamp"]
+    if isinstance(ts, str):
+        ts = datetime.fromisoformat(ts.replace("Z", "+00:00")).replace(tzinfo=None)
+    return (entry["type"], int(entry["station_id"]), ts, entry.get("status", "ACTIVE"))
+
+
+def vehicle_key(row: VehicleRow):
+    """Dedupe key of a vehicles row: (type, station_id, timestamp)"""
+    return row[:3]
+
+
+def normalise_station(entry: Dict[str, Any]) -> StationRow:
+    """Convert a /live/stations entry into a stations row"""
+    return (
+        entry["station_name"],
+        entry.get("platform_code"),
+        entry.get("zone_id"),
+        float(entry["longitude"]),
+        float(entry["latitude"]),
+    )
+
+
+def station_key(row: StationRow):
+    """Dedupe key of a stations row: (station_name, platform_code)"""
+    return row[:2]
+
+
+async def write_vehicles(db, rows: List[VehicleRow]):
+    """
+    Insert a batch of vehicle rows in one statement, skipping rows already stored.
+    Returns the rows actually inserted.
+
+    ON CONFLICT covers concurrent writers once the unique dedupe index from
+    the migrations exists; NOT EXISTS keeps older databases deduplicated.
+    """
+    types, station_ids, timestamps, statuses = (list(col) for col in zip(*rows))
+    inserted = await db.fetch("""
+        INSERT INTO vehicles (type, station_id, timestamp, status)
+        SELECT t.type, t.station_id, t.timestamp, t.status
+        FROM unnest($1::VARCHAR[], $2::INT[], $3::TIMESTAMP[], $4::VARCHAR[])
+            AS t(type, station_id, timestamp, status)
+        WHERE NOT EXISTS (
+            SELECT 1 FROM vehicles v
+            WHERE v.type = t.type AND v.station_id = t.station_id AND v.timestamp = t.timestamp
+        )
+        ON CONFLICT DO NOTHING
+        RETURNING type, station_id, timestamp, status
+    """, types, station_ids, timestamps, statuses)
+    return [tuple(row) for row in inserted]
+
+
+async def write_stations(db, rows: List[StationRow]):
+    """Insert a batch of station rows in one statement, returning the rows that were new"""
+    names, platforms, zones, longitudes, latitudes = (list(col) for col in zip(*rows))
+    inserted = await db.fetch("""
+        INSERT INTO stations (station_name, platform_code, zone_id, longitude, latitude)
+        SELECT t.station_name, t.platform_code, t.zone_id, t.longitude, t.latitude
+        FROM unnest($1::VARCHAR[], $2::VARCHAR[], $3::VARCHAR[], $4::DOUBLE PRECISION[], $5::DOUBLE PRECISION[])
+            AS t(station_name, platform_code, zone_id, longitude, latitude)
+        WHERE NOT EXISTS (
+            SELECT 1 FROM stations s
+            WHERE s.station_name = t.station_name AND s.platform_code = t.platform_code
+        )
+        ON CONFLICT DO NOTHING
+        RETURNING station_name, platform_code, zone_id, longitude, latitude
+    """, names, platforms, zones, longitudes, latitudes)
+    return [tuple(row) for row in inserted]
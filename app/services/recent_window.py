@@ -0,0 +1,270 @@
+import logging
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_DAY = 86400
+_HOUR = 3600
+
+
+def _epoch(values) -> np.ndarray:
+    """Naive datetimes to int64 epoch seconds, the same clock vehicles.timestamp uses"""
+    return np.array(values, dtype="datetime64[s]").astype(np.int64)
+
+
+def _station_ids(values) -> np.ndarray:
+    """Station ids as int32, -1 for events without a station (the totals and counts skip those)"""
+    return np.array([-1 if value is None else value for value in values], dtype=np.int32)
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _to_datetime(seconds: int) -> datetime:
+    return datetime(1970, 1, 1) + timedelta(seconds=int(seconds))
+
+
+class RecentWindow:
+    """
+    In-memory column store of the most recently ingested vehicle events.
+
+    The last `hours` of events are kept in fixed-size NumPy ring buffers
+    (timestamp, mode code, station id) so the hourly and daily stats can
+    be aggregated with vectorised ops instead of a table scan. All-time
+    per-mode and per-station totals are loaded once from Postgres and then
+    kept current by adding every appended batch to them.
+
+    Queries return None when the requested range is not fully covered by
+    the window, and the caller falls back to SQL.
+    """
+
+    def __init__(self, capacity: int = 2000000, hours: int = 48):
+        self.capacity = capacity
+        self.hours = hours
+        self.ts = np.zeros(capacity, dtype=np.int64)
+        self.mode = np.zeros(capacity, dtype=np.uint8)
+        self.station = np.zeros(capacity, dtype=np.int32)
+        self.size = 0
+        self.head = 0
+
+        self.modes: List[str] = []
+        self._mode_codes: Dict[str, int] = {}
+        self.mode_totals = np.zeros(0, dtype=np.int64)
+        self.station_totals = np.zeros(0, dtype=np.int64)
+
+        self.station_names: List[str] = []
+        self.station_groups = np.zeros(0, dtype=np.int64)
+        self.names_stale = True
+
+        self.ready = False
+        # Epoch second from which every ingested event is held in the buffers
+        self.covered_since = 0
+        # Batches appended while loading, held until the snapshot shows which it already has
+        self._held: Optional[List[Sequence[Tuple]]] = None
+
+    def _mode_code(self, mode: str) -> int:
+        code = self._mode_codes.get(mode)
+        if code is None:
+            code = len(self.modes)
+            self._mode_codes[mode] = code
+            self.modes.append(mode)
+        return code
+
+    async def load(self, db):
+        """
+        Backfill the window and the running totals from one consistent snapshot.
+        Batches appended meanwhile are held back and added once it is in, less
+        the rows the snapshot already has.
+        """
+        since = _utcnow() - timedelta(hours=self.hours)
+        self._held = []
+        try:
+            async with db.acquire() as conn:
+                async with conn.transaction(isolation="repeatable_read", readonly=True):
+                    recent = await conn.fetch(
+                        "SELECT type, station_id, timestamp FROM vehicles WHERE timestamp >= $1", since
+                    )
+                    by_type = await conn.fetch("SELECT type, COUNT(*) AS count FROM vehicles GROUP BY type")
+                    by_station = await conn.fetch(
+                        "SELECT station_id, COUNT(*) AS count FROM vehicles GROUP BY station_id"
+                    )
+
+            self._add_mode_totals(
+                np.array([self._mode_code(row["type"]) for row in by_type], dtype=np.int64),
+                np.array([row["count"] for row in by_type], dtype=np.int64),
+            )
+            ids = np.array([row["station_id"] for row in by_station if row["station_id"] is not None], dtype=np.int64)
+            counts = np.array([row["count"] for row in by_station if row["station_id"] is not None], dtype=np.int64)
+            self._add_station_totals(ids, counts)
+
+            ts = _epoch([row["timestamp"] for row in recent])
+            modes = np.array([self._mode_code(row["type"]) for row in recent], dtype=np.uint8)
+            stations = _station_ids([row["station_id"] for row in recent])
+            self._append_columns(ts, modes, stations)
+            self.covered_since = max(self.covered_since, int(_epoch([since])[0]))
+            await self.refresh_station_names(db)
+            held = [row for rows in self._held for row in rows]
+        finally:
+            self._held = None
+        self.ready = True
+        self.append(self._unseen(held, ts, modes, stations))
+        logger.info(f"Recent window loaded with {self.size} events")
+
+    def _unseen(self, rows: List[Tuple], ts: np.ndarray, modes: np.ndarray, stations: np.ndarray) -> List[Tuple]:
+        """
+        The rows not among the loaded (ts, modes, stations): a vehicle event is
+        unique by type, station and time. Rows from before the window cannot be
+        told apart and count as new.
+        """
+        if not rows:
+            return []
+        row_ts = _epoch([row[2] for row in rows])
+        recent = ts >= row_ts.min()
+        loaded = set(zip(modes[recent].tolist(), stations[recent].tolist(), ts[recent].tolist()))
+        row_stations = _station_ids([row[1] for row in rows]).tolist()
+        return [row for row, station, t in zip(rows, row_stations, row_ts.tolist())
+                if (self._mode_code(row[0]), station, t) not in loaded]
+
+    async def refresh_station_names(self, db):
+        """Reload the station id -> name mapping used to group the station totals"""
+        rows = await db.fetch("SELECT id, station_name FROM stations")
+        names: Dict[str, int] = {}
+        size = max((row["id"] for row in rows), default=-1) + 1
+        groups = np.full(size, -1, dtype=np.int64)
+        for row in rows:
+            groups[row["id"]] = names.setdefault(row["station_name"], len(names))
+        self.station_names = list(names)
+        self.station_groups = groups
+        self.names_stale = False
+
+    def append(self, rows: Sequence[Tuple]):
+        """Add a written batch of (type, station_id, timestamp, status) rows"""
+        if self._held is not None:
+            self._held.append(rows)
+            return
+        # Not loaded yet: the load to come reads them from the database
+        if not rows or not self.ready:
+            return
+        modes = np.array([self._mode_code(row[0]) for row in rows], dtype=np.uint8)
+        stations = _station_ids([row[1] for row in rows])
+        self._append_columns(_epoch([row[2] for row in rows]), modes, stations)
+        ones = np.ones(len(rows), dtype=np.int64)
+        self._add_mode_totals(modes, ones)
+        self._add_station_totals(stations.astype(np.int64), ones)
+
+    def _append_columns(self, ts: np.ndarray, modes: np.ndarray, stations: np.ndarray):
+        n = len(ts)
+        if n == 0:
+            return
+        if n > self.capacity:
+            # The head of a batch larger than the buffer never enters it
+            self.covered_since = max(self.covered_since, int(ts[:-self.capacity].max()) + 1)
+            ts, modes, stations = ts[-self.capacity:], modes[-self.capacity:], stations[-self.capacity:]
+            n = self.capacity
+
+        idx = (self.head + np.arange(n)) % self.capacity
+        if self.size + n > self.capacity:
+            # Overwritten events leave the window, so coverage starts after the newest of them
+            overwritten = idx[self.capacity - self.size:]
+            self.covered_since = max(self.covered_since, int(self.ts[overwritten].max()) + 1)
+        self.ts[idx] = ts
+        self.mode[idx] = modes
+        self.station[idx] = stations
+        self.head = (self.head + n) % self.capacity
+        self.size = min(self.size + n, self.capacity)
+
+    def _add_mode_totals(self, modes: np.ndarray, counts: np.ndarray):
+        self.mode_totals = _grow(self.mode_totals, len(self.modes))
+        np.add.at(self.mode_totals, modes, counts)
+
+    def _add_station_totals(self, stations: np.ndarray, counts: np.ndarray):
+        valid = stations >= 0
+        stations, counts = stations[valid], counts[valid]
+        if len(stations) == 0:
+            return
+        added = np.bincount(stations, weights=counts).astype(np.int64)
+        self.station_totals = _grow(self.station_totals, len(added))
+        self.station_totals[:len(added)] += added
+
+    def _coverage_start(self) -> int:
+        now = int(_epoch([_utcnow()])[0])
+        return max(self.covered_since, now - self.hours * _HOUR)
+
+    def _range(self, start: int, end: int) -> Optional[np.ndarray]:
+        """Boolean mask of buffered events in [start, end), or None if not fully covered"""
+        if not self.ready or start < self._coverage_start():
+            return None
+        ts = self.ts[:self.size]
+        return (ts >= start) & (ts < end)
+
+    def counts_by_mode(self) -> List[Tuple[str, int]]:
+        """All-time event count per vehicle type"""
+        return [(mode, int(count)) for mode, count in zip(self.modes, self.mode_totals) if count]
+
+    def hourly(self, day: date) -> Optional[List[Tuple[datetime, int]]]:
+        """Event count per hour of a day, or None if the day is outside the window"""
+        start = int(_epoch([day])[0])
+        mask = self._range(start, start + _DAY)
+        if mask is None:
+            return None
+        counts = np.bincount((self.ts[:self.size][mask] - start) // _HOUR, minlength=24)
+        return [(_to_datetime(start + h * _HOUR), int(c)) for h, c in enumerate(counts) if c]
+
+    def first_covered_day(self) -> Optional[date]:
+        """First day whose events are all held in the window"""
+        if not self.ready:
+            return None
+        start = self._coverage_start()
+        return _to_datetime(-(-start // _DAY) * _DAY).date()
+
+    def daily(self, start: date, end: date) -> Optional[List[Tuple[date, int]]]:
+        """Event count per day from start to end inclusive, or None if not fully covered"""
+        first = int(_epoch([start])[0])
+        mask = self._range(first, int(_epoch([end])[0]) + _DAY)
+        if mask is None:
+            return None
+        counts = np.bincount((self.ts[:self.size][mask] - first) // _DAY)
+        return [(_to_datetime(first + d * _DAY).date(), int(c)) for d, c in enumerate(counts) if c]
+
+    def top_stations(self, limit: int) -> List[Tuple[str, int]]:
+        """All-time event count per station name, largest first"""
+        n = min(len(self.station_totals), len(self.station_groups))
+        groups = self.station_groups[:n]
+        known = groups >= 0
+        totals = np.bincount(groups[known], weights=self.station_totals[:n][known],
+                             minlength=len(self.station_names)).astype(np.int64)
+        limit = min(limit, int((totals > 0).sum()))
+        if limit <= 0:
+            return []
+        top = np.argpartition(-totals, limit - 1)[:limit]
+        top = top[np.argsort(-totals[top], kind="stable")]
+        return [(self.station_names[i], int(totals[i])) for i in top]
+
+    def station_counts(self, start: int, end: int) -> Optional[np.ndarray]:
+        """Event count per station id in [start, end), or None if not fully covered"""
+        mask = self._range(start, end)
+        if mask is None:
+            return None
+        stations = self.station[:self.size][mask]
+        return np.bincount(stations[stations >= 0]).astype(np.int64)
+
+    def stats(self):
+        return {
+            "ready": self.ready,
+            "events": self.size,
+            "capacity": self.capacity,
+            "hours": self.hours,
+            "covered_since": _to_datetime(self._coverage_start()).isoformat() if self.ready else None,
+        }
+
+
+def _grow(array: np.ndarray, size: int) -> np.ndarray:
+    if len(array) >= size:
+        return array
+    grown = np.zeros(size, dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
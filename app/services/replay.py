@@ -0,0 +1,286 @@
+"""
+Replays of the recorded fleet (app.services.trajectories) as a stream of frames.
+
+A replay walks the time buckets of vehicle_trajectories in order. Each
+bucket is read with one query and decoded into time-sorted columns for the
+whole fleet; buckets that can no longer change are kept in a small LRU
+shared by every replay, so concurrent replays of the same period read and
+decode each bucket once. A replay holds at most the bucket it is playing
+and the next one, plus the last sent state of each vehicle, however long
+its window.
+
+Frames are newline-delimited JSON, one per `step` seconds of fleet time,
+paced to the playback speed:
+
+- a keyframe, {"key": 1, "t": ..., "id": [...], "route": [...], "mode": [...],
+  "lat": [...], "lon": [...], "h": [...]}, lists every vehicle in view;
+  its position in these lists is its index until the next keyframe,
+- a delta frame, {"t": ..., "add": {"i": [...], "id": ..., ...},
+  "move": {"i": [...], "dlat": [...], "dlon": [...], "h": [...]}, "del": [...]},
+  lists only the vehicles that appeared, moved or left since the last frame.
+
+Coordinates are integers in 1e-6 degrees (differences in "move"), headings
+degrees (-1 unknown) and t epoch seconds. The stream ends with {"end": 1}.
+"""
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+from app.core.timestamps import EPOCH
+from app.db import queries
+from app.services.trajectories import BBox, decode_chunk
+
+logger = logging.getLogger(__name__)
+
+
+class Bucket(NamedTuple):
+    """Every sample of one time bucket, sorted by time"""
+    start: int
+    ids: List[str]
+    routes: List[Optional[str]]
+    modes: List[Optional[str]]
+    t: np.ndarray  # epoch seconds
+    vehicle: np.ndarray  # index into ids
+    lat: np.ndarray  # 1e-6 degrees
+    lon: np.ndarray
+    heading: np.ndarray
+
+
+def decode_bucket(start: int, rows) -> Bucket:
+    ids, routes, modes, parts = [], [], [], []
+    for row in rows:
+        chunk = decode_chunk(row["data"])
+        parts.append((len(ids), chunk))
+        ids.append(row["vehicle_id"])
+        routes.append(row["route_id"])
+        modes.append(row["mode"])
+    if not parts:
+        empty = np.zeros(0, dtype=np.int64)
+        return Bucket(start, ids, routes, modes, np.zeros(0), empty, empty, empty, empty)
+    t = np.concatenate([chunk["t"] for _, chunk in parts])
+    order = np.argsort(t, kind="stable")
+    column = lambda name: np.concatenate([chunk[name] for _, chunk in parts])[order]
+    return Bucket(
+        start, ids, routes, modes,
+        start + t[order] / 1000,
+        np.concatenate([np.full(len(chunk["t"]), i, dtype=np.int32) for i, chunk in parts])[order],
+        column("lat"), column("lon"), column("heading"),
+    )
+
+
+class ReplayBuckets:
+    """Decoded buckets shared by the replays of a worker"""
+
+    def __init__(self, db, bucket_seconds: int, capacity: int = 6, settle_seconds: float = 120):
+        self.db = db
+        self.bucket_seconds = bucket_seconds
+        self.capacity = capacity
+        # A bucket still receiving samples is read afresh by every replay
+        self.settle_seconds = settle_seconds
+        self.cache: "OrderedDict[int, Bucket]" = OrderedDict()
+        self.loading: Dict[int, asyncio.Future] = {}
+        self.active = 0
+        self.replays = 0
+        self.frames = 0
+        self.hits = 0
+        self.loads = 0
+        self.load_ms = 0.0
+
+    def settled(self, start: int) -> bool:
+        return start + self.bucket_seconds + self.settle_seconds <= (datetime.utcnow() - EPOCH).total_seconds()
+
+    async def _load(self, start: int) -> Bucket:
+        started = time.perf_counter()
+        rows = await self.db.fetch(queries.TRAJECTORY_BUCKET, EPOCH + timedelta(seconds=start))
+        bucket = await asyncio.to_thread(decode_bucket, start, rows)
+        self.loads += 1
+        self.load_ms += (time.perf_counter() - started) * 1000
+        return bucket
+
+    async def _load_shared(self, start: int) -> Bucket:
+        try:
+            bucket = await self._load(start)
+        finally:
+            del self.loading[start]
+        self.cache[start] = bucket
+        while len(self.cache) > self.capacity:
+            self.cache.popitem(last=False)
+        return bucket
+
+    async def get(self, start: int) -> Bucket:
+        if not self.settled(start):
+            return await self._load(start)
+        bucket = self.cache.get(start)
+        if bucket is not None:
+            self.cache.move_to_end(start)
+            self.hits += 1
+            return bucket
+        if start not in self.loading:
+            self.loading[start] = asyncio.ensure_future(self._load_shared(start))
+        # One replay going away must not cancel the load the others wait on
+        return await asyncio.shield(self.loading[start])
+
+    def stats(self):
+        return {
+            "active": self.active,
+            "replays": self.replays,
+            "frames": self.frames,
+            "cached_buckets": len(self.cache),
+            "cache_hits": self.hits,
+            "bucket_loads": self.loads,
+            "bucket_load_ms": round(self.load_ms / self.loads, 3) if self.loads else None,
+        }
+
+
+def _frame(frame: dict) -> bytes:
+    return json.dumps(frame, separators=(",", ":")).encode() + b"\n"
+
+
+class _Replay:
+    """Fleet state of one replay: the latest sample per vehicle, and what the client was last sent"""
+
+    def __init__(self, bbox: Optional[BBox]):
+        self.area = None if bbox is None else tuple(round(value * 1e6) for value in bbox)
+        # vehicle id -> (lat, lon, heading, t, route, mode), or None once out of view
+        self.latest: Dict[str, Optional[tuple]] = {}
+        # vehicle id -> [index, lat, lon, heading] as the client has it
+        self.sent: Dict[str, list] = {}
+        self.changed = set()
+        self.free: List[int] = []
+        self.next_index = 0
+
+    def take(self, bucket: Bucket, begin: int, end: int):
+        """Take samples begin:end of the bucket; only the last of each vehicle matters"""
+        if begin >= end:
+            return
+        vehicles = bucket.vehicle[begin:end]
+        unique, last = np.unique(vehicles[::-1], return_index=True)
+        rows = end - 1 - last
+        lat, lon = bucket.lat[rows].tolist(), bucket.lon[rows].tolist()
+        heading, t = bucket.heading[rows].tolist(), bucket.t[rows].tolist()
+        for n, v in enumerate(unique.tolist()):
+            sample = (lat[n], lon[n], heading[n], t[n], bucket.routes[v], bucket.modes[v])
+            if self.area is not None:
+                min_lon, min_lat, max_lon, max_lat = self.area
+                if not (min_lat <= sample[0] <= max_lat and min_lon <= sample[1] <= max_lon):
+                    sample = None
+            vehicle = bucket.ids[v]
+            if sample is not None or self.latest.get(vehicle) is not None:
+                self.latest[vehicle] = sample
+                self.changed.add(vehicle)
+
+    def expire(self, before: float):
+        """Vehicles without a sample since `before` leave the view"""
+        for vehicle, sample in self.latest.items():
+            if sample is not None and sample[3] < before:
+                self.latest[vehicle] = None
+                self.changed.add(vehicle)
+
+    def keyframe(self, t: float) -> bytes:
+        self.latest = {vehicle: sample for vehicle, sample in self.latest.items() if sample is not None}
+        self.sent, self.changed, self.free = {}, set(), []
+        frame = {"key": 1, "t": round(t, 3), "id": [], "route": [], "mode": [], "lat": [], "lon": [], "h": []}
+        for index, (vehicle, (lat, lon, heading, _, route, mode)) in enumerate(self.latest.items()):
+            self.sent[vehicle] = [index, lat, lon, heading]
+            for key, value in zip(("id", "route", "mode", "lat", "lon", "h"), (vehicle, route, mode, lat, lon, heading)):
+                frame[key].append(value)
+        self.next_index = len(self.latest)
+        return _frame(frame)
+
+    def delta(self, t: float) -> bytes:
+        add = {"i": [], "id": [], "route": [], "mode": [], "lat": [], "lon": [], "h": []}
+        move = {"i": [], "dlat": [], "dlon": [], "h": []}
+        removed = []
+        for vehicle in self.changed:
+            sample, sent = self.latest.get(vehicle), self.sent.get(vehicle)
+            if sample is None:
+                if sent is not None:
+                    removed.append(sent[0])
+                    self.free.append(sent[0])
+                    del self.sent[vehicle]
+                self.latest.pop(vehicle, None)
+                continue
+            lat, lon, heading, _, route, mode = sample
+            if sent is None:
+                if self.free:
+                    index = self.free.pop()
+                else:
+                    index, self.next_index = self.next_index, self.next_index + 1
+                self.sent[vehicle] = [index, lat, lon, heading]
+                for key, value in zip(("i", "id", "route", "mode", "lat", "lon", "h"),
+                                      (index, vehicle, route, mode, lat, lon, heading)):
+                    add[key].append(value)
+            elif sent[1:] != [lat, lon, heading]:
+                for key, value in zip(("i", "dlat", "dlon", "h"), (sent[0], lat - sent[1], lon - sent[2], heading)):
+                    move[key].append(value)
+                sent[1:] = [lat, lon, heading]
+        self.changed = set()
+        frame = {"t": round(t, 3)}
+        if add["i"]:
+            frame["add"] = add
+        if move["i"]:
+            frame["move"] = move
+        if removed:
+            frame["del"] = removed
+        return _frame(frame)
+
+
+async def replay_frames(buckets: ReplayBuckets, start: float, end: float, speed: float,
+                        bbox: Optional[BBox] = None, frame_interval: float = 0.5,
+                        keyframe_seconds: float = 300, stale_seconds: float = 60) -> AsyncIterator[bytes]:
+    """Frames of the fleet between start and end (epoch seconds), paced to `speed` times real time"""
+    size = buckets.bucket_seconds
+    # One frame per second of fleet time at most; faster playback covers more time per frame
+    step = max(1.0, speed * frame_interval)
+    state = _Replay(bbox)
+    # Vehicles seen shortly before start are on the map in the first keyframe
+    b = int((start - stale_seconds) // size) * size
+    loop = asyncio.get_running_loop()
+    buckets.active += 1
+    buckets.replays += 1
+    upcoming = asyncio.ensure_future(buckets.get(b + size))
+    try:
+        bucket, pos = await buckets.get(b), 0
+        # The earlier samples reach back to the bucket's start: expire the stale ones before the first keyframe
+        t, keyed, expired = start, None, start - stale_seconds
+        wall = loop.time()
+        while True:
+            # Take every sample up to t, moving on to the next bucket once t reaches it
+            while True:
+                stop = int(np.searchsorted(bucket.t, t, side="right"))
+                state.take(bucket, pos, stop)
+                pos = stop
+                if b + size > t:
+                    break
+                b += size
+                bucket, pos = await upcoming, 0
+                upcoming = asyncio.ensure_future(buckets.get(b + size))
+            if t - expired >= stale_seconds:
+                state.expire(t - stale_seconds)
+                expired = t
+            if keyed is None or t - keyed >= keyframe_seconds:
+                yield state.keyframe(t)
+                keyed = t
+            else:
+                yield state.delta(t)
+            buckets.frames += 1
+            if t >= end:
+                break
+            t = min(t + step, end)
+            wall += step / speed
+            delay = wall - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            elif delay < -step / speed:
+                # A slow client: carry on from now rather than sending a burst to catch up
+                wall = loop.time()
+        yield _frame({"end": 1})
+    finally:
+        upcoming.cancel()
+        buckets.active -= 1
@@ -0,0 +1,536 @@
+"""
+Per-route speed, headway and bunching analytics over the live feed.
+
+The ingest leader hands every fetched /live/vehicles payload to
+RouteAnalytics.update (a fetch listener). Only the vehicles whose report
+changed since the previous fetch are processed, as arrays:
+
+- speed: the reported speed, or the distance from the vehicle's previous
+  report over the time between them,
+- position along the route: the report projected onto the longest pattern
+  of its route in the station catalog; its change between reports gives
+  the direction of travel,
+- for every route with a changed vehicle, its vehicles per direction are
+  ordered along the route. The gap to the vehicle ahead, over the route's
+  recent average speed, is the headway. Consecutive vehicles closer than
+  the bunching distance start a bunching event until they separate again.
+
+Speeds, headways and bunching events are summed into one-minute slots of
+a rolling window (routes x slots arrays), which the endpoints aggregate
+and which are upserted into route_stats every persist interval, with the
+events into bunching_events. Workers that do not ingest answer the same
+endpoints from those tables.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from app.core.timestamps import EPOCH, epoch_seconds
+from app.db import queries
+from app.services.catalog import StationCatalog
+from app.services.transit_graph import haversine
+
+logger = logging.getLogger(__name__)
+
+# Rolling sums per route and slot
+SUMS = ("speed_sum", "speed_count", "headway_sum", "headway_sq", "headway_count", "bunching")
+
+# Movement along the route (m) below which the direction of travel is left as it was
+DIRECTION_MIN_M = 5.0
+# Speed assumed for headways before a route has any (m/s)
+DEFAULT_SPEED = 5.0
+
+UPSERT_STATS = """
+    INSERT INTO route_stats AS s
+        (route_id, bucket, speed_sum, speed_count, headway_sum, headway_sq, headway_count, bunching)
+    SELECT * FROM unnest($1::VARCHAR[], $2::TIMESTAMP[], $3::DOUBLE PRECISION[], $4::INT[], $5::DOUBLE PRECISION[],
+                         $6::DOUBLE PRECISION[], $7::INT[], $8::INT[])
+    ON CONFLICT (route_id, bucket) DO UPDATE SET
+        speed_sum = EXCLUDED.speed_sum,
+        speed_count = EXCLUDED.speed_count,
+        headway_sum = EXCLUDED.headway_sum,
+        headway_sq = EXCLUDED.headway_sq,
+        headway_count = EXCLUDED.headway_count,
+        bunching = EXCLUDED.bunching
+"""
+
+INSERT_EVENTS = """
+    INSERT INTO bunching_events (route_id, at, vehicle_a, vehicle_b, distance_m)
+    SELECT * FROM unnest($1::VARCHAR[], $2::TIMESTAMP[], $3::VARCHAR[], $4::VARCHAR[], $5::DOUBLE PRECISION[])
+    ON CONFLICT DO NOTHING
+"""
+
+EXPIRE_STATS = "DELETE FROM route_stats WHERE bucket < $1"
+EXPIRE_EVENTS = "DELETE FROM bunching_events WHERE at < $1"
+
+
+def _timestamp(seconds: float) -> datetime:
+    return EPOCH + timedelta(seconds=seconds)
+
+
+def summary(route_id: str, sums: Dict[str, float], vehicles: Optional[int] = None) -> dict:
+    """One route's figures from its summed slots, the same for memory and route_stats"""
+    sums = {name: float(value) for name, value in sums.items()}
+    headways = sums["headway_count"]
+    mean = sums["headway_sum"] / headways if headways else None
+    cv = None
+    if headways > 1 and mean:
+        variance = max(sums["headway_sq"] / headways - mean * mean, 0.0)
+        cv = round(variance ** 0.5 / mean, 3)
+    result = {
+        "route_id": route_id,
+        "avg_speed": round(sums["speed_sum"] / sums["speed_count"], 2) if sums["speed_count"] else None,
+        "samples": int(sums["speed_count"]),
+        "headway_mean_s": round(mean, 1) if mean is not None else None,
+        "headway_cv": cv,
+        "bunching_events": int(sums["bunching"]),
+    }
+    if vehicles is not None:
+        result["vehicles"] = vehicles
+    return result
+
+
+class RouteShape:
+    """A route's longest catalog pattern as a polyline in local metres"""
+
+    def __init__(self, lat: np.ndarray, lon: np.ndarray):
+        self.scale = np.cos(np.radians(lat.mean())) * 111_320.0
+        self.x, self.y = lon * self.scale, lat * 110_540.0
+        self.dx, self.dy = np.diff(self.x), np.diff(self.y)
+        self.length2 = np.maximum(self.dx ** 2 + self.dy ** 2, 1e-9)
+        self.offsets = np.concatenate(([0.0], np.cumsum(np.sqrt(self.dx ** 2 + self.dy ** 2))))
+
+    def project(self, lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+        """Distance along the polyline (m) of the nearest point to each position"""
+        px, py = (lon * self.scale)[:, None], (lat * 110_540.0)[:, None]
+        t = np.clip(((px - self.x[:-1]) * self.dx + (py - self.y[:-1]) * self.dy) / self.length2, 0.0, 1.0)
+        d2 = (self.x[:-1] + t * self.dx - px) ** 2 + (self.y[:-1] + t * self.dy - py) ** 2
+        segment = np.argmin(d2, axis=1)
+        rows = np.arange(len(lat))
+        return self.offsets[segment] + t[rows, segment] * np.sqrt(self.length2[segment])
+
+
+class RouteAnalytics:
+    """Rolling per-route analytics, updated from the vehicles that changed in each fetch"""
+
+    def __init__(self, slot_seconds: int = 60, window_minutes: int = 60, bunching_m: float = 200,
+                 vehicle_ttl: float = 120, max_events: int = 1000, retention_days: float = 30):
+        self.slot_seconds = slot_seconds
+        self.slots = max(1, window_minutes * 60 // slot_seconds)
+        self.bunching_m = bunching_m
+        self.vehicle_ttl = vehicle_ttl
+        self.retention_days = retention_days
+
+        # Vehicles, as parallel arrays indexed through vehicle_index
+        self.vehicle_index: Dict[str, int] = {}
+        self.vehicle_ids: List[Optional[str]] = []
+        self.free: List[int] = []
+        capacity = 1024
+        self.v_route = np.full(capacity, -1, dtype=np.int32)
+        self.v_ts = np.full(capacity, np.nan)
+        self.v_lat = np.zeros(capacity)
+        self.v_lon = np.zeros(capacity)
+        self.v_along = np.full(capacity, np.nan)
+        self.v_dir = np.zeros(capacity, dtype=np.int8)
+
+        # Routes: the rolling sums and the vehicles on each
+        self.route_index: Dict[str, int] = {}
+        self.route_ids: List[str] = []
+        self.members: List[Set[int]] = []
+        self.sums = {name: np.zeros((64, self.slots)) for name in SUMS}
+        # Slot number held by each column of the sums, -1 when empty
+        self.slot_held = np.full(self.slots, -1, dtype=np.int64)
+        self.current_slot = -1
+
+        self.shapes: Dict[str, RouteShape] = {}
+        # Route -> pairs of vehicles bunched as of the last update
+        self.bunched: Dict[int, Set[Tuple[str, str]]] = {}
+        self.events: deque = deque(maxlen=max_events)
+        self.unsaved_events: List[tuple] = []
+        # (route, column) of the sums changed since the last persist
+        self.dirty: Set[Tuple[int, int]] = set()
+
+        self.updates = 0
+        self.changed = 0
+        self.errors = 0
+        self.last_update_ms = 0.0
+        self.persisted = 0
+        self.persist_errors = 0
+        self.expired_at = 0.0
+
+    # Catalog
+
+    def set_catalog(self, catalog: StationCatalog):
+        """Catalog listener: the polylines of the routes, from their longest pattern"""
+        arrays = catalog.arrays
+        offsets, stops, pattern_route = arrays["pattern_offsets"], arrays["pattern_stops"], arrays["pattern_route"]
+        longest: Dict[int, int] = {}
+        for p in range(len(pattern_route)):
+            route = int(pattern_route[p])
+            if route not in longest or offsets[p + 1] - offsets[p] > offsets[longest[route] + 1] - offsets[longest[route]]:
+                longest[route] = p
+        shapes = {}
+        for route, p in longest.items():
+            calls = stops[offsets[p]:offsets[p + 1]]
+            if len(calls) >= 2:
+                shapes[catalog.route_ids[route]] = RouteShape(catalog.latitude[calls], catalog.longitude[calls])
+        self.shapes = shapes
+        # Positions along the old shapes do not compare with the new ones
+        self.v_along[:] = np.nan
+
+    # Bookkeeping
+
+    def _vehicle(self, vehicle_id: str) -> int:
+        i = self.vehicle_index.get(vehicle_id)
+        if i is not None:
+            return i
+        if self.free:
+            i = self.free.pop()
+            self.vehicle_ids[i] = vehicle_id
+        else:
+            i = len(self.vehicle_ids)
+            self.vehicle_ids.append(vehicle_id)
+            if i >= len(self.v_route):
+                grow = len(self.v_route)
+                self.v_route = np.concatenate((self.v_route, np.full(grow, -1, dtype=np.int32)))
+                self.v_ts = np.concatenate((self.v_ts, np.full(grow, np.nan)))
+                self.v_lat = np.concatenate((self.v_lat, np.zeros(grow)))
+                self.v_lon = np.concatenate((self.v_lon, np.zeros(grow)))
+                self.v_along = np.concatenate((self.v_along, np.full(grow, np.nan)))
+                self.v_dir = np.concatenate((self.v_dir, np.zeros(grow, dtype=np.int8)))
+        self.vehicle_index[vehicle_id] = i
+        self.v_route[i], self.v_ts[i], self.v_along[i], self.v_dir[i] = -1, np.nan, np.nan, 0
+        return i
+
+    def _route(self, route_id: str) -> int:
+        r = self.route_index.get(route_id)
+        if r is None:
+            r = self.route_index[route_id] = len(self.route_ids)
+            self.route_ids.append(route_id)
+            self.members.append(set())
+            if r >= len(self.sums["speed_sum"]):
+                for name in SUMS:
+                    self.sums[name] = np.concatenate((self.sums[name], np.zeros_like(self.sums[name])))
+        return r
+
+    def _advance(self, slot: int) -> bool:
+        """Make `slot` the newest slot, clearing the columns of the slots it pushes out of the window"""
+        if slot <= self.current_slot:
+            return False
+        first = max(self.current_slot + 1, slot - self.slots + 1)
+        for s in range(first, slot + 1):
+            column = s % self.slots
+            for name in SUMS:
+                self.sums[name][:, column] = 0
+            self.slot_held[column] = s
+        self.current_slot = slot
+        return True
+
+    def _expire(self, before: float):
+        """Forget the vehicles silent since `before` (feed time); runs once a slot"""
+        silent = [v for v, i in self.vehicle_index.items() if self.v_ts[i] < before]
+        for vehicle in silent:
+            i = self.vehicle_index.pop(vehicle)
+            if self.v_route[i] >= 0:
+                self.members[self.v_route[i]].discard(i)
+            self.vehicle_ids[i] = None
+            self.v_route[i], self.v_ts[i] = -1, np.nan
+            self.free.append(i)
+
+    def _columns(self, slots: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Columns of the slots that are still in the window, and which of them are"""
+        columns = slots % self.slots
+        return columns, self.slot_held[columns] == slots
+
+    # Updates
+
+    def update(self, entries: List[Dict[str, Any]]):
+        """Take the vehicles that changed in a fetched /live/vehicles payload; a fetch listener"""
+        started = time.perf_counter()
+        changed, routes, ts, lat, lon, speed = [], [], [], [], [], []
+        for entry in entries:
+            try:
+                vehicle, route_id = str(entry["id"]), entry.get("route_id")
+                at = epoch_seconds(entry["timestamp"])
+                i = self.vehicle_index.get(vehicle)
+                if not route_id or (i is not None and at <= self.v_ts[i]):
+                    continue
+                position = (float(entry["latitude"]), float(entry["longitude"]))
+                reported = entry.get("speed")
+                reported = float(reported) if reported is not None else np.nan
+            except Exception:
+                self.errors += 1
+                continue
+            changed.append(self._vehicle(vehicle) if i is None else i)
+            routes.append(self._route(route_id))
+            ts.append(at)
+            lat.append(position[0])
+            lon.append(position[1])
+            speed.append(reported)
+        self.updates += 1
+        if not changed:
+            return
+        idx = np.array(changed, dtype=np.int64)
+        route = np.array(routes, dtype=np.int32)
+        ts, lat, lon, speed = np.array(ts), np.array(lat), np.array(lon), np.array(speed)
+        advanced = self._advance(int(ts.max() // self.slot_seconds))
+
+        # Speed from the previous report where none was given
+        previous_ts = self.v_ts[idx]
+        moved = haversine(self.v_lat[idx], self.v_lon[idx], lat, lon)
+        elapsed = ts - previous_ts
+        derived = np.where((elapsed > 0) & (elapsed <= self.vehicle_ttl), moved / np.where(elapsed > 0, elapsed, 1), np.nan)
+        speed = np.where(np.isnan(speed), derived, speed)
+        columns, live = self._columns((ts // self.slot_seconds).astype(np.int64))
+        known = live & ~np.isnan(speed)
+        np.add.at(self.sums["speed_sum"], (route[known], columns[known]), speed[known])
+        np.add.at(self.sums["speed_count"], (route[known], columns[known]), 1)
+        self.dirty.update(zip(route[known].tolist(), columns[known].tolist()))
+
+        # Route membership follows the reported route
+        moved_route = self.v_route[idx] != route
+        for i, old, new in zip(idx[moved_route].tolist(), self.v_route[idx[moved_route]].tolist(),
+                               route[moved_route].tolist()):
+            if old >= 0:
+                self.members[old].discard(i)
+            self.members[new].add(i)
+            self.v_along[i], self.v_dir[i] = np.nan, 0
+        self.v_route[idx], self.v_ts[idx], self.v_lat[idx], self.v_lon[idx] = route, ts, lat, lon
+
+        # Position along the route and direction of travel, one projection per route
+        order = np.argsort(route, kind="stable")
+        bounds = np.flatnonzero(np.diff(route[order])) + 1
+        for group in np.split(order, bounds):
+            shape = self.shapes.get(self.route_ids[route[group[0]]])
+            if shape is None:
+                continue
+            vehicles = idx[group]
+            along = shape.project(lat[group], lon[group])
+            step = along - self.v_along[vehicles]
+            forward = np.where(step > DIRECTION_MIN_M, 1, np.where(step < -DIRECTION_MIN_M, -1, 0))
+            self.v_dir[vehicles] = np.where(np.isnan(step) | (forward == 0), self.v_dir[vehicles], forward)
+            self.v_along[vehicles] = along
+
+        for r in np.unique(route).tolist():
+            self._spacing(r)
+        if advanced:
+            self._expire(ts.max() - self.vehicle_ttl)
+        self.changed += len(idx)
+        self.last_update_ms = (time.perf_counter() - started) * 1000
+
+    def _spacing(self, r: int):
+        """Headways and bunching on route r from its vehicles' order along the route"""
+        members = np.fromiter(self.members[r], dtype=np.int64, count=len(self.members[r]))
+        if len(members) < 2:
+            self.bunched.pop(r, None)
+            return
+        along, direction = self.v_along[members], self.v_dir[members]
+        usable = ~np.isnan(along) & (direction != 0)
+        column = self.current_slot % self.slots
+        speed_count = self.sums["speed_count"][r].sum()
+        speed = self.sums["speed_sum"][r].sum() / speed_count if speed_count else DEFAULT_SPEED
+        bunched = set()
+        for sign in (1, -1):
+            mine = members[usable & (direction == sign)]
+            if len(mine) < 2:
+                continue
+            ranked = mine[np.argsort(self.v_along[mine] * sign)]
+            gaps = np.diff(self.v_along[ranked] * sign)
+            headways = gaps / max(speed, 0.5)
+            self.sums["headway_sum"][r, column] += headways.sum()
+            self.sums["headway_sq"][r, column] += (headways ** 2).sum()
+            self.sums["headway_count"][r, column] += len(headways)
+            for k in np.flatnonzero(gaps < self.bunching_m).tolist():
+                behind, ahead = self.vehicle_ids[ranked[k]], self.vehicle_ids[ranked[k + 1]]
+                bunched.add((behind, ahead))
+        started = bunched - self.bunched.get(r, set())
+        if started:
+            self.sums["bunching"][r, column] += len(started)
+            route_id = self.route_ids[r]
+            for behind, ahead in sorted(started):
+                a, b = self.vehicle_index[behind], self.vehicle_index[ahead]
+                event = (route_id, float(max(self.v_ts[a], self.v_ts[b])), behind, ahead,
+                         round(float(abs(self.v_along[a] - self.v_along[b])), 1))
+                self.events.append(event)
+                self.unsaved_events.append(event)
+        self.bunched[r] = bunched
+        self.dirty.add((r, column))
+
+    # Reading
+
+    def _window_sums(self, minutes: int) -> Tuple[Dict[str, np.ndarray], np.ndarray]:
+        """Sums per route over the last `minutes` of the window"""
+        slots = np.arange(self.current_slot - max(1, minutes * 60 // self.slot_seconds) + 1, self.current_slot + 1)
+        columns, live = self._columns(slots)
+        n = len(self.route_ids)
+        return {name: self.sums[name][:n][:, columns[live]].sum(axis=1) for name in SUMS}, columns[live]
+
+    def routes(self, minutes: int) -> dict:
+        sums, _ = self._window_sums(minutes)
+        result = []
+        for r, route_id in enumerate(self.route_ids):
+            if sums["speed_count"][r] or sums["headway_count"][r] or self.members[r]:
+                result.append(summary(route_id, {name: sums[name][r] for name in SUMS}, len(self.members[r])))
+        return {"as_of": self.as_of(), "window_minutes": minutes, "routes": result}
+
+    def route(self, route_id: str, minutes: int) -> Optional[dict]:
+        r = self.route_index.get(route_id)
+        if r is None:
+            return None
+        sums, columns = self._window_sums(minutes)
+        detail = summary(route_id, {name: sums[name][r] for name in SUMS}, len(self.members[r]))
+        detail["as_of"], detail["window_minutes"] = self.as_of(), minutes
+        detail["slots"] = []
+        for c in sorted(columns.tolist(), key=lambda c: self.slot_held[c]):
+            slot = summary(route_id, {name: self.sums[name][r, c] for name in SUMS})
+            del slot["route_id"]
+            detail["slots"].append({"start": _timestamp(float(self.slot_held[c]) * self.slot_seconds).isoformat(), **slot})
+        detail["positions"] = self.positions(r)
+        detail["bunching"] = self.bunching(100, route_id)
+        return detail
+
+    def positions(self, r: int) -> List[dict]:
+        """The route's vehicles in order along the route per direction, with the gap to the one ahead"""
+        members = [i for i in self.members[r] if not np.isnan(self.v_along[i]) and self.v_dir[i] != 0]
+        result = []
+        for sign in (1, -1):
+            ranked = sorted((i for i in members if self.v_dir[i] == sign), key=lambda i: self.v_along[i] * sign)
+            for k, i in enumerate(ranked):
+                ahead = ranked[k + 1] if k + 1 < len(ranked) else None
+                result.append({
+                    "id": self.vehicle_ids[i],
+                    "direction": sign,
+                    "along_m": round(float(self.v_along[i]), 1),
+                    "gap_m": round(float(abs(self.v_along[ahead] - self.v_along[i])), 1) if ahead is not None else None,
+                })
+        return result
+
+    def bunching(self, limit: int, route_id: Optional[str] = None) -> List[dict]:
+        events = (e for e in reversed(self.events) if route_id is None or e[0] == route_id)
+        return [self._event(e) for _, e in zip(range(limit), events)]
+
+    @staticmethod
+    def _event(event: tuple) -> dict:
+        route_id, at, behind, ahead, distance = event
+        return {"route_id": route_id, "at": _timestamp(at).isoformat(), "vehicles": [behind, ahead],
+                "distance_m": distance}
+
+    def as_of(self) -> Optional[str]:
+        if self.current_slot < 0:
+            return None
+        return _timestamp(float(self.current_slot + 1) * self.slot_seconds).isoformat()
+
+    # Persistence
+
+    async def persist(self, db):
+        """Upsert the route slots that changed since the last call, and append the new events"""
+        dirty, self.dirty = self.dirty, set()
+        events, self.unsaved_events = self.unsaved_events, []
+        rows = []
+        for r, c in dirty:
+            if self.sums["speed_count"][r, c] or self.sums["headway_count"][r, c] or self.sums["bunching"][r, c]:
+                rows.append((self.route_ids[r], _timestamp(float(self.slot_held[c]) * self.slot_seconds),
+                             *(float(self.sums[name][r, c]) if name in ("speed_sum", "headway_sum", "headway_sq")
+                               else int(self.sums[name][r, c]) for name in SUMS)))
+        try:
+            async with db.acquire() as conn:
+                async with conn.transaction():
+                    if rows:
+                        await conn.execute(UPSERT_STATS, *(list(column) for column in zip(*rows)))
+                    if events:
+                        await conn.execute(INSERT_EVENTS, [e[0] for e in events], [_timestamp(e[1]) for e in events],
+                                           [e[2] for e in events], [e[3] for e in events], [e[4] for e in events])
+        except Exception:
+            # Try them again with the next call
+            self.dirty |= dirty
+            self.unsaved_events[:0] = events
+            self.persist_errors += 1
+            raise
+        self.persisted += len(rows)
+
+    async def expire(self, db):
+        cutoff = datetime.utcnow() - timedelta(days=self.retention_days)
+        async with db.acquire() as conn:
+            await conn.execute(EXPIRE_STATS, cutoff)
+            await conn.execute(EXPIRE_EVENTS, cutoff)
+        self.expired_at = time.time()
+
+    async def run(self, db, interval: float):
+        """Persist every interval, and drop the slots and events past the retention once an hour"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.persist(db)
+            except Exception as e:
+                logger.error(f"[analytics] Persist failed: {e}")
+                continue
+            if self.retention_days and time.time() - self.expired_at > 3600:
+                try:
+                    await self.expire(db)
+                except Exception as e:
+                    logger.error(f"[analytics] Expire failed: {e}")
+
+    def stats(self):
+        return {
+            "vehicles": len(self.vehicle_index),
+            "routes": len(self.route_ids),
+            "routes_with_shape": len(self.shapes),
+            "updates": self.updates,
+            "changed_vehicles": self.changed,
+            "last_update_ms": round(self.last_update_ms, 3),
+            "bunching_events": len(self.events),
+            "persisted_rows": self.persisted,
+            "persist_errors": self.persist_errors,
+            "errors": self.errors,
+        }
+
+
+# The same figures from route_stats and bunching_events, for the workers that do not ingest
+
+def _stored_event(row) -> dict:
+    return {"route_id": row["route_id"], "at": row["at"].isoformat(), "vehicles": [row["vehicle_a"], row["vehicle_b"]],
+            "distance_m": row["distance_m"]}
+
+
+async def _window_start(db, minutes: int, slot_seconds: int) -> Tuple[Optional[datetime], Optional[str]]:
+    latest = await db.fetchval(queries.ROUTE_STATS_LATEST)
+    if latest is None:
+        return None, None
+    return latest - timedelta(minutes=minutes), (latest + timedelta(seconds=slot_seconds)).isoformat()
+
+
+async def stored_routes(db, minutes: int, slot_seconds: int) -> dict:
+    since, as_of = await _window_start(db, minutes, slot_seconds)
+    rows = await db.fetch(queries.ROUTE_STATS_WINDOW, since) if since is not None else []
+    return {"as_of": as_of, "window_minutes": minutes,
+            "routes": [summary(row["route_id"], {name: row[name] for name in SUMS}) for row in rows]}
+
+
+async def stored_route(db, route_id: str, minutes: int, slot_seconds: int) -> Optional[dict]:
+    since, as_of = await _window_start(db, minutes, slot_seconds)
+    rows = await db.fetch(queries.ROUTE_STATS_SLOTS, route_id, since) if since is not None else []
+    if not rows:
+        return None
+    detail = summary(route_id, {name: sum(row[name] for row in rows) for name in SUMS})
+    detail["as_of"], detail["window_minutes"] = as_of, minutes
+    detail["slots"] = []
+    for row in rows:
+        slot = summary(route_id, {name: row[name] for name in SUMS})
+        del slot["route_id"]
+        detail["slots"].append({"start": row["bucket"].isoformat(), **slot})
+    events = await db.fetch(queries.ROUTE_BUNCHING_EVENTS, route_id, 100)
+    detail["bunching"] = [_stored_event(row) for row in events]
+    return detail
+
+
+async def stored_bunching(db, limit: int, route_id: Optional[str] = None) -> List[dict]:
+    if route_id is None:
+        rows = await db.fetch(queries.BUNCHING_EVENTS, limit)
+    else:
+        rows = await db.fetch(queries.ROUTE_BUNCHING_EVENTS, route_id, limit)
+    return [_stored_event(row) for row in rows]
@@ -0,0 +1,210 @@
+import logging
+import os
+import pickle
+import struct
+import threading
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Every record is a zlib-compressed pickled batch prefixed by its length and CRC32
+_HEADER = struct.Struct(">II")
+
+# (segment sequence number, byte offset inside that segment)
+Position = Tuple[int, int]
+
+
+class Spool:
+    """
+    Segmented append-only spool of row batches on local disk.
+
+    Batches are appended to the newest segment and read back from a
+    checkpoint that only moves forward once the caller confirms the rows
+    were written, so a crash never loses spooled rows. Fully consumed
+    segments are deleted, and when the spool reaches its size limit the
+    oldest segment is dropped to keep disk usage bounded.
+    """
+
+    def __init__(self, directory: str, name: str,
+                 segment_bytes: int = 8 * 1024 * 1024,
+                 max_bytes: int = 512 * 1024 * 1024):
+        self.directory = directory
+        self.name = name
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+
+        self.appended_rows = 0
+        self.replayed_rows = 0
+        self.dropped_segments = 0
+        self.quarantined_rows = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._sizes: Dict[int, int] = {}
+        for filename in os.listdir(directory):
+            if filename.startswith(f"{name}-") and filename.endswith(".seg"):
+                seq = int(filename[len(name) + 1:-4])
+                self._sizes[seq] = os.path.getsize(self._path(seq))
+        self._active = None
+        self._checkpoint = self._load_checkpoint()
+
+    def _path(self, seq: int) -> str:
+        return os.path.join(self.directory, f"{self.name}-{seq:010d}.seg")
+
+    def _checkpoint_path(self) -> str:
+        return os.path.join(self.directory, f"{self.name}.checkpoint")
+
+    def _load_checkpoint(self) -> Position:
+        first = min(self._sizes) if self._sizes else 0
+        try:
+            with open(self._checkpoint_path()) as f:
+                seq, offset = (int(part) for part in f.read().split())
+        except (OSError, ValueError):
+            return (first, 0)
+        # The checkpointed segment may have been consumed or dropped since
+        return (seq, offset) if seq in self._sizes else (first, 0)
+
+    def _save_checkpoint(self):
+        tmp = self._checkpoint_path() + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(f"{self._checkpoint[0]} {self._checkpoint[1]}")
+        os.replace(tmp, self._checkpoint_path())
+
+    def _quarantine_path(self) -> str:
+        return os.path.join(self.directory, f"{self.name}.quarantine")
+
+    # Appends and commits run in worker threads and change _sizes, so readers take the lock too
+
+    @property
+    def size(self) -> int:
+        with self.lock:
+            return self._size()
+
+    def _size(self) -> int:
+        return sum(self._sizes.values())
+
+    def has_pending(self) -> bool:
+        """Whether there are spooled records past the checkpoint"""
+        with self.lock:
+            return self._has_pending()
+
+    def _has_pending(self) -> bool:
+        seq, offset = self._checkpoint
+        return any(s > seq or (s == seq and size > offset) for s, size in self._sizes.items())
+
+    def append(self, rows: List[Any]) -> bool:
+        """Append a batch, returning False if it does not fit within max_bytes"""
+        payload = zlib.compress(pickle.dumps(rows, protocol=pickle.HIGHEST_PROTOCOL))
+        record = _HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+        with self.lock:
+            while self._size() + len(record) > self.max_bytes and len(self._sizes) > 1:
+                self._drop_oldest()
+            if self._size() + len(record) > self.max_bytes:
+                return False
+
+            if self._active is None or self._sizes[max(self._sizes)] + len(record) > self.segment_bytes:
+                self._roll()
+            self._active.write(record)
+            self._active.flush()
+            self._sizes[max(self._sizes)] += len(record)
+            self.appended_rows += len(rows)
+            return True
+
+    def read(self, max_rows: int) -> Tuple[List[Any], Position]:
+        """Read batches after the checkpoint until at least max_rows rows are collected"""
+        rows: List[Any] = []
+        with self.lock:
+            seq, offset = self._checkpoint
+            for current in sorted(s for s in self._sizes if s >= seq):
+                if current != seq:
+                    seq, offset = current, 0
+                with open(self._path(seq), "rb") as f:
+                    f.seek(offset)
+                    while len(rows) < max_rows:
+                        batch = self._read_record(f)
+                        if batch is None:
+                            break
+                        rows.extend(batch)
+                        offset = f.tell()
+                if len(rows) >= max_rows:
+                    break
+        return rows, (seq, offset)
+
+    def commit(self, position: Position, rows: int = 0):
+        """Move the checkpoint to a position returned by read() and delete consumed segments"""
+        with self.lock:
+            self._checkpoint = position
+            self.replayed_rows += rows
+            seq, offset = position
+            for old in [s for s in self._sizes if s < seq]:
+                self._remove(old)
+            # Start over with a fresh segment once everything has been consumed
+            if seq in self._sizes and self._sizes[seq] == offset and seq == max(self._sizes):
+                self._remove(seq)
+                self._checkpoint = (seq + 1, 0)
+            self._save_checkpoint()
+
+    def quarantine(self, position: Position, rows: List[Any]):
+        """
+        Set aside rows the database keeps rejecting, appended to the
+        quarantine file in the segment record format, and commit past them
+        """
+        payload = zlib.compress(pickle.dumps(rows, protocol=pickle.HIGHEST_PROTOCOL))
+        with self.lock:
+            with open(self._quarantine_path(), "ab") as f:
+                f.write(_HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+            self.quarantined_rows += len(rows)
+        self.commit(position)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "segments": len(self._sizes),
+                "bytes": self._size(),
+                "max_bytes": self.max_bytes,
+                "pending": self._has_pending(),
+                "appended_rows": self.appended_rows,
+                "replayed_rows": self.replayed_rows,
+                "dropped_segments": self.dropped_segments,
+                "quarantined_rows": self.quarantined_rows,
+            }
+
+    def _read_record(self, f) -> Optional[List[Any]]:
+        header = f.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            return None
+        length, crc = _HEADER.unpack(header)
+        payload = f.read(length)
+        # A short or corrupt record is a torn write at the tail of the segment
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            f.seek(0, os.SEEK_END)
+            return None
+        return pickle.loads(zlib.decompress(payload))
+
+    def _roll(self):
+        if self._active is not None:
+            self._active.close()
+        seq = max(max(self._sizes, default=-1) + 1, self._checkpoint[0])
+        self._active = open(self._path(seq), "ab")
+        self._sizes[seq] = 0
+
+    def _remove(self, seq: int):
+        if self._active is not None and seq == max(self._sizes):
+            self._active.close()
+            self._active = None
+        self._sizes.pop(seq, None)
+        try:
+            os.remove(self._path(seq))
+        except FileNotFoundError:
+            pass
+
+    def _drop_oldest(self):
+        oldest = min(self._sizes)
+        logger.error(f"[{self.name}] Spool full, dropping segment {oldest}")
+        self._remove(oldest)
+        self.dropped_segments += 1
+        if self._checkpoint[0] <= oldest:
+            self._checkpoint = (min(self._sizes), 0)
+            self._save_checkpoint()
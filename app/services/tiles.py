@@ -0,0 +1,321 @@
+"""
+Density tiles of the live fleet and of station activity for the map.
+
+Points are indexed by the Morton code of the zoom-ZOOM Web Mercator tile
+they fall in, sorted. The points of any tile z/x/y (z <= ZOOM) then share
+one contiguous code range, found with two binary searches, and the top bits
+of their codes below the tile's own give the cell of a grid-by-grid density
+grid over the tile without touching coordinates again.
+
+A tile with few points lists them; a busier one is a density grid: the
+non-empty cells with their point count, summed weight and centroid, which
+the map draws as a heatmap or as clusters.
+
+Each update of an index compares the new points with the previous ones by
+key and records the codes of those that appeared, moved, left or changed.
+A cached tile is reused for as long as none of the changes since it was
+built fall in its code range, so its body and ETag only change when its
+own points do.
+"""
+import hashlib
+import json
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+from typing import Deque, Dict, Optional, Tuple
+
+import numpy as np
+
+from app.db import queries
+from app.services.fleet_snapshot import MODES
+
+ZOOM = 24  # zoom of the index codes; 48 bits of interleaved tile x and y
+MAX_LATITUDE = 85.0511287798
+
+# Masks after spreading the bits of a 32-bit value 16, 8, 4, 2 and 1 places apart
+_MASKS = [0x0000FFFF0000FFFF, 0x00FF00FF00FF00FF, 0x0F0F0F0F0F0F0F0F, 0x3333333333333333, 0x5555555555555555]
+_SHIFTS = [16, 8, 4, 2, 1]
+
+
+def _spread(v: np.ndarray) -> np.ndarray:
+    """Put the bits of v in the even positions"""
+    v = np.asarray(v, dtype=np.int64) & 0xFFFFFFFF
+    for shift, mask in zip(_SHIFTS, _MASKS):
+        v = (v | (v << shift)) & mask
+    return v
+
+
+def _compact(v: np.ndarray) -> np.ndarray:
+    """The even bits of v, packed: the inverse of _spread"""
+    v = np.asarray(v, dtype=np.int64) & _MASKS[-1]
+    for shift, mask in zip(reversed(_SHIFTS), _MASKS[-2::-1] + [0xFFFFFFFF]):
+        v = (v | (v >> shift)) & mask
+    return v
+
+
+def codes(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    """Morton codes of the zoom-ZOOM tiles holding the points"""
+    n = 1 << ZOOM
+    x = (np.asarray(lon, dtype=np.float64) + 180) / 360
+    sin = np.sin(np.radians(np.clip(np.asarray(lat, dtype=np.float64), -MAX_LATITUDE, MAX_LATITUDE)))
+    y = 0.5 - np.log((1 + sin) / (1 - sin)) / (4 * np.pi)
+    tx = np.clip((x * n).astype(np.int64), 0, n - 1)
+    ty = np.clip((y * n).astype(np.int64), 0, n - 1)
+    return _spread(tx) | (_spread(ty) << 1)
+
+
+def tile_range(z: int, x: int, y: int) -> Tuple[int, int]:
+    """[lo, hi) of the codes inside tile z/x/y"""
+    shift = 2 * (ZOOM - z)
+    lo = int((_spread(np.array([x])) | (_spread(np.array([y])) << 1))[0]) << shift
+    return lo, lo + (1 << shift)
+
+
+class SpatialIndex:
+    """
+    Points sorted by code: a key naming each point, its coordinates, an
+    optional weight, and attribute columns listed with tiles of few points
+    """
+
+    def __init__(self, history: int = 64):
+        self.generation = 0
+        self.codes = np.zeros(0, dtype=np.int64)
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.lat = np.zeros(0)
+        self.lon = np.zeros(0)
+        self.weight: Optional[np.ndarray] = None
+        self.attributes: Dict[str, np.ndarray] = {}
+        # (generation, sorted codes that changed to reach it)
+        self.changes: Deque[Tuple[int, np.ndarray]] = deque(maxlen=history)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def update(self, keys: np.ndarray, lat: np.ndarray, lon: np.ndarray,
+               weight: Optional[np.ndarray] = None, attributes: Optional[Dict[str, np.ndarray]] = None) -> bool:
+        """Replace the points; whether anything changed"""
+        attributes = attributes or {}
+        valid = np.isfinite(lat) & np.isfinite(lon)
+        if not valid.all():
+            keys, lat, lon = keys[valid], lat[valid], lon[valid]
+            weight = None if weight is None else weight[valid]
+            attributes = {name: column[valid] for name, column in attributes.items()}
+        new_codes = codes(lat, lon)
+        order = np.argsort(new_codes, kind="stable")
+        new_codes, keys, lat, lon = new_codes[order], keys[order], lat[order], lon[order]
+        weight = None if weight is None else weight[order]
+        attributes = {name: column[order] for name, column in attributes.items()}
+
+        if self.generation == 0 or (weight is None) != (self.weight is None) or attributes.keys() != self.attributes.keys():
+            changed = np.union1d(self.codes, new_codes)
+        else:
+            # A point is unchanged when its key is still there with the same code, weight and attributes
+            _, old_i, new_i = np.intersect1d(self.keys, keys, assume_unique=True, return_indices=True)
+            same = (self.codes[old_i] == new_codes[new_i]) & (self.lat[old_i] == lat[new_i]) & (self.lon[old_i] == lon[new_i])
+            if weight is not None:
+                same &= self.weight[old_i] == weight[new_i]
+            for name, column in attributes.items():
+                same &= self.attributes[name][old_i] == column[new_i]
+            old_kept = np.zeros(len(self.codes), dtype=bool)
+            old_kept[old_i[same]] = True
+            new_kept = np.zeros(len(new_codes), dtype=bool)
+            new_kept[new_i[same]] = True
+            changed = np.union1d(self.codes[~old_kept], new_codes[~new_kept])
+            if len(changed) == 0:
+                return False
+        self.codes, self.keys, self.lat, self.lon = new_codes, keys, lat, lon
+        self.weight, self.attributes = weight, attributes
+        self.generation += 1
+        self.changes.append((self.generation, changed))
+        return True
+
+    def changed_since(self, generation: int, lo: int, hi: int) -> bool:
+        """Whether any point in [lo, hi) changed after `generation` (True when that is too long ago to tell)"""
+        if generation == self.generation:
+            return False
+        if not self.changes or self.changes[0][0] > generation + 1:
+            return True
+        for reached, changed in self.changes:
+            if reached > generation:
+                i = int(np.searchsorted(changed, lo))
+                if i < len(changed) and changed[i] < hi:
+                    return True
+        return False
+
+    def tile(self, z: int, x: int, y: int, grid_bits: int, max_points: int) -> dict:
+        """The points of tile z/x/y, or its density grid when there are more than `max_points`"""
+        lo, hi = tile_range(z, x, y)
+        start, stop = np.searchsorted(self.codes, [lo, hi])
+        tile = {"z": z, "x": x, "y": y, "count": int(stop - start)}
+        lat, lon = self.lat[start:stop], self.lon[start:stop]
+        weight = None if self.weight is None else self.weight[start:stop]
+        if stop - start <= max_points:
+            points = {"lat": lat.round(6).tolist(), "lon": lon.round(6).tolist()}
+            if weight is not None:
+                points["w"] = weight.tolist()
+            for name, column in self.attributes.items():
+                points[name] = column[start:stop].tolist()
+            tile["points"] = points
+            return tile
+
+        # Cell of each point: the Morton code of its zoom z + grid_bits tile, relative to this one
+        cell = (self.codes[start:stop] - lo) >> (2 * (ZOOM - z - grid_bits))
+        cells, inverse, counts = np.unique(cell, return_inverse=True, return_counts=True)
+        size = 1 << grid_bits
+        tile["grid"] = size
+        tile["cells"] = (_compact(cells >> 1) * size + _compact(cells)).tolist()
+        tile["n"] = counts.tolist()
+        if weight is not None:
+            tile["w"] = np.bincount(inverse, weight, len(cells)).round(3).tolist()
+        tile["lat"] = (np.bincount(inverse, lat, len(cells)) / counts).round(6).tolist()
+        tile["lon"] = (np.bincount(inverse, lon, len(cells)) / counts).round(6).tolist()
+        return tile
+
+
+class TileCache:
+    """Tile bodies per (layer, z, x, y, time bucket), kept until a change falls in their tile"""
+
+    def __init__(self, grid_bits: int = 6, max_points: int = 200, capacity: int = 20000):
+        self.grid_bits = grid_bits
+        self.max_points = max_points
+        self.capacity = capacity
+        # key -> (index, generation built at, digest, body)
+        self.tiles: "OrderedDict[tuple, Tuple[SpatialIndex, int, str, bytes]]" = OrderedDict()
+        self.hits = 0
+        self.builds = 0
+        self.invalidated = 0
+
+    @property
+    def max_zoom(self) -> int:
+        return ZOOM - self.grid_bits
+
+    def get(self, index: SpatialIndex, layer: str, bucket: str, z: int, x: int, y: int) -> Tuple[str, bytes]:
+        """(digest, JSON body) of tile z/x/y of `index`"""
+        key = (layer, z, x, y, bucket)
+        entry = self.tiles.get(key)
+        if entry is not None:
+            cached, generation, digest, body = entry
+            if cached is index and not index.changed_since(generation, *tile_range(z, x, y)):
+                self.tiles[key] = (index, index.generation, digest, body)
+                self.tiles.move_to_end(key)
+                self.hits += 1
+                return digest, body
+            self.invalidated += 1
+        tile = index.tile(z, x, y, self.grid_bits, self.max_points)
+        tile["layer"], tile["bucket"] = layer, bucket
+        body = json.dumps(tile, separators=(",", ":")).encode()
+        digest = hashlib.blake2b(body, digest_size=12).hexdigest()
+        self.tiles[key] = (index, index.generation, digest, body)
+        self.tiles.move_to_end(key)
+        while len(self.tiles) > self.capacity:
+            self.tiles.popitem(last=False)
+        self.builds += 1
+        return digest, body
+
+    def stats(self):
+        return {"tiles": len(self.tiles), "hits": self.hits, "builds": self.builds, "invalidated": self.invalidated}
+
+
+class DensityTiles:
+    """The live vehicle and per-bucket station activity indexes behind /tiles, and their tiles"""
+
+    def __init__(self, db, grid_bits: int = 6, max_points: int = 200, capacity: int = 20000,
+                 bucket_seconds: int = 3600, buckets: int = 48):
+        self.db = db
+        self.cache = TileCache(grid_bits, max_points, capacity)
+        self.bucket_seconds = bucket_seconds
+        self.buckets = buckets
+        self.vehicles = SpatialIndex()
+        self.fleet_version: Optional[int] = None
+        # bucket start (None for all time) -> (what it was built from, index)
+        self.activity: "OrderedDict[Optional[int], Tuple[tuple, SpatialIndex]]" = OrderedDict()
+        self.index_ms = 0.0
+        self.indexed = 0
+
+    def tile(self, index: SpatialIndex, layer: str, bucket: str, z: int, x: int, y: int) -> Tuple[str, bytes]:
+        return self.cache.get(index, layer, bucket, z, x, y)
+
+    def live_vehicles(self, fleet) -> Optional[Tuple[SpatialIndex, float]]:
+        """The vehicle index at the fleet snapshot's version and when that was published, None without one"""
+        current = fleet.current()
+        if current is None:
+            return None
+        version, generated_at = current
+        if version != self.fleet_version:
+            names = ("id", "route_id", "mode", "latitude", "longitude", "heading")
+            result = fleet.read(lambda view: (view.version, view.generated_at,
+                                              {name: np.array(view.columns[name]) for name in names}))
+            if result is None:
+                return None
+            version, generated_at, columns = result
+            started = time.perf_counter()
+            ids = columns["id"].astype("U")
+            modes = np.array(MODES + [None], dtype=object)[np.minimum(columns["mode"], len(MODES))]
+            self.vehicles.update(ids, columns["latitude"], columns["longitude"], attributes={
+                "id": ids,
+                "route": np.where(columns["route_id"] == b"", None, columns["route_id"].astype("U").astype(object)),
+                "mode": modes,
+                "h": columns["heading"],
+            })
+            self._indexed(started)
+            self.fleet_version = version
+        return self.vehicles, generated_at
+
+    def bucket_of(self, at: datetime) -> int:
+        seconds = int((at - datetime(1970, 1, 1)).total_seconds())
+        return seconds - seconds % self.bucket_seconds
+
+    async def station_activity(self, catalog, window, start: Optional[int], version: str) -> SpatialIndex:
+        """
+        The catalog's stations weighted by their vehicle events in the bucket
+        from `start` (all time when None). `version` names the data the
+        counts come from; the index is rebuilt when it or the catalog changes.
+        """
+        source = (catalog.built_at, version)
+        entry = self.activity.get(start)
+        if entry is not None and entry[0] == source:
+            self.activity.move_to_end(start)
+            return entry[1]
+        if start is None:
+            counts = window.station_totals.copy() if window.ready else None
+        else:
+            counts = window.station_counts(start, start + self.bucket_seconds)
+        if counts is None:
+            if start is None:
+                rows = await self.db.fetch(queries.STATION_ACTIVITY_TOTAL)
+            else:
+                since = datetime(1970, 1, 1) + timedelta(seconds=start)
+                rows = await self.db.fetch(queries.STATION_ACTIVITY, since, since + timedelta(seconds=self.bucket_seconds))
+            ids = np.array([row["station_id"] for row in rows], dtype=np.int64)
+            counts = np.zeros(int(ids.max()) + 1 if len(ids) else 0, dtype=np.int64)
+            counts[ids] = [row["count"] for row in rows]
+
+        # Another request may have built it meanwhile
+        entry = self.activity.get(start)
+        index = entry[1] if entry is not None else SpatialIndex()
+        started = time.perf_counter()
+        stations = np.asarray(catalog.station_id)
+        known = stations < len(counts)
+        weight = np.zeros(len(stations), dtype=np.int64)
+        weight[known] = counts[stations[known]]
+        index.update(stations, np.asarray(catalog.latitude), np.asarray(catalog.longitude), weight, {"id": stations})
+        self._indexed(started)
+        self.activity[start] = (source, index)
+        self.activity.move_to_end(start)
+        while len(self.activity) > self.buckets:
+            self.activity.popitem(last=False)
+        return index
+
+    def _indexed(self, started: float):
+        self.indexed += 1
+        self.index_ms += (time.perf_counter() - started) * 1000
+
+    def stats(self):
+        return {
+            **self.cache.stats(),
+            "vehicles": len(self.vehicles),
+            "vehicle_generation": self.vehicles.generation,
+            "activity_buckets": len(self.activity),
+            "index_updates": self.indexed,
+            "index_update_ms": round(self.index_ms / self.indexed, 3) if self.indexed else None,
+        }
@@ -0,0 +1,376 @@
+"""
+Vehicle position history as delta-encoded chunks.
+
+The ingest leader keeps the new position reports of every vehicle in the
+live feed (a fetch listener) and, every flush interval, appends them to
+one row per (vehicle, time bucket) of vehicle_trajectories:
+
+- each flush appends a run to the row's bytea: the sample count, then the
+  time (ms since the bucket start), latitude and longitude (1e-6 degrees),
+  speed (0.1 m/s) and heading (degrees) columns, each as the differences
+  between consecutive samples, zigzag and varint encoded. The first sample
+  continues from the last one the leader wrote to the row before (absolute
+  after a handover). Consecutive reports of a vehicle differ by a few
+  seconds and metres, so most values take one or two bytes,
+- the row also carries the bucket's first/last sample time and bounding
+  box, so range queries by time and area only decode the chunks that can
+  match.
+
+Encoding and decoding work on whole columns with NumPy.
+"""
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.timestamps import EPOCH, epoch_seconds
+from app.core.tracing import tracer
+from app.db import queries
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ("t", "lat", "lon", "speed", "heading")
+UNKNOWN = -1  # speed or heading not reported
+
+BBox = Tuple[float, float, float, float]  # min lon, min lat, max lon, max lat
+
+APPEND = """
+    INSERT INTO vehicle_trajectories AS t
+        (vehicle_id, bucket, route_id, mode, first_at, last_at, min_lat, max_lat, min_lon, max_lon, samples, data)
+    SELECT * FROM unnest($1::VARCHAR[], $2::TIMESTAMP[], $3::VARCHAR[], $4::VARCHAR[], $5::TIMESTAMP[],
+                         $6::TIMESTAMP[], $7::DOUBLE PRECISION[], $8::DOUBLE PRECISION[], $9::DOUBLE PRECISION[],
+                         $10::DOUBLE PRECISION[], $11::INT[], $12::BYTEA[])
+    ON CONFLICT (vehicle_id, bucket) DO UPDATE SET
+        route_id = EXCLUDED.route_id,
+        mode = EXCLUDED.mode,
+        first_at = LEAST(t.first_at, EXCLUDED.first_at),
+        last_at = GREATEST(t.last_at, EXCLUDED.last_at),
+        min_lat = LEAST(t.min_lat, EXCLUDED.min_lat),
+        max_lat = GREATEST(t.max_lat, EXCLUDED.max_lat),
+        min_lon = LEAST(t.min_lon, EXCLUDED.min_lon),
+        max_lon = GREATEST(t.max_lon, EXCLUDED.max_lon),
+        samples = t.samples + EXCLUDED.samples,
+        data = t.data || EXCLUDED.data
+"""
+
+EXPIRE = "DELETE FROM vehicle_trajectories WHERE bucket < $1"
+
+
+# Varints
+
+def zigzag(values: np.ndarray) -> np.ndarray:
+    values = values.astype(np.int64)
+    return ((values << 1) ^ (values >> 63)).astype(np.uint64)
+
+
+def unzigzag(values: np.ndarray) -> np.ndarray:
+    values = values.astype(np.uint64)
+    return ((values >> np.uint64(1)).astype(np.int64)) ^ -((values & np.uint64(1)).astype(np.int64))
+
+
+def encode_varints(values: np.ndarray) -> bytes:
+    """LEB128 bytes of unsigned integers, seven bits a byte, low bits first"""
+    values = values.astype(np.uint64)
+    lengths = np.ones(len(values), dtype=np.int64)
+    for k in range(1, 10):
+        lengths += values >= np.uint64(1 << (7 * k))
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    out = np.zeros(int(lengths.sum()), dtype=np.uint8)
+    for k in range(int(lengths.max(initial=0))):
+        more = lengths > k
+        byte = (values[more] >> np.uint64(7 * k)) & np.uint64(0x7F)
+        byte |= np.where(lengths[more] > k + 1, np.uint64(0x80), np.uint64(0))
+        out[starts[more] + k] = byte
+    return out.tobytes()
+
+
+def decode_varints(data: bytes) -> np.ndarray:
+    """Every varint in `data`, in order"""
+    buf = np.frombuffer(data, dtype=np.uint8)
+    if not len(buf):
+        return np.zeros(0, dtype=np.uint64)
+    ends = np.flatnonzero(buf < 0x80)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    shift = (np.arange(len(buf)) - np.repeat(starts, ends - starts + 1)) * 7
+    parts = (buf & 0x7F).astype(np.uint64) << shift.astype(np.uint64)
+    return np.add.reduceat(parts, starts)
+
+
+# Chunks
+
+def encode_run(columns: Dict[str, np.ndarray], previous: Optional[np.ndarray] = None) -> bytes:
+    """
+    One run of samples (sorted by time) as a header and the delta-encoded
+    columns. The header is the sample count, shifted left by one, with the
+    low bit set when the first sample is a delta from `previous` (the
+    values of an earlier sample in the chunk) rather than absolute; the time
+    of that sample follows, so the decoder finds it however runs interleave.
+    """
+    count = len(columns["t"])
+    header = [count << 1] if previous is None else [count << 1 | 1, previous[0]]
+    parts = [np.array(header, dtype=np.uint64)]
+    for i, name in enumerate(FIELDS):
+        values = columns[name].astype(np.int64)
+        parts.append(zigzag(np.diff(values, prepend=np.int64(0 if previous is None else previous[i]))))
+    return encode_varints(np.concatenate(parts))
+
+
+def decode_chunk(data: bytes) -> Dict[str, np.ndarray]:
+    """The samples of every run in a chunk, sorted by time; t in ms since the bucket start"""
+    values = decode_varints(data)
+    runs = []
+    # Time of the last sample of each run -> its values, for the runs that continue from it
+    ends: Dict[int, np.ndarray] = {}
+    at = 0
+    while at < len(values):
+        header = int(values[at])
+        count, chained = header >> 1, header & 1
+        at += 1 + chained
+        block = np.cumsum(unzigzag(values[at:at + count * len(FIELDS)].reshape(len(FIELDS), count)), axis=1)
+        at += count * len(FIELDS)
+        if chained:
+            base = ends.get(int(values[at - count * len(FIELDS) - 1]))
+            if base is None:
+                # Its base was never stored (cannot happen unless the chunk was edited by hand)
+                continue
+            block += base[:, None]
+        if count:
+            ends[int(block[0, -1])] = block[:, -1]
+            runs.append(block)
+    if not runs:
+        return {name: np.zeros(0, dtype=np.int64) for name in FIELDS}
+    merged = np.concatenate(runs, axis=1)
+    # Runs from two leaders can interleave after a handover
+    order = np.argsort(merged[0], kind="stable")
+    return {name: merged[i][order] for i, name in enumerate(FIELDS)}
+
+
+def samples_to_columns(bucket: datetime, chunk: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """Decoded samples in API units: epoch seconds, degrees, m/s (NaN if unknown), degrees (-1 if unknown)"""
+    base = (bucket - EPOCH).total_seconds()
+    speed = chunk["speed"].astype(np.float64) / 10
+    speed[chunk["speed"] == UNKNOWN] = np.nan
+    return {
+        "t": base + chunk["t"] / 1000,
+        "lat": chunk["lat"] / 1e6,
+        "lon": chunk["lon"] / 1e6,
+        "speed": speed,
+        "heading": chunk["heading"],
+    }
+
+
+class TrajectoryRecorder:
+    """Leader side: position reports collected per vehicle and appended to their bucket rows every flush"""
+
+    def __init__(self, db, bucket_seconds: int = 600, flush_interval: float = 30, retention_days: float = 7,
+                 vehicle_ttl: float = 120, max_pending: int = 2_000_000):
+        self.db = db
+        self.bucket_seconds = bucket_seconds
+        self.flush_interval = flush_interval
+        self.retention_days = retention_days
+        self.vehicle_ttl = vehicle_ttl
+        self.max_pending = max_pending
+        # vehicle id -> [(epoch seconds, lat, lon, speed, heading), ...] not yet written
+        self.pending: Dict[str, List[tuple]] = defaultdict(list)
+        self.pending_count = 0
+        self.routes: Dict[str, Tuple[Optional[str], Optional[str]]] = {}
+        # Timestamp of the last report taken per vehicle, so repeated reports are not stored twice
+        self.last_seen: Dict[str, Tuple[float, float]] = {}
+        # Bucket and encoded values of the last sample written per vehicle, which the next run continues from
+        self.tails: Dict[str, Tuple[int, np.ndarray]] = {}
+        self.samples = 0
+        self.dropped = 0
+        self.errors = 0
+        self.flushes = 0
+        self.bytes_written = 0
+        self.samples_written = 0
+        self.last_flush_ms = 0.0
+        self.expired_at = 0.0
+
+    def update(self, entries: List[Dict[str, Any]]):
+        """Take the new reports of a fetched /live/vehicles payload; a fetch listener"""
+        now = time.time()
+        for entry in entries:
+            try:
+                vehicle = str(entry["id"])
+                ts = epoch_seconds(entry["timestamp"])
+                sample = (ts, float(entry["latitude"]), float(entry["longitude"]),
+                          entry.get("speed"), entry.get("heading"))
+            except Exception:
+                self.errors += 1
+                continue
+            last = self.last_seen.get(vehicle)
+            if last is not None and ts <= last[0]:
+                continue
+            self.last_seen[vehicle] = (ts, now)
+            if self.pending_count >= self.max_pending:
+                self.dropped += 1
+                continue
+            self.pending[vehicle].append(sample)
+            self.routes[vehicle] = (entry.get("route_id"), entry.get("type"))
+            self.pending_count += 1
+            self.samples += 1
+        cutoff = now - self.vehicle_ttl
+        for vehicle in [v for v, (_, seen) in self.last_seen.items() if seen < cutoff]:
+            del self.last_seen[vehicle]
+            self.routes.pop(vehicle, None)
+            self.tails.pop(vehicle, None)
+
+    def _chunks(self, pending: Dict[str, List[tuple]]) -> Tuple[List[tuple], Dict[str, Tuple[int, np.ndarray]]]:
+        """One encoded run per (vehicle, bucket) of the pending samples, as APPEND parameters, and the new tails"""
+        rows, tails = [], {}
+        for vehicle, samples in pending.items():
+            samples.sort()
+            values = np.array(samples, dtype=object)
+            ts = values[:, 0].astype(np.float64)
+            buckets = (ts // self.bucket_seconds).astype(np.int64) * self.bucket_seconds
+            route_id, mode = self.routes.get(vehicle, (None, None))
+            tail = self.tails.get(vehicle)
+            for bucket in np.unique(buckets):
+                index = np.flatnonzero(buckets == bucket)
+                part = values[index]
+                lat = part[:, 1].astype(np.float64)
+                lon = part[:, 2].astype(np.float64)
+                columns = {
+                    "t": np.round((ts[index] - bucket) * 1000).astype(np.int64),
+                    "lat": np.round(lat * 1e6).astype(np.int64),
+                    "lon": np.round(lon * 1e6).astype(np.int64),
+                    "speed": np.array([UNKNOWN if v is None else round(float(v) * 10) for v in part[:, 3]],
+                                      dtype=np.int64),
+                    "heading": np.array([UNKNOWN if v is None else int(v) for v in part[:, 4]], dtype=np.int64),
+                }
+                previous = tail[1] if tail is not None and tail[0] == bucket else None
+                data = encode_run(columns, previous)
+                tail = (int(bucket), np.array([columns[name][-1] for name in FIELDS], dtype=np.int64))
+                start = EPOCH + timedelta(seconds=int(bucket))
+                rows.append((
+                    vehicle, start, route_id, mode,
+                    EPOCH + timedelta(seconds=float(ts[index[0]])), EPOCH + timedelta(seconds=float(ts[index[-1]])),
+                    float(lat.min()), float(lat.max()), float(lon.min()), float(lon.max()), len(index), data,
+                ))
+            tails[vehicle] = tail
+        return rows, tails
+
+    async def flush(self):
+        """Append the pending samples to their bucket rows in one statement"""
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, defaultdict(list)
+        count, self.pending_count = self.pending_count, 0
+        started = time.perf_counter()
+        with tracer.span("trajectories.flush", samples=count, vehicles=len(pending)) as s:
+            rows, tails = self._chunks(pending)
+            try:
+                await self.db.execute(APPEND, *(list(column) for column in zip(*rows)))
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"[trajectories] Flush of {count} samples failed: {e}")
+                # Keep them for the next flush, unless that would pass the cap
+                if self.pending_count + count <= self.max_pending:
+                    for vehicle, samples in pending.items():
+                        self.pending[vehicle][:0] = samples
+                    self.pending_count += count
+                else:
+                    self.dropped += count
+                return
+            # Only once the runs are stored can the next ones be deltas from them
+            self.tails.update(tails)
+            written = sum(len(row[-1]) for row in rows)
+            s.set(chunks=len(rows), bytes=written)
+        self.flushes += 1
+        self.samples_written += count
+        self.bytes_written += written
+        self.last_flush_ms = (time.perf_counter() - started) * 1000
+
+    async def expire(self):
+        cutoff = datetime.utcnow() - timedelta(days=self.retention_days)
+        await self.db.execute(EXPIRE, cutoff)
+        self.expired_at = time.time()
+        # A deleted row may hold the samples the tails point at; start the next runs afresh
+        self.tails.clear()
+
+    async def run(self):
+        """Flush every flush_interval, and drop buckets past the retention once an hour"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                if self.retention_days and time.time() - self.expired_at > 3600:
+                    await self.expire()
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"[trajectories] {e}")
+
+    def stats(self):
+        return {
+            "pending_samples": self.pending_count,
+            "vehicles": len(self.last_seen),
+            "samples": self.samples,
+            "samples_written": self.samples_written,
+            "bytes_written": self.bytes_written,
+            "bytes_per_sample": round(self.bytes_written / self.samples_written, 2) if self.samples_written else None,
+            "flushes": self.flushes,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+            "dropped": self.dropped,
+            "errors": self.errors,
+        }
+
+
+# Queries
+
+def _track(row, start: float, end: float, bbox: Optional[BBox]) -> Optional[Dict[str, np.ndarray]]:
+    columns = samples_to_columns(row["bucket"], decode_chunk(row["data"]))
+    keep = (columns["t"] >= start) & (columns["t"] <= end)
+    if bbox is not None:
+        min_lon, min_lat, max_lon, max_lat = bbox
+        keep &= ((columns["lon"] >= min_lon) & (columns["lon"] <= max_lon)
+                 & (columns["lat"] >= min_lat) & (columns["lat"] <= max_lat))
+    if not keep.any():
+        return None
+    return {name: column[keep] for name, column in columns.items()}
+
+
+def _merge(rows, start: datetime, end: datetime, bbox: Optional[BBox]) -> List[dict]:
+    """Tracks of the chunk rows (ordered by vehicle, bucket) clipped to the range and area, one per vehicle"""
+    lo, hi = (start - EPOCH).total_seconds(), (end - EPOCH).total_seconds()
+    tracks: Dict[str, dict] = {}
+    for row in rows:
+        columns = _track(row, lo, hi, bbox)
+        if columns is None:
+            continue
+        track = tracks.setdefault(row["vehicle_id"], {"id": row["vehicle_id"], "parts": []})
+        track["route_id"], track["mode"] = row["route_id"], row["mode"]
+        track["parts"].append(columns)
+    result = []
+    for track in tracks.values():
+        parts = track.pop("parts")
+        columns = {name: np.concatenate([part[name] for part in parts]) for name in FIELDS}
+        speed = columns["speed"].round(1)
+        track.update(
+            t=columns["t"].round(3).tolist(),
+            lat=columns["lat"].tolist(),
+            lon=columns["lon"].tolist(),
+            speed=np.where(np.isnan(speed), None, speed.astype(object)).tolist(),
+            heading=np.where(columns["heading"] < 0, None, columns["heading"].astype(object)).tolist(),
+        )
+        result.append(track)
+    return result
+
+
+async def vehicle_track(db, vehicle_id: str, start: datetime, end: datetime, bucket_seconds: int) -> List[dict]:
+    """Samples of one vehicle between start and end (naive UTC)"""
+    rows = await db.fetch(queries.TRAJECTORY_BY_VEHICLE, vehicle_id, start - timedelta(seconds=bucket_seconds), start,
+                          end)
+    return _merge(rows, start, end, None)
+
+
+async def tracks_in_bbox(db, bbox: BBox, start: datetime, end: datetime, bucket_seconds: int) -> List[dict]:
+    """Samples of every vehicle inside bbox between start and end (naive UTC)"""
+    min_lon, min_lat, max_lon, max_lat = bbox
+    rows = await db.fetch(queries.TRAJECTORIES_IN_BBOX, start - timedelta(seconds=bucket_seconds), start, end,
+                          min_lon, min_lat, max_lon, max_lat)
+    return _merge(rows, start, end, bbox)
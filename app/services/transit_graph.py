@@ -0,0 +1,295 @@
+"""
+Journey search over the route patterns of the station catalog.
+
+A TransitGraph is built from the catalog's patterns (the stops of every
+Digitransit route pattern, mapped onto stations) and kept as flat arrays
+indexed by catalog station:
+
+- adjacency (CSR): every pair of consecutive stops on a pattern is an edge
+  carrying the pattern and its length in metres,
+- calls (CSR): the (pattern, position) pairs at which each station is
+  served, for boarding,
+- walks (CSR): stations sharing a name (the platforms of one stop) within
+  walking distance of each other are linked by walking transfers.
+
+Two searches answer a from/to query in a few milliseconds:
+
+- "transfers": fewest rides, breadth first one ride per round: every
+  pattern calling at a station reached in the previous round is ridden to
+  its end, then platforms of reached stops are walked to,
+- "distance": Dijkstra over the edges and walking links by metres.
+
+Rebuilding after the catalog changes reuses the edges of every pattern whose
+stops did not change, so only new or altered patterns are measured again.
+"""
+import heapq
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.services.catalog import MODES, StationCatalog
+
+EARTH_RADIUS_M = 6371000.0
+
+WALK = -1  # pattern of a walking transfer
+
+SEARCHES = ("transfers", "distance")
+
+
+def haversine(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """Great-circle distance in metres, vectorised"""
+    lat1, lon1, lat2, lon2 = (np.radians(v) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+
+def _csr(keys: np.ndarray, size: int, *values: np.ndarray) -> Tuple[np.ndarray, ...]:
+    """Offsets (size + 1) and `values` ordered by `keys`"""
+    order = np.argsort(keys, kind="stable")
+    offsets = np.searchsorted(keys[order], np.arange(size + 1)).astype(np.int64)
+    return (offsets,) + tuple(value[order] for value in values)
+
+
+class TransitGraph:
+    def __init__(self, catalog: StationCatalog, segments: Dict[tuple, np.ndarray], max_walk_m: float):
+        self.catalog = catalog
+        self.max_walk_m = max_walk_m
+        # (pattern id, station ids) -> edge lengths, reused by the next build
+        self.segments = segments
+        self.reused = 0
+        self.measured = 0
+        self.build_ms = 0.0
+
+    @classmethod
+    def build(cls, catalog: StationCatalog, previous: Optional["TransitGraph"] = None,
+              max_walk_m: float = 400) -> "TransitGraph":
+        started = time.perf_counter()
+        n = len(catalog)
+        arrays = catalog.arrays
+        pattern_offsets, pattern_stops = arrays["pattern_offsets"], arrays["pattern_stops"]
+        ids, lat, lon = catalog.station_id, catalog.latitude, catalog.longitude
+        old = previous.segments if previous is not None else {}
+        graph = cls(catalog, {}, max_walk_m)
+
+        sources, targets, patterns, lengths = [], [], [], []
+        for p in range(len(arrays["pattern_route"])):
+            stops = pattern_stops[pattern_offsets[p]:pattern_offsets[p + 1]]
+            if len(stops) < 2:
+                continue
+            key = (catalog.pattern_ids[p], ids[stops].tobytes())
+            length = old.get(key)
+            if length is None:
+                length = haversine(lat[stops[:-1]], lon[stops[:-1]], lat[stops[1:]], lon[stops[1:]]).astype(np.float32)
+                graph.measured += 1
+            else:
+                graph.reused += 1
+            graph.segments[key] = length
+            sources.append(stops[:-1])
+            targets.append(stops[1:])
+            patterns.append(np.full(len(stops) - 1, p, dtype=np.int32))
+            lengths.append(length)
+
+        def concat(parts, dtype):
+            return np.concatenate(parts).astype(dtype) if parts else np.zeros(0, dtype=dtype)
+
+        graph.edge_offsets, graph.edge_to, graph.edge_pattern, graph.edge_length = _csr(
+            concat(sources, np.int32), n, concat(targets, np.int32), concat(patterns, np.int32),
+            concat(lengths, np.float32),
+        )
+
+        # Where each station is called at, for boarding in the transfer search
+        call_pattern = np.repeat(np.arange(len(pattern_offsets) - 1, dtype=np.int32), np.diff(pattern_offsets))
+        call_position = (np.arange(len(pattern_stops)) - pattern_offsets[call_pattern]).astype(np.int32)
+        graph.call_offsets, graph.call_pattern, graph.call_position = _csr(
+            pattern_stops.astype(np.int32), n, call_pattern, call_position
+        )
+
+        # Platforms of one stop share a name; link the ones close enough to walk between
+        groups: Dict[str, List[int]] = {}
+        for i in range(n):
+            groups.setdefault((catalog.names[i] or "").lower(), []).append(i)
+        pairs = np.array([(a, b) for members in groups.values() if len(members) > 1
+                          for a in members for b in members if a != b], dtype=np.int32).reshape(-1, 2)
+        walk = haversine(lat[pairs[:, 0]], lon[pairs[:, 0]], lat[pairs[:, 1]], lon[pairs[:, 1]])
+        near = walk <= max_walk_m
+        graph.walk_offsets, graph.walk_to, graph.walk_length = _csr(
+            pairs[near, 0], n, pairs[near, 1], walk[near].astype(np.float32)
+        )
+
+        graph.build_ms = (time.perf_counter() - started) * 1000
+        return graph
+
+    def walks(self, i: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Platforms within walking distance of station `i` and how far they are"""
+        start, end = self.walk_offsets[i], self.walk_offsets[i + 1]
+        return self.walk_to[start:end], self.walk_length[start:end]
+
+    # Searches
+
+    def fewest_transfers(self, sources: Sequence[int], targets: Sequence[int],
+                         max_rides: int = 8) -> Optional[List[tuple]]:
+        """Path with the fewest rides as (station, pattern it was reached on) pairs"""
+        n = len(self.catalog)
+        pattern_offsets, pattern_stops = self.catalog.arrays["pattern_offsets"], self.catalog.arrays["pattern_stops"]
+        parent = np.full(n, -2, dtype=np.int64)  # -2 unreached, -1 source
+        via = np.full(n, WALK, dtype=np.int32)
+        wanted = set(int(t) for t in targets)
+
+        frontier = [int(s) for s in sources]
+        parent[frontier] = -1
+        reached = wanted.intersection(frontier)
+        for _ in range(max_rides):
+            if reached or not frontier:
+                break
+            # Board every pattern calling at the frontier at its earliest calling position
+            boarding: Dict[int, Tuple[int, int]] = {}
+            for s in frontier:
+                for c in range(self.call_offsets[s], self.call_offsets[s + 1]):
+                    p, position = int(self.call_pattern[c]), int(self.call_position[c])
+                    if p not in boarding or position < boarding[p][0]:
+                        boarding[p] = (position, s)
+            arrived = []
+            for p, (position, s) in boarding.items():
+                for t in pattern_stops[pattern_offsets[p] + position + 1:pattern_offsets[p + 1]].tolist():
+                    if parent[t] == -2:
+                        parent[t], via[t] = s, p
+                        arrived.append(t)
+            reached = wanted.intersection(arrived)
+            if reached:
+                break
+            walked = []
+            for t in arrived:
+                for w in self.walks(t)[0].tolist():
+                    if parent[w] == -2:
+                        parent[w], via[w] = t, WALK
+                        walked.append(w)
+            frontier = arrived + walked
+            reached = wanted.intersection(walked)
+        if not reached:
+            return None
+        return self._trace(min(reached), parent, via)
+
+    def shortest_distance(self, sources: Sequence[int], targets: Sequence[int]) -> Optional[List[tuple]]:
+        """Path with the fewest metres travelled, walking between platforms included"""
+        n = len(self.catalog)
+        distance = np.full(n, np.inf)
+        parent = np.full(n, -2, dtype=np.int64)
+        via = np.full(n, WALK, dtype=np.int32)
+        wanted = set(int(t) for t in targets)
+        heap = []
+        for s in sources:
+            distance[s], parent[s] = 0.0, -1
+            heap.append((0.0, int(s)))
+        heapq.heapify(heap)
+        while heap:
+            d, s = heapq.heappop(heap)
+            if d > distance[s]:
+                continue
+            if s in wanted:
+                return self._trace(s, parent, via)
+            start, end = self.edge_offsets[s], self.edge_offsets[s + 1]
+            for t, p, length in zip(self.edge_to[start:end].tolist(), self.edge_pattern[start:end].tolist(),
+                                    self.edge_length[start:end].tolist()):
+                if d + length < distance[t]:
+                    distance[t], parent[t], via[t] = d + length, s, p
+                    heapq.heappush(heap, (d + length, t))
+            platforms, walks = self.walks(s)
+            for t, length in zip(platforms.tolist(), walks.tolist()):
+                if d + length < distance[t]:
+                    distance[t], parent[t], via[t] = d + length, s, WALK
+                    heapq.heappush(heap, (d + length, t))
+        return None
+
+    def _trace(self, target: int, parent: np.ndarray, via: np.ndarray) -> List[tuple]:
+        path = [(target, int(via[target]))]
+        while parent[path[-1][0]] >= 0:
+            station = int(parent[path[-1][0]])
+            path.append((station, int(via[station])))
+        path.reverse()
+        return path
+
+    # Results
+
+    def journey(self, sources: Sequence[int], targets: Sequence[int], search: str = "transfers") -> Optional[dict]:
+        """Stops and legs of the best path between any of `sources` and any of `targets`"""
+        if search == "distance":
+            path = self.shortest_distance(sources, targets)
+        else:
+            path = self.fewest_transfers(sources, targets)
+        if path is None:
+            return None
+        return self._describe(path)
+
+    def _describe(self, path: List[tuple]) -> dict:
+        catalog = self.catalog
+        pattern_offsets, pattern_stops = catalog.arrays["pattern_offsets"], catalog.arrays["pattern_stops"]
+        def calls(p):
+            return pattern_stops[pattern_offsets[p]:pattern_offsets[p + 1]].tolist()
+
+        def rides_on(p, station, target):
+            stations = calls(p)
+            return station in stations and target in stations[stations.index(station) + 1:]
+
+        stops, legs = [path[0][0]], []
+        for (station, _), (target, p) in zip(path, path[1:]):
+            # Patterns sharing a stretch of track are interchangeable; stay on the current one
+            if p != WALK and legs and legs[-1]["pattern"] not in (p, WALK) and rides_on(legs[-1]["pattern"], station, target):
+                p = legs[-1]["pattern"]
+            if p == WALK:
+                segment = [target]
+            else:
+                # One ride may pass several stops between two path entries
+                stations = calls(p)
+                start = stations.index(station)
+                segment = stations[start + 1:stations.index(target, start + 1) + 1]
+            if legs and legs[-1]["pattern"] == p and p != WALK:
+                legs[-1]["stops"] += segment
+            else:
+                legs.append({"pattern": p, "stops": [station] + segment})
+            stops += segment
+
+        lat, lon = catalog.latitude, catalog.longitude
+        described = []
+        for leg in legs:
+            leg_stops = np.array(leg["stops"])
+            metres = float(haversine(lat[leg_stops[:-1]], lon[leg_stops[:-1]], lat[leg_stops[1:]], lon[leg_stops[1:]]).sum())
+            entry = {
+                "from": catalog.names[leg_stops[0]],
+                "to": catalog.names[leg_stops[-1]],
+                "stops": [int(catalog.station_id[i]) for i in leg_stops],
+                "distance_m": round(metres),
+            }
+            p = leg["pattern"]
+            if p == WALK:
+                entry["walk"] = True
+            else:
+                route = int(catalog.arrays["pattern_route"][p])
+                mode = int(catalog.arrays["route_mode"][route])
+                entry.update(route_id=catalog.route_ids[route], route=catalog.route_shorts[route],
+                             mode=MODES[mode] if mode < len(MODES) else None, pattern_id=catalog.pattern_ids[p])
+            described.append(entry)
+
+        rides = sum(1 for leg in described if not leg.get("walk"))
+        return {
+            "rides": rides,
+            "transfers": max(0, rides - 1),
+            "distance_m": sum(leg["distance_m"] for leg in described),
+            "stops": [{
+                "id": int(catalog.station_id[i]),
+                "name": catalog.names[i],
+                "latitude": float(lat[i]),
+                "longitude": float(lon[i]),
+            } for i in stops],
+            "legs": described,
+        }
+
+    def stats(self):
+        return {
+            "stations": len(self.catalog),
+            "edges": len(self.edge_to),
+            "walks": len(self.walk_to),
+            "patterns_reused": self.reused,
+            "patterns_measured": self.measured,
+            "build_ms": round(self.build_ms, 3),
+        }
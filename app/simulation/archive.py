@@ -0,0 +1,144 @@
+"""
+Compressed, segmented archive of raw live feed responses.
+
+An archive is a directory of segment files (`segment-000001.rec`, ...)
+and a `manifest.json` describing where the responses came from. Each
+record is one response body as received, framed as
+
+    >dBII  recorded_at (epoch seconds), feed code, length, crc32
+    zlib-compressed body
+
+Segments roll over at `segment_bytes` or `segment_seconds`, whichever
+comes first, so a long recording can be trimmed or copied a piece at a
+time. Reading streams one record at a time; a torn record at the end of
+the last segment (the recorder was killed mid-write) ends the archive.
+"""
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+from typing import Iterator, Optional, Sequence, Tuple
+
+HEADER = struct.Struct(">dBII")
+
+FEEDS = ("vehicles", "stations")
+
+Record = Tuple[float, str, bytes]
+
+
+class ArchiveWriter:
+    def __init__(self, directory: str, segment_bytes: int = 64 * 1024 * 1024,
+                 segment_seconds: float = 3600, level: int = 6, **manifest):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.segment_seconds = segment_seconds
+        self.level = level
+        self.records = 0
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+        self._lock = threading.Lock()
+        self._file = None
+        self._opened_at = 0.0
+
+        os.makedirs(directory, exist_ok=True)
+        existing = segment_paths(directory)
+        self._seq = int(os.path.basename(existing[-1])[8:14]) if existing else 0
+        manifest_path = os.path.join(directory, "manifest.json")
+        if not os.path.exists(manifest_path):
+            with open(manifest_path, "w") as f:
+                json.dump({"format": 1, "created_at": time.time(), **manifest}, f, indent=2)
+
+    def append(self, feed: str, body: bytes, recorded_at: Optional[float] = None):
+        """Store one response body; thread-safe"""
+        recorded_at = time.time() if recorded_at is None else recorded_at
+        payload = zlib.compress(body, self.level)
+        record = HEADER.pack(recorded_at, FEEDS.index(feed), len(payload), zlib.crc32(payload)) + payload
+        with self._lock:
+            if self._file is None or self._should_roll(recorded_at):
+                self._roll(recorded_at)
+            self._file.write(record)
+            self._file.flush()
+            self.records += 1
+            self.raw_bytes += len(body)
+            self.stored_bytes += len(record)
+
+    def _should_roll(self, now: float) -> bool:
+        return self._file.tell() >= self.segment_bytes or now - self._opened_at >= self.segment_seconds
+
+    def _roll(self, now: float):
+        if self._file is not None:
+            self._file.close()
+        self._seq += 1
+        self._file = open(os.path.join(self.directory, f"segment-{self._seq:06d}.rec"), "ab")
+        self._opened_at = now
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def stats(self):
+        return {
+            "records": self.records,
+            "segments": self._seq,
+            "raw_bytes": self.raw_bytes,
+            "stored_bytes": self.stored_bytes,
+        }
+
+
+def segment_paths(directory: str):
+    return sorted(
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if name.startswith("segment-") and name.endswith(".rec")
+    )
+
+
+def read_manifest(directory: str) -> dict:
+    try:
+        with open(os.path.join(directory, "manifest.json")) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def read_records(directory: str, feeds: Optional[Sequence[str]] = None,
+                 start: Optional[float] = None, end: Optional[float] = None) -> Iterator[Record]:
+    """Yield (recorded_at, feed, body) in recording order, optionally filtered by feed and time"""
+    codes = None if feeds is None else {FEEDS.index(feed) for feed in feeds}
+    for path in segment_paths(directory):
+        with open(path, "rb") as f:
+            while True:
+                header = f.read(HEADER.size)
+                if len(header) < HEADER.size:
+                    break
+                recorded_at, code, length, crc = HEADER.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length or zlib.crc32(payload) != crc:
+                    break
+                if codes is not None and code not in codes:
+                    continue
+                if start is not None and recorded_at < start:
+                    continue
+                if end is not None and recorded_at > end:
+                    return
+                yield recorded_at, FEEDS[code], zlib.decompress(payload)
+
+
+def summary(directory: str) -> dict:
+    """Record counts and time span per feed, read from the headers only"""
+    feeds = {}
+    for path in segment_paths(directory):
+        with open(path, "rb") as f:
+            while True:
+                header = f.read(HEADER.size)
+                if len(header) < HEADER.size:
+                    break
+                recorded_at, code, length, _ = HEADER.unpack(header)
+                f.seek(length, os.SEEK_CUR)
+                entry = feeds.setdefault(FEEDS[code], {"records": 0, "first": recorded_at, "last": recorded_at})
+                entry["records"] += 1
+                entry["last"] = recorded_at
+    return feeds
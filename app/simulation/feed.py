@@ -0,0 +1,359 @@
+"""
+Deterministic synthetic transit feed.
+
+SyntheticFeed lays out stations around central Helsinki, builds routes as
+walks through nearby stations, and moves a fleet of vehicles along those
+routes one tick at a time. Everything is drawn from one seeded generator,
+so the same parameters always produce the same payloads, tick for tick.
+
+Payloads come in two shapes:
+
+- the render-cloud live feed (`live_vehicles()`, `live_stations()`), as read
+  by app.services.live_feed, and
+- Digitransit GraphQL objects (`digitransit_vehicles()`, `digitransit_stops()`,
+  `digitransit_routes()`), as read by DigitransitService.
+"""
+import math
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from app.models.transport import VehicleMode
+
+CENTER = (60.1699, 24.9384)
+METRES_PER_DEGREE = 111320.0
+
+MODE_WEIGHTS = {
+    VehicleMode.BUS: 0.70,
+    VehicleMode.TRAM: 0.12,
+    VehicleMode.TRAIN: 0.08,
+    VehicleMode.SUBWAY: 0.05,
+    VehicleMode.FERRY: 0.05,
+}
+
+MOVE_DISTRIBUTIONS = ("lognormal", "exponential", "uniform", "fixed")
+
+SYLLABLES = ["kam", "pi", "pa", "si", "la", "hel", "sin", "ki", "ta", "pio", "la",
+             "vuo", "sa", "ri", "ka", "lio", "töö", "lö", "ruo", "ho", "mi", "er",
+             "ot", "tie", "nie", "mi", "kon", "ala", "mä", "ki", "hert", "to", "nii"]
+SUFFIXES = ["", "", "", "ntie", "nkatu", " (M)", " asema", "nranta", "npuisto"]
+ZONES = ["A", "B", "C", "D"]
+PLATFORMS = ["1", "2", "3", "4"]
+
+
+class SyntheticFeed:
+    """
+    A seeded fleet moving along synthetic routes.
+
+    fleet_size        vehicles in service
+    station_count     stops laid out around the centre
+    route_count       routes, each a walk through 10-40 nearby stops
+    update_rate       position reports per vehicle per second; each tick a
+                      vehicle reports with probability 1 - exp(-rate * tick)
+    tick_seconds      simulated seconds per advance()
+    move_distribution distance a vehicle covers per second: lognormal,
+                      exponential, uniform (0 to 2x mean) or fixed
+    move_mean         mean of that distance in metres per second
+    """
+
+    def __init__(self,
+                 seed: int = 42,
+                 fleet_size: int = 1500,
+                 station_count: int = 8000,
+                 route_count: int = 200,
+                 update_rate: float = 0.2,
+                 tick_seconds: float = 5,
+                 move_distribution: str = "lognormal",
+                 move_mean: float = 8.0,
+                 start: Optional[datetime] = None):
+        if move_distribution not in MOVE_DISTRIBUTIONS:
+            raise ValueError(f"Unknown move distribution: {move_distribution}")
+        self.seed = seed
+        self.fleet_size = fleet_size
+        self.station_count = station_count
+        self.route_count = max(1, min(route_count, station_count))
+        self.update_rate = update_rate
+        self.tick_seconds = tick_seconds
+        self.move_distribution = move_distribution
+        self.move_mean = move_mean
+        self.now = start or datetime(2024, 1, 1, 6, 0, 0)
+        self.ticks = 0
+        self.rng = np.random.default_rng(seed)
+
+        self._build_stations()
+        self._build_routes()
+        self._build_fleet()
+
+    # Layout
+
+    def _build_stations(self):
+        rng = self.rng
+        # Dense centre with a long tail towards the suburbs
+        distance = rng.gamma(2.0, 2500.0, self.station_count)
+        angle = rng.uniform(0, 2 * math.pi, self.station_count)
+        lat0, lon0 = CENTER
+        self.station_lat = lat0 + distance * np.sin(angle) / METRES_PER_DEGREE
+        self.station_lon = lon0 + distance * np.cos(angle) / (METRES_PER_DEGREE * math.cos(math.radians(lat0)))
+        self.station_zone = np.minimum(distance // 6000, len(ZONES) - 1).astype(int)
+
+        names = []
+        seen = set()
+        base_count = max(1, self.station_count // 2)
+        for i in range(self.station_count):
+            if i < base_count:
+                parts = rng.integers(0, len(SYLLABLES), rng.integers(2, 4))
+                name = "".join(SYLLABLES[p] for p in parts).capitalize()
+                name += SUFFIXES[rng.integers(0, len(SUFFIXES))]
+                # Keep names unique so that (name, platform) stays a unique key
+                if name in seen:
+                    name = f"{name} {i}"
+                seen.add(name)
+                names.append(name)
+            else:
+                # The other half are further platforms of an existing stop
+                names.append(names[i - base_count])
+        self.station_names = names
+        self.station_platform = [PLATFORMS[i // base_count % len(PLATFORMS)] for i in range(self.station_count)]
+        self.station_routes: List[List[int]] = [[] for _ in range(self.station_count)]
+
+    def _build_routes(self):
+        rng = self.rng
+        lat0 = math.radians(CENTER[0])
+        x = self.station_lon * math.cos(lat0) * METRES_PER_DEGREE
+        y = self.station_lat * METRES_PER_DEGREE
+        modes = list(MODE_WEIGHTS)
+        weights = np.array(list(MODE_WEIGHTS.values()))
+
+        self.routes = []
+        for r in range(self.route_count):
+            mode = modes[rng.choice(len(modes), p=weights / weights.sum())]
+            length = int(rng.integers(10, 41))
+            stop = int(rng.integers(0, self.station_count))
+            heading = rng.uniform(0, 2 * math.pi)
+            stops = [stop]
+            visited = {stop}
+            for _ in range(length - 1):
+                heading += rng.normal(0, 0.35)
+                step = rng.uniform(300, 700)
+                tx = x[stop] + step * math.cos(heading)
+                ty = y[stop] + step * math.sin(heading)
+                order = np.argsort((x - tx) ** 2 + (y - ty) ** 2)[:8]
+                candidates = [int(s) for s in order if int(s) not in visited]
+                if not candidates:
+                    break
+                stop = candidates[0]
+                visited.add(stop)
+                stops.append(stop)
+            if len(stops) < 2:
+                stops.append((stops[0] + 1) % self.station_count)
+
+            segment = np.hypot(np.diff(x[stops]), np.diff(y[stops]))
+            self.routes.append({
+                "index": r,
+                "id": f"HSL:{1000 + r}",
+                "short_name": f"{r + 1}{mode.value[0] if mode != VehicleMode.BUS else ''}",
+                "long_name": f"{self.station_names[stops[0]]} - {self.station_names[stops[-1]]}",
+                "mode": mode,
+                "stops": stops,
+                "offsets": np.concatenate(([0.0], np.cumsum(segment))),
+            })
+            for s in stops:
+                self.station_routes[s].append(r)
+
+    def _build_fleet(self):
+        rng = self.rng
+        n = self.fleet_size
+        self.vehicle_route = rng.integers(0, self.route_count, n)
+        lengths = np.array([self.routes[r]["offsets"][-1] for r in self.vehicle_route])
+        self.vehicle_offset = rng.uniform(0, 1, n) * lengths
+        self.vehicle_direction = np.where(rng.uniform(0, 1, n) < 0.5, 1, -1)
+        self.vehicle_speed = np.zeros(n)
+        self.vehicle_timestamp = [self.now] * n
+        self.vehicle_lat = np.zeros(n)
+        self.vehicle_lon = np.zeros(n)
+        self.vehicle_heading = np.zeros(n, dtype=int)
+        self.vehicle_stop = np.zeros(n, dtype=int)
+        for i in range(n):
+            self._place(i)
+
+    # Simulation
+
+    def _distances(self, n: int) -> np.ndarray:
+        mean = self.move_mean * self.tick_seconds
+        rng = self.rng
+        if self.move_distribution == "lognormal":
+            sigma = 0.6
+            return rng.lognormal(math.log(mean) - sigma ** 2 / 2, sigma, n)
+        if self.move_distribution == "exponential":
+            return rng.exponential(mean, n)
+        if self.move_distribution == "uniform":
+            return rng.uniform(0, 2 * mean, n)
+        return np.full(n, mean)
+
+    def advance(self, ticks: int = 1):
+        """Move the simulation forward by `ticks` ticks"""
+        for _ in range(ticks):
+            self.ticks += 1
+            self.now += timedelta(seconds=self.tick_seconds)
+            report = self.rng.uniform(0, 1, self.fleet_size) < 1 - math.exp(-self.update_rate * self.tick_seconds)
+            moved = self._distances(self.fleet_size)
+            for i in np.flatnonzero(report):
+                offsets = self.routes[self.vehicle_route[i]]["offsets"]
+                offset = self.vehicle_offset[i] + self.vehicle_direction[i] * moved[i]
+                # Turn around at either terminus
+                if offset > offsets[-1]:
+                    offset = 2 * offsets[-1] - offset
+                    self.vehicle_direction[i] = -1
+                elif offset < 0:
+                    offset = -offset
+                    self.vehicle_direction[i] = 1
+                self.vehicle_offset[i] = min(max(offset, 0.0), offsets[-1])
+                self.vehicle_speed[i] = moved[i] / self.tick_seconds
+                self.vehicle_timestamp[i] = self.now
+                self._place(i)
+
+    def _place(self, i: int):
+        """Position, heading and next stop of vehicle i from its offset along the route"""
+        route = self.routes[self.vehicle_route[i]]
+        offsets, stops = route["offsets"], route["stops"]
+        segment = int(min(np.searchsorted(offsets, self.vehicle_offset[i], side="right") - 1, len(stops) - 2))
+        a, b = stops[segment], stops[segment + 1]
+        span = offsets[segment + 1] - offsets[segment]
+        t = (self.vehicle_offset[i] - offsets[segment]) / span if span else 0.0
+        self.vehicle_lat[i] = self.station_lat[a] + t * (self.station_lat[b] - self.station_lat[a])
+        self.vehicle_lon[i] = self.station_lon[a] + t * (self.station_lon[b] - self.station_lon[a])
+        bearing = math.degrees(math.atan2(
+            (self.station_lon[b] - self.station_lon[a]) * math.cos(math.radians(CENTER[0])),
+            self.station_lat[b] - self.station_lat[a],
+        ))
+        if self.vehicle_direction[i] < 0:
+            bearing += 180
+        self.vehicle_heading[i] = int(bearing % 360)
+        self.vehicle_stop[i] = b if self.vehicle_direction[i] > 0 else a
+
+    # Live feed payloads
+
+    def station_id(self, index: int) -> int:
+        return index + 1
+
+    def live_stations(self) -> List[Dict[str, Any]]:
+        return [{
+            "id": self.station_id(i),
+            "station_name": self.station_names[i],
+            "platform_code": self.station_platform[i],
+            "zone_id": ZONES[self.station_zone[i]],
+            "longitude": round(float(self.station_lon[i]), 6),
+            "latitude": round(float(self.station_lat[i]), 6),
+        } for i in range(self.station_count)]
+
+    def live_vehicles(self) -> List[Dict[str, Any]]:
+        return [{
+            "id": f"{self.vehicle_route[i]}/{i}",
+            "type": self.routes[self.vehicle_route[i]]["mode"].value,
+            "station_id": self.station_id(int(self.vehicle_stop[i])),
+            "timestamp": self.vehicle_timestamp[i].isoformat(),
+            "status": "ACTIVE",
+            "latitude": round(float(self.vehicle_lat[i]), 6),
+            "longitude": round(float(self.vehicle_lon[i]), 6),
+            "route_id": self.routes[self.vehicle_route[i]]["id"],
+            "speed": round(float(self.vehicle_speed[i]), 2),
+            "heading": int(self.vehicle_heading[i]),
+        } for i in range(self.fleet_size)]
+
+    # Digitransit GraphQL objects
+
+    def stop_gtfs_id(self, index: int) -> str:
+        return f"HSL:{1000000 + index}"
+
+    def stop_index(self, gtfs_id: str) -> Optional[int]:
+        try:
+            index = int(gtfs_id.split(":")[-1]) - 1000000
+        except ValueError:
+            return None
+        return index if 0 <= index < self.station_count else None
+
+    def digitransit_stop(self, i: int) -> Dict[str, Any]:
+        return {
+            "id": self.stop_gtfs_id(i),
+            "gtfsId": self.stop_gtfs_id(i),
+            "name": self.station_names[i],
+            "code": f"H{i:04d}",
+            "lat": float(self.station_lat[i]),
+            "lon": float(self.station_lon[i]),
+            "routes": [{"id": self.routes[r]["id"], "gtfsId": self.routes[r]["id"]} for r in self.station_routes[i]],
+            "platformCode": self.station_platform[i],
+            "desc": self.station_names[i],
+            "zoneId": ZONES[self.station_zone[i]],
+        }
+
+    def digitransit_stops(self, limit: Optional[int] = None, skip: int = 0,
+                          name: Optional[str] = None) -> List[Dict[str, Any]]:
+        indices = range(self.station_count)
+        if name:
+            needle = name.lower()
+            indices = [i for i in indices if needle in self.station_names[i].lower()]
+        indices = list(indices)[skip:]
+        if limit is not None:
+            indices = indices[:limit]
+        return [self.digitransit_stop(i) for i in indices]
+
+    def digitransit_route(self, route: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "id": route["id"],
+            "gtfsId": route["id"],
+            "shortName": route["short_name"],
+            "longName": route["long_name"],
+            "mode": route["mode"].value,
+            "operatorId": "HSL:90",
+            "color": None,
+            "textColor": None,
+            "patterns": [
+                {
+                    "id": f"{route['id']}:0:01",
+                    "name": route["long_name"],
+                    "stops": [{"id": self.stop_gtfs_id(s), "gtfsId": self.stop_gtfs_id(s)} for s in route["stops"]],
+                },
+                {
+                    "id": f"{route['id']}:1:01",
+                    "name": " - ".join(reversed(route["long_name"].split(" - "))),
+                    "stops": [{"id": self.stop_gtfs_id(s), "gtfsId": self.stop_gtfs_id(s)}
+                              for s in reversed(route["stops"])],
+                },
+            ],
+        }
+
+    def digitransit_routes(self, name: Optional[str] = None) -> List[Dict[str, Any]]:
+        routes = self.routes
+        if name:
+            routes = [r for r in routes if name.lower() in (r["short_name"] + " " + r["long_name"]).lower()]
+        return [self.digitransit_route(r) for r in routes]
+
+    def digitransit_route_by_id(self, route_id: str) -> Optional[Dict[str, Any]]:
+        for route in self.routes:
+            if route["id"] == route_id:
+                return self.digitransit_route(route)
+        return None
+
+    def digitransit_vehicles(self) -> List[Dict[str, Any]]:
+        vehicles = []
+        for i in range(self.fleet_size):
+            route = self.routes[self.vehicle_route[i]]
+            vehicles.append({
+                "id": f"HSL:{route['index']}/{i}",
+                "trip": {
+                    "id": f"{route['id']}_{self.vehicle_direction[i] > 0:d}_{i}",
+                    "route": {
+                        "id": route["id"],
+                        "shortName": route["short_name"],
+                        "longName": route["long_name"],
+                        "mode": route["mode"].value,
+                    },
+                },
+                "position": {"latitude": float(self.vehicle_lat[i]), "longitude": float(self.vehicle_lon[i])},
+                "speed": float(self.vehicle_speed[i]),
+                "heading": int(self.vehicle_heading[i]),
+                "vehicleNumber": str(1000 + i),
+                "operatorId": "HSL:90",
+            })
+        return vehicles
@@ -0,0 +1,126 @@
+"""
+Write the synthetic network as a GTFS feed.
+
+    python -m app.simulation.gtfs data/gtfs [--seed 42] [--start 2024-01-01 --days 28]
+
+Every route of SyntheticFeed runs in both directions from 05:00 until after
+midnight (times past 24:00:00, as GTFS allows) at a headway depending on its
+mode, with travel times from the stop spacing and a per-mode speed. Weekend
+service runs less often than weekday service. Stop ids match the GraphQL
+stops' gtfsId without the feed prefix, so the timetable and the station
+catalog describe the same stops.
+"""
+import argparse
+import csv
+import os
+from datetime import date, timedelta
+from typing import Optional
+
+from app.models.transport import VehicleMode
+from app.simulation.feed import SyntheticFeed
+
+ROUTE_TYPES = {
+    VehicleMode.TRAM: 0,
+    VehicleMode.SUBWAY: 1,
+    VehicleMode.TRAIN: 2,
+    VehicleMode.BUS: 3,
+    VehicleMode.FERRY: 4,
+}
+
+# Average speed between stops (m/s), seconds stopped at each call and minutes between departures
+SPEEDS = {VehicleMode.BUS: 6.5, VehicleMode.TRAM: 5.0, VehicleMode.TRAIN: 16.0,
+          VehicleMode.SUBWAY: 12.0, VehicleMode.FERRY: 5.5}
+DWELL_SECONDS = 20
+HEADWAYS = {VehicleMode.BUS: 10, VehicleMode.TRAM: 8, VehicleMode.TRAIN: 15,
+            VehicleMode.SUBWAY: 5, VehicleMode.FERRY: 30}
+WEEKEND_HEADWAY_FACTOR = 1.5
+
+SERVICE_START = 5 * 3600
+SERVICE_END = 24 * 3600 + 30 * 60
+
+
+def clock(seconds: int) -> str:
+    return f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+def write_gtfs(feed: SyntheticFeed, directory: str, start: Optional[date] = None, days: int = 28) -> int:
+    """Write the feed's routes as GTFS files into `directory`; returns the number of stop times"""
+    os.makedirs(directory, exist_ok=True)
+    start = start or feed.now.date()
+    end = start + timedelta(days=days - 1)
+
+    def table(name, header):
+        handle = open(os.path.join(directory, name), "w", newline="", encoding="utf-8")
+        writer = csv.writer(handle)
+        writer.writerow(header)
+        return handle, writer
+
+    handle, writer = table("agency.txt", ["agency_id", "agency_name", "agency_url", "agency_timezone"])
+    with handle:
+        writer.writerow(["HSL", "Synthetic HSL", "https://example.invalid", "Europe/Helsinki"])
+
+    handle, writer = table("calendar.txt", ["service_id", "monday", "tuesday", "wednesday", "thursday", "friday",
+                                            "saturday", "sunday", "start_date", "end_date"])
+    with handle:
+        writer.writerow(["WD", 1, 1, 1, 1, 1, 0, 0, start.strftime("%Y%m%d"), end.strftime("%Y%m%d")])
+        writer.writerow(["WE", 0, 0, 0, 0, 0, 1, 1, start.strftime("%Y%m%d"), end.strftime("%Y%m%d")])
+
+    handle, writer = table("stops.txt", ["stop_id", "stop_name", "stop_lat", "stop_lon", "zone_id", "platform_code"])
+    with handle:
+        for i in range(feed.station_count):
+            writer.writerow([feed.stop_gtfs_id(i).split(":")[-1], feed.station_names[i],
+                             f"{feed.station_lat[i]:.6f}", f"{feed.station_lon[i]:.6f}",
+                             "ABCD"[feed.station_zone[i]], feed.station_platform[i]])
+
+    handle, writer = table("routes.txt", ["route_id", "agency_id", "route_short_name", "route_long_name", "route_type"])
+    with handle:
+        for route in feed.routes:
+            writer.writerow([route["id"].split(":")[-1], "HSL", route["short_name"], route["long_name"],
+                             ROUTE_TYPES[route["mode"]]])
+
+    stop_times = 0
+    trips_handle, trips = table("trips.txt", ["route_id", "service_id", "trip_id", "direction_id"])
+    times_handle, times = table("stop_times.txt", ["trip_id", "arrival_time", "departure_time", "stop_id",
+                                                   "stop_sequence"])
+    with trips_handle, times_handle:
+        for route in feed.routes:
+            route_id = route["id"].split(":")[-1]
+            mode = route["mode"]
+            stop_ids = [feed.stop_gtfs_id(s).split(":")[-1] for s in route["stops"]]
+            runs = (route["offsets"] / SPEEDS[mode]).round().astype(int)
+            for direction in (0, 1):
+                calls = stop_ids if direction == 0 else stop_ids[::-1]
+                # Seconds from the first departure to each arrival
+                elapsed = runs if direction == 0 else runs[-1] - runs[::-1]
+                for service, factor in (("WD", 1.0), ("WE", WEEKEND_HEADWAY_FACTOR)):
+                    headway = int(HEADWAYS[mode] * factor * 60)
+                    # Stagger the routes so that departures do not all fall on the same minutes
+                    first = SERVICE_START + (route["index"] * 97 + direction * 53) % headway
+                    for n, departure in enumerate(range(first, SERVICE_END, headway)):
+                        trip_id = f"{route_id}_{service}_{direction}_{n}"
+                        trips.writerow([route_id, service, trip_id, direction])
+                        for sequence, stop_id in enumerate(calls):
+                            arrival = departure + int(elapsed[sequence]) + sequence * DWELL_SECONDS
+                            leaving = arrival + (DWELL_SECONDS if 0 < sequence < len(calls) - 1 else 0)
+                            times.writerow([trip_id, clock(arrival), clock(leaving), stop_id, sequence + 1])
+                        stop_times += len(calls)
+    return stop_times
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write the synthetic network as a GTFS feed")
+    parser.add_argument("directory")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--station-count", type=int, default=8000)
+    parser.add_argument("--route-count", type=int, default=200)
+    parser.add_argument("--start", type=date.fromisoformat, help="first service day (default: the feed's start)")
+    parser.add_argument("--days", type=int, default=28)
+    args = parser.parse_args()
+
+    feed = SyntheticFeed(seed=args.seed, fleet_size=1, station_count=args.station_count, route_count=args.route_count)
+    rows = write_gtfs(feed, args.directory, args.start, args.days)
+    print(f"Wrote {len(feed.routes)} routes and {rows} stop times to {args.directory}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Record the live feed into an archive for offline replay.
+
+    python -m app.simulation.record recordings/monday --duration 3600
+
+Polls /live/vehicles and /live/stations on the configured feed
+(LIVE_FEED_URL) at the ingest interval and stores every successful
+response body unchanged, with the time it arrived. Replay it with
+app.simulation.replay.
+"""
+import argparse
+import asyncio
+import logging
+import time
+from typing import Optional
+
+import httpx
+
+from app.core.config import settings
+from app.simulation.archive import FEEDS, ArchiveWriter
+
+logger = logging.getLogger(__name__)
+
+
+async def record_feed(client: httpx.AsyncClient, writer: ArchiveWriter, base_url: str, feed: str,
+                      interval: float, until: Optional[float]):
+    url = f"{base_url}/live/{feed}"
+    while until is None or time.monotonic() < until:
+        started = time.monotonic()
+        try:
+            response = await client.get(url)
+            response.raise_for_status()
+        except Exception as e:
+            logger.error(f"[record {feed}] Fetch error: {e}")
+        else:
+            await asyncio.to_thread(writer.append, feed, response.content)
+        await asyncio.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+
+async def record(directory: str, base_url: str, feeds, interval: float, station_interval: float,
+                 duration: Optional[float], segment_bytes: int, segment_seconds: float):
+    writer = ArchiveWriter(directory, segment_bytes, segment_seconds, source=base_url,
+                           interval=interval, station_interval=station_interval)
+    until = time.monotonic() + duration if duration else None
+    try:
+        async with httpx.AsyncClient(timeout=30) as client:
+            await asyncio.gather(*(
+                record_feed(client, writer, base_url, feed,
+                            station_interval if feed == "stations" else interval, until)
+                for feed in feeds
+            ))
+    finally:
+        writer.close()
+        stats = writer.stats()
+        ratio = stats["raw_bytes"] / stats["stored_bytes"] if stats["stored_bytes"] else 0
+        print(f"Recorded {stats['records']} responses in {stats['segments']} segments "
+              f"({stats['raw_bytes']:,} bytes raw, {ratio:.1f}x compressed)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record live feed responses into an archive")
+    parser.add_argument("directory")
+    parser.add_argument("--url", default=settings.LIVE_FEED_URL, help="live feed base URL")
+    parser.add_argument("--feeds", default=",".join(FEEDS))
+    parser.add_argument("--interval", type=float, default=settings.INGEST_INTERVAL,
+                        help="seconds between /live/vehicles polls")
+    parser.add_argument("--station-interval", type=float, default=300,
+                        help="seconds between /live/stations polls")
+    parser.add_argument("--duration", type=float, help="seconds to record (default: until interrupted)")
+    parser.add_argument("--segment-mb", type=int, default=64)
+    parser.add_argument("--segment-minutes", type=float, default=60)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=settings.LOG_LEVEL)
+    feeds = [feed.strip() for feed in args.feeds.split(",") if feed.strip()]
+    try:
+        asyncio.run(record(args.directory, args.url.rstrip("/"), feeds, args.interval, args.station_interval,
+                           args.duration, args.segment_mb * 1024 * 1024, args.segment_minutes * 60))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
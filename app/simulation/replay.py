@@ -0,0 +1,172 @@
+"""
+Serve a recorded archive back as the live feed.
+
+    python -m app.simulation.replay recordings/monday --speed 10 --port 8765
+    LIVE_FEED_URL=http://127.0.0.1:8765 INGEST_INTERVAL=0.5 uvicorn main:app
+
+With --speed N the recording plays on a clock running N times faster than
+real time: each poll of /live/vehicles or /live/stations gets the last
+response recorded before the current replay time, so a poller that is
+slower than the recording skips responses just as it would have live. Speed
+0 plays as fast as possible instead: every /live/vehicles poll gets the
+next recorded response, and /live/stations follows along in recording
+time. Lower INGEST_INTERVAL so the ingest loops keep up with a fast replay.
+
+Records are streamed from disk one at a time, so memory stays flat however
+long the recording is.
+"""
+import argparse
+import json
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, Optional
+
+from app.simulation.archive import Record, read_manifest, read_records, summary
+from app.simulation.server import LiveFeedServer
+
+
+class FeedCursor:
+    """Position in one feed's responses with one record of lookahead"""
+
+    def __init__(self, directory: str, feed: str, start: Optional[float], end: Optional[float]):
+        self.directory = directory
+        self.feed = feed
+        self.start = start
+        self.end = end
+        self.rewind()
+
+    def rewind(self):
+        self._records: Iterator[Record] = read_records(self.directory, [self.feed], self.start, self.end)
+        self.current: Optional[Record] = None
+        self.next: Optional[Record] = next(self._records, None)
+        self.served = 0
+
+    @property
+    def finished(self) -> bool:
+        return self.next is None
+
+    def step(self) -> bool:
+        if self.next is None:
+            return False
+        self.current, self.next = self.next, next(self._records, None)
+        self.served += 1
+        return True
+
+    def advance_to(self, replay_time: float):
+        while self.next is not None and self.next[0] <= replay_time:
+            self.step()
+
+    def body(self) -> bytes:
+        return self.current[2] if self.current is not None else b"[]"
+
+
+class ReplayServer(LiveFeedServer):
+    def __init__(self, directory: str, speed: float = 1.0, loop: bool = False,
+                 start: Optional[float] = None, end: Optional[float] = None,
+                 host: str = "127.0.0.1", port: int = 0):
+        super().__init__(host, port)
+        self.directory = directory
+        self.speed = speed
+        self.loop = loop
+        self.cursors = {feed: FeedCursor(directory, feed, start, end) for feed in ("vehicles", "stations")}
+        firsts = [cursor.next[0] for cursor in self.cursors.values() if cursor.next is not None]
+        if not firsts:
+            raise ValueError(f"No recorded responses in {directory}")
+        self.origin = min(firsts)
+        self.loops = 0
+        self._started = time.monotonic()
+        self._replay_time = self.origin
+
+    def start(self):
+        self._started = time.monotonic()
+        super().start()
+
+    def _restart(self):
+        for cursor in self.cursors.values():
+            cursor.rewind()
+        self.loops += 1
+        self._started = time.monotonic()
+        self._replay_time = self.origin
+
+    def _sync(self, feed: str):
+        if self.speed > 0:
+            self._replay_time = self.origin + (time.monotonic() - self._started) * self.speed
+        elif feed == "vehicles":
+            vehicles = self.cursors["vehicles"]
+            if not vehicles.step() and self.loop:
+                self._restart()
+                vehicles.step()
+            if vehicles.current is not None:
+                self._replay_time = vehicles.current[0]
+        for cursor in self.cursors.values():
+            cursor.advance_to(self._replay_time)
+
+        if self.speed > 0 and self.loop and all(cursor.finished for cursor in self.cursors.values()):
+            last = max(cursor.current[0] for cursor in self.cursors.values() if cursor.current is not None)
+            # Hold the last responses for one recording interval's worth of replay time, then start over
+            if self._replay_time > last + (last - self.origin) / max(self.cursors["vehicles"].served, 1):
+                self._restart()
+                for cursor in self.cursors.values():
+                    cursor.advance_to(self._replay_time)
+
+    def vehicles_body(self) -> bytes:
+        with self.lock:
+            self._sync("vehicles")
+            return self.cursors["vehicles"].body()
+
+    def stations_body(self) -> bytes:
+        with self.lock:
+            self._sync("stations")
+            return self.cursors["stations"].body()
+
+    def health(self) -> Dict[str, Any]:
+        return {
+            "speed": self.speed,
+            "replay_time": datetime.fromtimestamp(self._replay_time, timezone.utc).isoformat(),
+            "served": {feed: cursor.served for feed, cursor in self.cursors.items()},
+            "finished": all(cursor.finished for cursor in self.cursors.values()),
+            "loops": self.loops,
+        }
+
+
+def parse_speed(text: str) -> float:
+    return 0.0 if text in ("max", "asap", "0") else float(text.rstrip("x"))
+
+
+def parse_time(text: Optional[str]) -> Optional[float]:
+    if not text:
+        return None
+    moment = datetime.fromisoformat(text)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a recorded live feed archive")
+    parser.add_argument("directory")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--speed", default="1", help="playback speed (1, 10x, ...) or max for as fast as possible")
+    parser.add_argument("--loop", action="store_true", help="start over when the recording ends (repeated rows keep their recorded timestamps, so ingest dedupes them)")
+    parser.add_argument("--start", help="replay from this time (ISO 8601, UTC unless given)")
+    parser.add_argument("--end", help="stop replaying at this time")
+    args = parser.parse_args()
+
+    info = {"manifest": read_manifest(args.directory), "feeds": summary(args.directory)}
+    print(json.dumps(info, indent=2))
+    server = ReplayServer(args.directory, parse_speed(args.speed), args.loop,
+                          parse_time(args.start), parse_time(args.end), args.host, args.port)
+    print(f"Replaying {args.directory} on {server.url} at "
+          f"{'max' if server.speed == 0 else f'{server.speed:g}x'} speed")
+    server.start()
+    try:
+        server.wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
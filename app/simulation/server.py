@@ -0,0 +1,376 @@
+"""
+Local stand-in for the live feed and the Digitransit GraphQL API.
+
+Serves a SyntheticFeed over HTTP on the loopback interface:
+
+    GET  /live/vehicles   render-cloud vehicle payload
+    GET  /live/stations   render-cloud station payload
+    POST /graphql         Digitransit-compatible GraphQL (also answered on
+                          any path ending in /graphql or /gtfs/v1)
+
+By default the feed advances one tick per /live/vehicles request, so a run
+is reproducible no matter how fast the client polls; with `--advance
+clock` it ticks on wall time instead.
+
+    python -m app.simulation.server --port 8765 --fleet-size 3000
+    LIVE_FEED_URL=http://127.0.0.1:8765 uvicorn main:app
+    DIGITRANSIT_API_URL=http://127.0.0.1:8765/graphql ...
+
+In-process, for tests and benchmarks:
+
+    with running_server(SyntheticFeed(seed=1)) as url:
+        ...
+"""
+import argparse
+import json
+import re
+import sys
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+from app.simulation.feed import MOVE_DISTRIBUTIONS, SyntheticFeed
+
+ADVANCE_MODES = ("request", "clock", "manual")
+
+TOKEN = re.compile(r'\.\.\.|"(?:[^"\\]|\\.)*"|-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?|[A-Za-z_]\w*|\$|[{}():,!\[\]=@]')
+
+
+class GraphQLError(Exception):
+    pass
+
+
+class Field:
+    __slots__ = ("name", "alias", "args", "selections")
+
+    def __init__(self, name: str, alias: str, args: Dict[str, Any], selections: List["Field"]):
+        self.name = name
+        self.alias = alias
+        self.args = args
+        self.selections = selections
+
+
+class QueryParser:
+    """
+    Parser for the subset of GraphQL the Digitransit clients send: one
+    operation, optional variable definitions, nested fields with aliases
+    and arguments. Fragments and directives are not supported.
+    """
+
+    def __init__(self, query: str, variables: Optional[Dict[str, Any]]):
+        self.tokens = TOKEN.findall(re.sub(r"#[^\n]*", "", query))
+        self.pos = 0
+        self.variables = variables or {}
+
+    def peek(self) -> Optional[str]:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def take(self, expected: Optional[str] = None) -> str:
+        token = self.peek()
+        if token is None or (expected is not None and token != expected):
+            raise GraphQLError(f"Syntax Error: expected {expected or 'token'}, found {token or '<EOF>'}")
+        self.pos += 1
+        return token
+
+    def parse(self) -> List[Field]:
+        if self.peek() in ("query", "subscription", "mutation"):
+            if self.take() != "query":
+                raise GraphQLError("Only queries are supported")
+            if self.peek() not in ("{", "("):
+                self.take()
+            if self.peek() == "(":
+                # Variable definitions: types and defaults only matter to a real server
+                depth = 0
+                while True:
+                    token = self.take()
+                    depth += token == "("
+                    depth -= token == ")"
+                    if depth == 0:
+                        break
+        return self.selection_set()
+
+    def selection_set(self) -> List[Field]:
+        self.take("{")
+        fields = []
+        while self.peek() != "}":
+            if self.peek() == "...":
+                raise GraphQLError("Fragments are not supported")
+            name = alias = self.take()
+            if self.peek() == ":":
+                self.take(":")
+                name = self.take()
+            args = self.arguments() if self.peek() == "(" else {}
+            selections = self.selection_set() if self.peek() == "{" else []
+            fields.append(Field(name, alias, args, selections))
+            if self.peek() == ",":
+                self.take()
+        self.take("}")
+        return fields
+
+    def arguments(self) -> Dict[str, Any]:
+        self.take("(")
+        args = {}
+        while self.peek() != ")":
+            name = self.take()
+            self.take(":")
+            args[name] = self.value()
+            if self.peek() == ",":
+                self.take()
+        self.take(")")
+        return args
+
+    def value(self) -> Any:
+        token = self.take()
+        if token == "$":
+            return self.variables.get(self.take())
+        if token.startswith('"'):
+            return json.loads(token)
+        if token == "[":
+            items = []
+            while self.peek() != "]":
+                items.append(self.value())
+                if self.peek() == ",":
+                    self.take()
+            self.take("]")
+            return items
+        if token in ("true", "false"):
+            return token == "true"
+        if token == "null":
+            return None
+        if re.fullmatch(r"-?\d+", token):
+            return int(token)
+        if re.fullmatch(r"-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?", token):
+            return float(token)
+        return token
+
+
+def project(fields: List[Field], value: Any) -> Any:
+    """Keep only the selected fields of a resolved object, like a GraphQL executor would"""
+    if value is None or not fields:
+        return value
+    if isinstance(value, list):
+        return [project(fields, item) for item in value]
+    return {field.alias: project(field.selections, value.get(field.name)) for field in fields}
+
+
+def execute(feed: SyntheticFeed, query: str, variables: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Run a Digitransit query against the feed and return the GraphQL response body"""
+    try:
+        fields = QueryParser(query, variables).parse()
+    except GraphQLError as e:
+        return {"errors": [{"message": str(e)}]}
+
+    data, errors = {}, []
+    for field in fields:
+        args = field.args
+        if field.name == "vehicles":
+            value = feed.digitransit_vehicles()
+        elif field.name in ("stops", "stations"):
+            value = feed.digitransit_stops(args.get("limit") or args.get("first"), args.get("skip") or 0,
+                                           args.get("name"))
+            if args.get("ids"):
+                wanted = set(args["ids"])
+                value = [stop for stop in value if stop["id"] in wanted]
+        elif field.name in ("stop", "station"):
+            index = feed.stop_index(args.get("id") or "")
+            value = feed.digitransit_stop(index) if index is not None else None
+        elif field.name == "routes":
+            value = feed.digitransit_routes(args.get("name"))
+        elif field.name == "route":
+            value = feed.digitransit_route_by_id(args.get("id") or "")
+        else:
+            errors.append({"message": f"Cannot query field \"{field.name}\" on type \"QueryType\"."})
+            continue
+        data[field.alias] = project(field.selections, value)
+
+    body = {"data": data}
+    if errors:
+        body["errors"] = errors
+    return body
+
+
+class LiveFeedServer(ThreadingHTTPServer):
+    """
+    Loopback HTTP server answering the live feed paths. Subclasses supply
+    the response bodies; GraphQL is answered when graphql() is implemented.
+    """
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        super().__init__((host, port), FeedHandler)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def vehicles_body(self) -> bytes:
+        raise NotImplementedError
+
+    def stations_body(self) -> bytes:
+        raise NotImplementedError
+
+    def health(self) -> Dict[str, Any]:
+        return {}
+
+    def graphql(self, request: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        return None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="feed-server", daemon=True)
+        self._thread.start()
+
+    def wait(self):
+        self._thread.join()
+
+    def stop(self):
+        self._stop.set()
+        self.shutdown()
+        self.server_close()
+
+    def handle_error(self, request, client_address):
+        # Clients going away mid-response (a cancelled poll) are not worth a traceback
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+
+class FeedServer(LiveFeedServer):
+    """Serves a SyntheticFeed, including its Digitransit GraphQL view"""
+
+    def __init__(self, feed: SyntheticFeed, host: str = "127.0.0.1", port: int = 0, advance: str = "request"):
+        if advance not in ADVANCE_MODES:
+            raise ValueError(f"Unknown advance mode: {advance}")
+        super().__init__(host, port)
+        self.feed = feed
+        self.advance = advance
+        self._stations_body: Optional[bytes] = None
+        self._ticker: Optional[threading.Thread] = None
+
+    def vehicles_body(self) -> bytes:
+        with self.lock:
+            if self.advance == "request":
+                self.feed.advance()
+            return json.dumps(self.feed.live_vehicles()).encode()
+
+    def stations_body(self) -> bytes:
+        # Stations never change once the feed is built
+        if self._stations_body is None:
+            self._stations_body = json.dumps(self.feed.live_stations()).encode()
+        return self._stations_body
+
+    def health(self) -> Dict[str, Any]:
+        return {"ticks": self.feed.ticks, "now": self.feed.now.isoformat()}
+
+    def graphql(self, request: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            return execute(self.feed, request.get("query") or "", request.get("variables"))
+
+    def start(self):
+        super().start()
+        if self.advance == "clock":
+            self._ticker = threading.Thread(target=self._tick, name="feed-ticker", daemon=True)
+            self._ticker.start()
+
+    def _tick(self):
+        while not self._stop.wait(self.feed.tick_seconds):
+            with self.lock:
+                self.feed.advance()
+
+
+class FeedHandler(BaseHTTPRequestHandler):
+    server: LiveFeedServer
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0].rstrip("/")
+        if path == "/live/vehicles":
+            self._send(200, self.server.vehicles_body())
+        elif path == "/live/stations":
+            self._send(200, self.server.stations_body())
+        elif path == "/health":
+            self._send(200, json.dumps(self.server.health()).encode())
+        else:
+            self._send(404, b'{"error": "Not found"}')
+
+    def do_POST(self):
+        path = self.path.split("?", 1)[0].rstrip("/")
+        if not (path.endswith("/graphql") or path.endswith("/gtfs/v1")):
+            self._send(404, b'{"error": "Not found"}')
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)))
+        except ValueError:
+            self._send(400, json.dumps({"errors": [{"message": "Body is not valid JSON"}]}).encode())
+            return
+        body = self.server.graphql(request)
+        if body is None:
+            self._send(404, b'{"error": "Not found"}')
+            return
+        self._send(200, json.dumps(body).encode())
+
+    def _send(self, status: int, body: bytes):
+        self.server.requests += 1
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@contextmanager
+def running_server(feed: SyntheticFeed, advance: str = "request", host: str = "127.0.0.1", port: int = 0):
+    """Serve `feed` on a free loopback port for the duration of the block, yielding its base URL"""
+    server = FeedServer(feed, host, port, advance)
+    server.start()
+    try:
+        yield server.url
+    finally:
+        server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a synthetic live feed and Digitransit GraphQL API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--fleet-size", type=int, default=1500)
+    parser.add_argument("--station-count", type=int, default=8000)
+    parser.add_argument("--route-count", type=int, default=200)
+    parser.add_argument("--update-rate", type=float, default=0.2, help="reports per vehicle per second")
+    parser.add_argument("--tick-seconds", type=float, default=5)
+    parser.add_argument("--move-distribution", choices=MOVE_DISTRIBUTIONS, default="lognormal")
+    parser.add_argument("--move-mean", type=float, default=8.0, help="metres per second")
+    parser.add_argument("--advance", choices=ADVANCE_MODES, default="request")
+    args = parser.parse_args()
+
+    feed = SyntheticFeed(
+        seed=args.seed,
+        fleet_size=args.fleet_size,
+        station_count=args.station_count,
+        route_count=args.route_count,
+        update_rate=args.update_rate,
+        tick_seconds=args.tick_seconds,
+        move_distribution=args.move_distribution,
+        move_mean=args.move_mean,
+    )
+    server = FeedServer(feed, args.host, args.port, args.advance)
+    print(f"Serving synthetic feed on {server.url} ({args.fleet_size} vehicles, {args.station_count} stations)")
+    server.start()
+    try:
+        server.wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Repeatable benchmarks.
+
+    python -m benchmarks run [--dsn postgresql://postgres@localhost/postgres] [--sizes 10k,1m,10m]
+                             [--out benchmarks/results/report.json] [--baseline old.json]
+    python -m benchmarks compare baseline.json report.json [--tolerance 0.1]
+
+`run` creates a disposable database (on the --dsn server, or in a
+temporary initdb cluster), migrates it to head, starts the synthetic feed
+server and measures:
+
+- ingest rows/s: the write_vehicles bulk insert, a whole IngestPipeline
+  against the stand-in feed, and DataService.store_vehicle_data
+- p50/p95/p99 of every main.py endpoint at each vehicles table size
+- station search latency per search term
+- Python versus Postgres JSON rendering of the large responses (render)
+- DigitransitService and live feed parse throughput
+- timetable (GTFS) earliest-arrival and profile journey queries
+
+The JSON report can be compared with a baseline; `compare` (and `run
+--baseline`) exit with status 1 when any measurement regressed by more than
+the tolerance.
+"""
+import argparse
+import asyncio
+import sys
+
+import asyncpg
+
+from app.simulation.feed import SyntheticFeed
+from app.simulation.server import running_server
+
+from benchmarks import endpoints, ingest, parse, report as reports, seed, timetable
+from benchmarks.postgres import disposable_postgres, migrate
+
+SUITES = ("parse", "ingest", "endpoints", "search", "render", "timetable")
+
+
+def parse_size(text: str) -> int:
+    text = text.strip().lower()
+    scale = {"k": 1_000, "m": 1_000_000}.get(text[-1:], 1)
+    return int(float(text.rstrip("km")) * scale)
+
+
+async def run_database_suites(args, dsn: str, report: reports.Report):
+    feed = SyntheticFeed(seed=args.seed)
+    db = await asyncpg.create_pool(dsn)
+    try:
+        await seed.seed_stations(db, feed)
+        with running_server(SyntheticFeed(seed=args.seed)) as feed_url:
+            if "ingest" in args.suites:
+                print("ingest")
+                await ingest.bench_write_vehicles(db, report, feed, args.ingest_rows)
+                await ingest.bench_pipeline(db, report, feed_url, args.pipeline_seconds)
+                await db.execute("TRUNCATE vehicles")
+
+            if set(args.suites) & {"endpoints", "search", "render"}:
+                for label in args.sizes:
+                    rows = parse_size(label)
+                    print(f"endpoints at {label} rows")
+                    await seed.grow_vehicles(db, rows)
+                    async with endpoints.running_app(dsn, feed_url) as client:
+                        if "endpoints" in args.suites:
+                            await endpoints.bench_endpoints(client, db, report, label, rows, args.requests,
+                                                            args.warmup, args.max_full_scan_rows)
+                        if "search" in args.suites and label == args.sizes[0]:
+                            await endpoints.bench_station_search(client, report, args.requests, args.warmup)
+                        if "render" in args.suites:
+                            await endpoints.bench_rendering(client, report, label, rows, args.requests,
+                                                            args.warmup, args.max_full_scan_rows)
+    finally:
+        await db.close()
+
+
+def run(args) -> int:
+    args.sizes = [size.strip() for size in args.sizes.split(",") if size.strip()]
+    args.suites = [suite.strip() for suite in args.suites.split(",") if suite.strip()]
+    report = reports.Report(sizes=args.sizes, suites=args.suites, seed=args.seed, requests=args.requests)
+
+    if "parse" in args.suites:
+        print("parse")
+        feed = SyntheticFeed(seed=args.seed)
+        parse.bench_digitransit_parse(report, feed)
+        parse.bench_live_feed_parse(report, feed)
+
+    if "timetable" in args.suites:
+        print("timetable")
+        timetable.bench_timetable(report, SyntheticFeed(seed=args.seed, fleet_size=1), args.journeys,
+                                  args.window_minutes, args.seed)
+
+    if set(args.suites) & {"ingest", "endpoints", "search", "render"}:
+        with disposable_postgres(args.dsn, args.pg_bin) as dsn:
+            migrate(dsn)
+            report.meta["postgres"] = asyncio.run(server_version(dsn))
+            asyncio.run(run_database_suites(args, dsn, report))
+            if "ingest" in args.suites:
+                with disposable_postgres(args.dsn, args.pg_bin) as orm_dsn:
+                    ingest.bench_store_vehicle_data(orm_dsn, report, SyntheticFeed(seed=args.seed))
+
+    report.save(args.out)
+    print(f"Report written to {args.out}")
+    if args.baseline:
+        rows = reports.compare(reports.load(args.baseline), report.to_dict(), args.tolerance)
+        reports.print_comparison(rows)
+        return 1 if any(row["regressed"] for row in rows) else 0
+    return 0
+
+
+async def server_version(dsn: str) -> str:
+    conn = await asyncpg.connect(dsn)
+    try:
+        return await conn.fetchval("SHOW server_version")
+    finally:
+        await conn.close()
+
+
+def compare(args) -> int:
+    rows = reports.compare(reports.load(args.baseline), reports.load(args.current), args.tolerance)
+    reports.print_comparison(rows)
+    return 1 if any(row["regressed"] for row in rows) else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__.split("\n\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run the benchmarks and write a JSON report")
+    run_parser.add_argument("--dsn", help="admin DSN of a Postgres server to create the disposable database on "
+                                          "(default: a temporary initdb cluster)")
+    run_parser.add_argument("--pg-bin", help="directory holding initdb and pg_ctl")
+    run_parser.add_argument("--sizes", default="10k,1m,10m", help="vehicles table sizes for the endpoint runs")
+    run_parser.add_argument("--suites", default=",".join(SUITES))
+    run_parser.add_argument("--requests", type=int, default=200, help="timed requests per endpoint")
+    run_parser.add_argument("--warmup", type=int, default=10)
+    run_parser.add_argument("--max-full-scan-rows", type=int, default=1_000_000)
+    run_parser.add_argument("--ingest-rows", type=int, default=200_000)
+    run_parser.add_argument("--pipeline-seconds", type=float, default=15)
+    run_parser.add_argument("--journeys", type=int, default=200, help="timed timetable queries")
+    run_parser.add_argument("--window-minutes", type=int, default=30, help="departure window of the profile queries")
+    run_parser.add_argument("--seed", type=int, default=42)
+    run_parser.add_argument("--out", default="benchmarks/results/report.json")
+    run_parser.add_argument("--baseline", help="report to compare against")
+    run_parser.add_argument("--tolerance", type=float, default=0.1, help="allowed relative regression")
+    run_parser.set_defaults(func=run)
+
+    compare_parser = commands.add_parser("compare", help="compare two reports")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--tolerance", type=float, default=0.1)
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    sys.exit(args.func(args))
+
+
+if __name__ == "__main__":
+    main()
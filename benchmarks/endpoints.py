@@ -0,0 +1,151 @@
+"""
+Endpoint latency against the real app.
+
+main.app is started with its own lifespan (pool, recent window, views and
+the ingest loops polling the stand-in feed) and called in-process through
+httpx's ASGI transport, so the numbers cover routing, middleware, queries
+and serialisation but not the network.
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from datetime import date, timedelta
+from typing import Callable, List, NamedTuple
+
+import httpx
+
+from app.core.config import settings
+
+from benchmarks.report import Report
+
+SEARCH_TERMS = ["ka", "kamp", "asema", "ntie", "(M)", "zzz", "Pi", "ruo", "hel", "nranta"]
+
+
+class Endpoint(NamedTuple):
+    name: str
+    url: Callable[[int], str]  # request number -> URL
+    full_scan: bool = False  # returns every row; skipped above --max-full-scan-rows
+
+
+def endpoints(station_ids: List[int], station_names: List[str]) -> List[Endpoint]:
+    today = date.today()
+    return [
+        Endpoint("/api/vehicles", lambda i: "/api/vehicles", full_scan=True),
+        Endpoint("/api/stats/by_type", lambda i: "/api/stats/by_type"),
+        Endpoint("/api/stats/hourly", lambda i: f"/api/stats/hourly?date={today - timedelta(days=i % 7)}"),
+        Endpoint("/api/stats/daily",
+                 lambda i: f"/api/stats/daily?start_date={today - timedelta(days=29)}&end_date={today}"),
+        Endpoint("/api/stats/by_station", lambda i: "/api/stats/by_station?limit=10"),
+        Endpoint("/api/stations/search",
+                 lambda i: f"/api/stations/search?query={SEARCH_TERMS[i % len(SEARCH_TERMS)]}"),
+        Endpoint("/api/station/{station_id}", lambda i: f"/api/station/{station_ids[i % len(station_ids)]}"),
+        Endpoint("/api/stations/route",
+                 lambda i: f"/api/stations/route?from_station={station_names[i % len(station_names)]}"
+                           f"&to_station={station_names[(i * 7 + 3) % len(station_names)]}"),
+    ]
+
+
+@asynccontextmanager
+async def running_app(dsn: str, feed_url: str, ready_timeout: float = 300):
+    """Start main.app against `dsn` and the stand-in feed; yields an httpx client bound to it"""
+    import main
+
+    settings.DATABASE_URL = dsn
+    settings.LIVE_FEED_URL = feed_url
+    settings.DIGITRANSIT_API_URL = f"{feed_url}/graphql"
+    # A catalog saved from another database must not answer for this one
+    settings.CATALOG_PATH = ""
+    settings.INGEST_SPOOL_DIR = ""
+    settings.TRACE_FILE = ""
+
+    async with main.lifespan(main.app):
+        deadline = time.monotonic() + ready_timeout
+        while not (main.app.state.window.ready and main.app.state.views_ready and main.app.state.graph is not None):
+            if time.monotonic() > deadline:
+                raise TimeoutError("App did not load its recent window, views and route graph in time")
+            await asyncio.sleep(0.5)
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            yield client
+
+
+async def measure(client: httpx.AsyncClient, endpoint: Endpoint, requests: int, warmup: int):
+    samples, statuses = [], {}
+    for i in range(warmup + requests):
+        started = time.perf_counter()
+        response = await client.get(endpoint.url(i))
+        await response.aread()
+        elapsed = time.perf_counter() - started
+        if i >= warmup:
+            samples.append(elapsed)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+    return samples, statuses
+
+
+async def bench_endpoints(client: httpx.AsyncClient, db, report: Report, size_label: str, rows: int,
+                          requests: int, warmup: int, max_full_scan_rows: int):
+    station_ids = [r["id"] for r in await db.fetch("SELECT id FROM stations ORDER BY id LIMIT 500")]
+    station_names = [r["station_name"] for r in await db.fetch(
+        "SELECT station_name FROM stations GROUP BY station_name ORDER BY station_name LIMIT 500")]
+    for endpoint in endpoints(station_ids, station_names):
+        name = f"endpoint.{size_label}.{endpoint.name}"
+        if endpoint.full_scan and rows > max_full_scan_rows:
+            report.skip(name, f"returns all {rows:,} rows")
+            continue
+        count = max(5, requests // 10) if endpoint.full_scan else requests
+        samples, statuses = await measure(client, endpoint, count, warmup)
+        report.add_latency(name, samples, rows=rows, statuses=statuses)
+
+
+async def bench_station_search(client: httpx.AsyncClient, report: Report, requests: int, warmup: int):
+    """Latency per search term: short and long needles, frequent and absent matches"""
+    for term in SEARCH_TERMS:
+        endpoint = Endpoint(term, lambda i, term=term: f"/api/stations/search?query={term}")
+        samples, statuses = await measure(client, endpoint, requests, warmup)
+        report.add_latency(f"search.{term}", samples, statuses=statuses)
+
+
+def render_endpoints() -> List[Endpoint]:
+    today = date.today()
+    return [
+        Endpoint("/api/vehicles", lambda i: "/api/vehicles", full_scan=True),
+        Endpoint("/api/stats/hourly", lambda i: f"/api/stats/hourly?date={today - timedelta(days=i % 7)}"),
+        Endpoint("/api/stats/daily",
+                 lambda i: f"/api/stats/daily?start_date={today - timedelta(days=29)}&end_date={today}"),
+        Endpoint("/api/stats/by_station", lambda i: "/api/stats/by_station?limit=1000"),
+        Endpoint("/api/stations/search", lambda i: "/api/stations/search?query=a"),
+    ]
+
+
+async def bench_rendering(client: httpx.AsyncClient, report: Report, size_label: str, rows: int,
+                          requests: int, warmup: int, max_full_scan_rows: int):
+    """
+    The same SQL-backed responses rendered row by row in Python and as JSON
+    by Postgres. The recent window is switched off for the run so every
+    endpoint takes its query path; bytes per response are recorded so the
+    gain can be read against response size.
+    """
+    import main
+
+    window, mode = main.app.state.window, settings.JSON_RENDERING
+    window_ready, window.ready = window.ready, False
+    try:
+        for endpoint in render_endpoints():
+            if endpoint.full_scan and rows > max_full_scan_rows:
+                report.skip(f"render.{size_label}.{endpoint.name}", f"returns all {rows:,} rows")
+                continue
+            count = max(5, requests // 10) if endpoint.full_scan else requests
+            p50 = {}
+            for rendering in ("python", "postgres"):
+                settings.JSON_RENDERING = rendering
+                response = await client.get(endpoint.url(0))
+                name = f"render.{size_label}.{rendering}.{endpoint.name}"
+                samples, statuses = await measure(client, endpoint, count, warmup)
+                report.add_latency(name, samples, rows=rows, bytes=len(response.content), statuses=statuses)
+                p50[rendering] = report.results[f"{name}.p50"]["value"]
+            if p50["postgres"]:
+                report.add(f"render.{size_label}.speedup.{endpoint.name}", p50["python"] / p50["postgres"],
+                           "x", "higher", bytes=len(response.content))
+    finally:
+        settings.JSON_RENDERING = mode
+        window.ready = window_ready
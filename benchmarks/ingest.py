@@ -0,0 +1,119 @@
+"""
+Ingest throughput.
+
+- write_vehicles: the bulk INSERT auto_sync_loop's writers run, fed with
+  batches of synthetic feed rows
+- pipeline: a whole IngestPipeline polling the stand-in feed as fast as it
+  answers, from HTTP fetch to committed rows
+- store_vehicle_data: the Flask scheduler's DataService path, on its own
+  database since its ORM models use a different vehicles table
+"""
+import asyncio
+import time
+
+from app.core.config import settings
+from app.services.ingest_pipeline import IngestPipeline
+from app.services.live_feed import normalise_vehicle, vehicle_key, write_vehicles
+from app.simulation.feed import SyntheticFeed
+
+from benchmarks.report import Report
+
+
+def feed_rows(feed: SyntheticFeed, count: int):
+    """`count` distinct vehicle rows from consecutive feed ticks"""
+    rows = {}
+    while len(rows) < count:
+        feed.advance()
+        for entry in feed.live_vehicles():
+            row = normalise_vehicle(entry)
+            rows[vehicle_key(row)] = row
+    return list(rows.values())[:count]
+
+
+async def bench_write_vehicles(db, report: Report, feed: SyntheticFeed, rows: int = 200_000):
+    data = feed_rows(feed, rows)
+    batch_size = settings.INGEST_BATCH_SIZE
+    inserted = 0
+    started = time.perf_counter()
+    for i in range(0, len(data), batch_size):
+        inserted += len(await write_vehicles(db, data[i:i + batch_size]))
+    elapsed = time.perf_counter() - started
+    report.add("ingest.write_vehicles.rows_per_s", inserted / elapsed, "rows/s", "higher",
+               rows=inserted, batch_size=batch_size)
+
+
+async def bench_pipeline(db, report: Report, feed_url: str, seconds: float = 15):
+    inserted = 0
+
+    async def write(rows):
+        nonlocal inserted
+        written = await write_vehicles(db, rows)
+        inserted += len(written)
+        return written
+
+    pipeline = IngestPipeline(
+        "bench", f"{feed_url}/live/vehicles", normalise_vehicle, vehicle_key, write,
+        interval=0, writers=settings.INGEST_WRITERS, batch_size=settings.INGEST_BATCH_SIZE,
+        queue_size=settings.INGEST_QUEUE_SIZE, overflow_policy="merge",
+        max_pending_rows=settings.INGEST_MAX_PENDING_ROWS,
+        dedupe_ttl=settings.INGEST_DEDUPE_TTL, dedupe_max_keys=settings.INGEST_DEDUPE_MAX_KEYS,
+        log_sample_rate=0,
+    )
+    task = asyncio.create_task(pipeline.run())
+    started = time.perf_counter()
+    await asyncio.sleep(seconds)
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    elapsed = time.perf_counter() - started
+    fetch = pipeline.stages["fetch"]
+    report.add("ingest.pipeline.rows_per_s", inserted / elapsed, "rows/s", "higher",
+               rows=inserted, seconds=round(elapsed, 1))
+    report.add("ingest.pipeline.fetch_avg_ms", fetch.avg_latency * 1000, "ms", "lower")
+
+
+def bench_store_vehicle_data(dsn: str, report: Report, feed: SyntheticFeed, ticks: int = 5):
+    name = "ingest.store_vehicle_data.rows_per_s"
+    try:
+        from flask import Flask
+        from models import db as orm
+        from app.models.transport import Position, Vehicle, VehicleMode
+        from app.services.data_services import DataService
+    except ImportError as e:
+        report.skip(name, f"missing dependency: {e.name}")
+        return
+
+    from benchmarks.postgres import sqlalchemy_url
+
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = sqlalchemy_url(dsn)
+    orm.init_app(app)
+    with app.app_context():
+        orm.create_all()
+        service = DataService()
+        stored = 0
+        elapsed = 0.0
+        for _ in range(ticks):
+            feed.advance()
+            vehicles = [
+                Vehicle(
+                    id=v["id"],
+                    route_id=v["trip"]["route"]["id"],
+                    trip_id=v["trip"]["id"],
+                    mode=VehicleMode(v["trip"]["route"]["mode"]),
+                    position=Position(lat=v["position"]["latitude"], lng=v["position"]["longitude"]),
+                    speed=v["speed"],
+                    heading=v["heading"],
+                    vehicle_number=v["vehicleNumber"],
+                    operator_id=v["operatorId"],
+                )
+                for v in feed.digitransit_vehicles()
+            ]
+            started = time.perf_counter()
+            stored += service.store_vehicle_data(vehicles)
+            elapsed += time.perf_counter() - started
+        orm.session.remove()
+        orm.engine.dispose()
+    report.add(name, stored / elapsed, "rows/s", "higher", rows=stored)
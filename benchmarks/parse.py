@@ -0,0 +1,61 @@
+"""
+Payload parsing throughput, without any network or database:
+DigitransitService.get_vehicles over a canned GraphQL response, and the
+live feed normaliser the ingest pipeline's decode stage runs.
+"""
+import time
+
+from app.services.live_feed import normalise_station, normalise_vehicle
+from app.simulation.feed import SyntheticFeed
+
+from benchmarks.report import Report
+
+
+class CannedClient:
+    """GraphQLClient stand-in returning the same response to every query"""
+
+    def __init__(self, data):
+        self.data = data
+
+    def execute_query(self, query_str, variables=None):
+        return self.data
+
+
+def throughput(fn, items: int, min_seconds: float = 2.0) -> float:
+    """Items per second of fn(), repeated for at least min_seconds"""
+    calls = 0
+    started = time.perf_counter()
+    while True:
+        fn()
+        calls += 1
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_seconds:
+            return calls * items / elapsed
+
+
+def bench_digitransit_parse(report: Report, feed: SyntheticFeed):
+    name = "parse.digitransit_vehicles.rows_per_s"
+    try:
+        from app.services.digitransit_service import DigitransitService
+    except ImportError as e:
+        report.skip(name, f"missing dependency: {e.name}")
+        return
+    data = {"vehicles": feed.digitransit_vehicles()}
+    # Skip __init__: it builds a real GraphQL client
+    service = DigitransitService.__new__(DigitransitService)
+    service.client = CannedClient(data)
+    report.add(name, throughput(service.get_vehicles, len(data["vehicles"])), "rows/s", "higher")
+
+    stops = {"stops": feed.digitransit_stops()}
+    service.client = CannedClient(stops)
+    report.add("parse.digitransit_stops.rows_per_s",
+               throughput(service.get_stations, len(stops["stops"])), "rows/s", "higher")
+
+
+def bench_live_feed_parse(report: Report, feed: SyntheticFeed):
+    vehicles = feed.live_vehicles()
+    stations = feed.live_stations()
+    report.add("parse.live_vehicles.rows_per_s",
+               throughput(lambda: [normalise_vehicle(e) for e in vehicles], len(vehicles)), "rows/s", "higher")
+    report.add("parse.live_stations.rows_per_s",
+               throughput(lambda: [normalise_station(e) for e in stations], len(stations)), "rows/s", "higher")
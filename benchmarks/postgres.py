@@ -0,0 +1,106 @@
+"""
+Disposable Postgres for benchmark runs.
+
+With an admin DSN a throwaway database is created on that server and
+dropped afterwards. Without one, a temporary cluster is initialised with
+initdb (from --pg-bin or PATH), started on a free port and removed at exit.
+Either way the schema comes from the Alembic migrations, so the benchmark
+measures the same tables and indexes production runs on.
+"""
+import asyncio
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+import uuid
+from contextlib import contextmanager
+from typing import Iterator, Optional
+from urllib.parse import urlsplit, urlunsplit
+
+import asyncpg
+
+MIGRATIONS_INI = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "migrations", "alembic.ini")
+
+
+def with_database(dsn: str, database: str) -> str:
+    parts = urlsplit(dsn)
+    return urlunsplit(parts._replace(path=f"/{database}"))
+
+
+def sqlalchemy_url(dsn: str) -> str:
+    """SQLAlchemy URL for an asyncpg DSN, pinned to psycopg2 as in requirements.txt"""
+    scheme, rest = dsn.split("://", 1)
+    return f"postgresql+psycopg2://{rest}" if scheme in ("postgres", "postgresql") else dsn
+
+
+async def _admin(dsn: str, statement: str):
+    conn = await asyncpg.connect(dsn)
+    try:
+        await conn.execute(statement)
+    finally:
+        await conn.close()
+
+
+@contextmanager
+def temporary_database(admin_dsn: str, prefix: str = "bench") -> Iterator[str]:
+    name = f"{prefix}_{uuid.uuid4().hex[:10]}"
+    asyncio.run(_admin(admin_dsn, f'CREATE DATABASE "{name}"'))
+    try:
+        yield with_database(admin_dsn, name)
+    finally:
+        asyncio.run(_admin(admin_dsn, f'DROP DATABASE IF EXISTS "{name}" WITH (FORCE)'))
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def temporary_cluster(pg_bin: Optional[str] = None) -> Iterator[str]:
+    initdb = os.path.join(pg_bin, "initdb") if pg_bin else shutil.which("initdb")
+    if not initdb or not os.path.exists(initdb):
+        raise RuntimeError("initdb not found: pass --pg-bin or --dsn")
+    pg_ctl = os.path.join(os.path.dirname(initdb), "pg_ctl")
+    root = tempfile.mkdtemp(prefix="bench-pg-")
+    data = os.path.join(root, "data")
+    port = _free_port()
+    subprocess.run([initdb, "-D", data, "-U", "postgres", "-A", "trust", "--no-sync"],
+                   check=True, stdout=subprocess.DEVNULL)
+    subprocess.run([pg_ctl, "-D", data, "-w", "-l", os.path.join(root, "server.log"),
+                    "-o", f"-p {port} -k {root} -c listen_addresses=127.0.0.1", "start"],
+                   check=True, stdout=subprocess.DEVNULL)
+    try:
+        yield f"postgresql://postgres@127.0.0.1:{port}/postgres"
+    finally:
+        subprocess.run([pg_ctl, "-D", data, "-m", "immediate", "stop"], stdout=subprocess.DEVNULL)
+        shutil.rmtree(root, ignore_errors=True)
+
+
+@contextmanager
+def disposable_postgres(admin_dsn: Optional[str] = None, pg_bin: Optional[str] = None) -> Iterator[str]:
+    """DSN of an empty database that disappears when the block exits"""
+    if admin_dsn:
+        with temporary_database(admin_dsn) as dsn:
+            yield dsn
+    else:
+        with temporary_cluster(pg_bin) as dsn:
+            yield dsn
+
+
+def migrate(dsn: str):
+    """Bring the database to the head Alembic revision"""
+    from alembic import command
+    from alembic.config import Config
+
+    from app.core.config import settings
+
+    # migrations/env.py reads the URL from the app settings
+    previous = settings.DATABASE_URL
+    settings.DATABASE_URL = sqlalchemy_url(dsn)
+    try:
+        command.upgrade(Config(MIGRATIONS_INI), "head")
+    finally:
+        settings.DATABASE_URL = previous
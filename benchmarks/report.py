@@ -0,0 +1,114 @@
+"""
+Benchmark report: a flat map of named measurements written as JSON.
+
+Every measurement records which direction is better, so two reports can be
+compared without knowing what each number means.
+"""
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List
+
+import numpy as np
+
+
+def latency_summary(samples: Iterable[float]) -> Dict[str, float]:
+    """Percentiles in milliseconds of latency samples given in seconds"""
+    values = np.asarray(list(samples), dtype=float) * 1000
+    if values.size == 0:
+        return {"n": 0}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        "n": int(values.size),
+        "mean_ms": round(float(values.mean()), 3),
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "max_ms": round(float(values.max()), 3),
+    }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+class Report:
+    def __init__(self, **meta):
+        self.meta = {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "revision": git_revision(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            **meta,
+        }
+        self.results: Dict[str, Dict[str, Any]] = {}
+        self.skipped: Dict[str, str] = {}
+
+    def add(self, name: str, value: float, unit: str, better: str, **extra):
+        """Record one measurement; `better` is "higher" or "lower" """
+        self.results[name] = {"value": round(float(value), 3), "unit": unit, "better": better, **extra}
+        print(f"  {name}: {value:,.3f} {unit}")
+
+    def add_latency(self, name: str, samples: Iterable[float], **extra):
+        """Record p50/p95/p99 of a latency distribution as three measurements"""
+        summary = latency_summary(samples)
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            if key in summary:
+                self.add(f"{name}.{key[:-3]}", summary[key], "ms", "lower", n=summary["n"], **extra)
+
+    def skip(self, name: str, reason: str):
+        self.skipped[name] = reason
+        print(f"  {name}: skipped ({reason})")
+
+    def to_dict(self):
+        return {"meta": self.meta, "results": self.results, "skipped": self.skipped}
+
+    def save(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+
+def load(path: str) -> Dict[str, Any]:
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], tolerance: float = 0.1) -> List[Dict[str, Any]]:
+    """
+    Measurements present in both reports with their relative change.
+    A measurement regresses when it moved the wrong way by more than
+    `tolerance` (0.1 = 10%).
+    """
+    rows = []
+    for name, now in sorted(current["results"].items()):
+        before = baseline["results"].get(name)
+        if before is None or not before["value"]:
+            continue
+        change = (now["value"] - before["value"]) / before["value"]
+        worse = -change if now["better"] == "higher" else change
+        rows.append({
+            "name": name,
+            "baseline": before["value"],
+            "current": now["value"],
+            "unit": now["unit"],
+            "change": round(change, 4),
+            "regressed": worse > tolerance,
+        })
+    return rows
+
+
+def print_comparison(rows: List[Dict[str, Any]]):
+    for row in rows:
+        flag = "REGRESSION" if row["regressed"] else ""
+        print(f"{row['name']:<60} {row['baseline']:>12,.3f} -> {row['current']:>12,.3f} {row['unit']:<7}"
+              f" {row['change'] * 100:+7.1f}% {flag}")
@@ -0,0 +1,54 @@
+"""
+Table contents for the endpoint benchmarks.
+
+Stations come from the synthetic feed; vehicle events are generated in
+Postgres with a seeded random(), so the same --sizes give the same table
+contents on every run. Sizes grow in place: seeding 1M after 10k only
+inserts the difference.
+"""
+import time
+
+from app.db.views import VIEWS, ensure_views, refresh_view
+from app.services.live_feed import normalise_station, write_stations
+from app.simulation.feed import SyntheticFeed
+
+CHUNK_ROWS = 1_000_000
+
+GROW_VEHICLES = """
+    INSERT INTO vehicles (type, station_id, timestamp, status)
+    SELECT
+        (ARRAY['BUS', 'BUS', 'BUS', 'TRAM', 'TRAIN', 'SUBWAY', 'FERRY'])[1 + floor(random() * 7)::int],
+        $1 + floor(random() * $2)::int,
+        (now() AT TIME ZONE 'UTC') - random() * make_interval(days => $3),
+        'ACTIVE'
+    FROM generate_series(1, $4)
+    ON CONFLICT DO NOTHING
+"""
+
+
+async def seed_stations(db, feed: SyntheticFeed):
+    rows = [normalise_station(entry) for entry in feed.live_stations()]
+    for i in range(0, len(rows), 1000):
+        await write_stations(db, rows[i:i + 1000])
+
+
+async def grow_vehicles(db, target: int, days: int = 30, seed: float = 0.42) -> int:
+    """Insert random vehicle events until the table holds `target` rows; returns rows added"""
+    current = await db.fetchval("SELECT COUNT(*) FROM vehicles")
+    first_id, last_id = await db.fetchrow("SELECT MIN(id), MAX(id) FROM stations")
+    added = 0
+    async with db.acquire() as conn:
+        # Same seed, same contents: random() continues from here on this connection
+        await conn.execute(f"SELECT setseed({seed})")
+        while current + added < target:
+            chunk = min(CHUNK_ROWS, target - current - added)
+            started = time.perf_counter()
+            await conn.execute(GROW_VEHICLES, first_id, last_id - first_id + 1, days, chunk)
+            added += chunk
+            print(f"  seeded {current + added:,} vehicle rows ({chunk / (time.perf_counter() - started):,.0f} rows/s)")
+    await db.execute("ANALYZE vehicles")
+    await db.execute("ANALYZE stations")
+    await ensure_views(db)
+    for name in VIEWS:
+        await refresh_view(db, name, concurrently=False)
+    return added
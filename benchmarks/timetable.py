@@ -0,0 +1,53 @@
+"""
+Timetable journey planning over the synthetic network written as GTFS
+(app.simulation.gtfs): compiling the feed, loading the compiled cache, and
+the latency of earliest-arrival and departure-window profile queries
+between random pairs of stops at random times of a weekday.
+"""
+import os
+import random
+import tempfile
+import time
+from datetime import timedelta
+
+from app.simulation.feed import SyntheticFeed
+from app.simulation.gtfs import write_gtfs
+from app.services.connection_scan import Timetable
+
+from benchmarks.report import Report
+
+
+def bench_timetable(report: Report, feed: SyntheticFeed, queries: int, window_minutes: int, seed: int):
+    with tempfile.TemporaryDirectory(prefix="bench-gtfs-") as directory:
+        stop_times = write_gtfs(feed, directory)
+        cache = os.path.join(directory, "timetable.npz")
+
+        started = time.perf_counter()
+        Timetable.load(directory, cache)
+        report.add("timetable.compile_s", time.perf_counter() - started, "s", "lower", stop_times=stop_times)
+        started = time.perf_counter()
+        timetable = Timetable.load(directory, cache)
+        report.add("timetable.load_cache_ms", (time.perf_counter() - started) * 1000, "ms", "lower")
+
+    # A Monday: the feed starts on one, and weekday service is the busiest
+    service_date = feed.now.date() + timedelta(days=(7 - feed.now.weekday()) % 7)
+    started = time.perf_counter()
+    timetable.day(service_date)
+    report.add("timetable.day_build_ms", (time.perf_counter() - started) * 1000, "ms", "lower",
+               connections=timetable.connections)
+
+    rng = random.Random(seed)
+    names = sorted(set(timetable.stop_names))
+    pairs = [(rng.sample(names, 2), rng.randrange(6 * 3600, 22 * 3600)) for _ in range(queries)]
+    earliest, profiles, found = [], [], 0
+    for (origin, destination), departure in pairs:
+        sources, targets = timetable.named(origin), timetable.named(destination)
+        started = time.perf_counter()
+        journey = timetable.earliest_arrival(sources, targets, service_date, departure)
+        earliest.append(time.perf_counter() - started)
+        found += journey is not None
+        started = time.perf_counter()
+        timetable.profile(sources, targets, service_date, departure, departure + window_minutes * 60)
+        profiles.append(time.perf_counter() - started)
+    report.add_latency("timetable.earliest_arrival", earliest, found=found)
+    report.add_latency(f"timetable.profile_{window_minutes}min", profiles)
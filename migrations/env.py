@@ -4,6 +4,7 @@ from logging.config import fileConfig
 from flask import current_app
 
 from alembic import context
+from sqlalchemy import engine_from_config, pool
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -15,6 +16,14 @@ fileConfig(config.config_file_name)
 logger = logging.getLogger('alembic.env')
 
 
+def has_flask_app():
+    try:
+        return 'migrate' in current_app.extensions
+    except RuntimeError:
+        # Running plain `alembic` outside a Flask app context
+        return False
+
+
 def get_engine():
     try:
         # this works with Flask-SQLAlchemy<3 and Alchemical
@@ -36,8 +45,14 @@ def get_engine_url():
 # for 'autogenerate' support
 # from myapp import mymodel
 # target_metadata = mymodel.Base.metadata
-config.set_main_option('sqlalchemy.url', get_engine_url())
-target_db = current_app.extensions['migrate'].db
+if has_flask_app():
+    config.set_main_option('sqlalchemy.url', get_engine_url())
+    target_db = current_app.extensions['migrate'].db
+else:
+    # The FastAPI app has no Flask context; take the URL from the app settings
+    from app.core.config import settings
+    config.set_main_option('sqlalchemy.url', settings.DATABASE_URL.replace('%', '%%'))
+    target_db = None
 
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
@@ -46,6 +61,8 @@ target_db = current_app.extensions['migrate'].db
 
 
 def get_metadata():
+    if target_db is None:
+        return None
     if hasattr(target_db, 'metadatas'):
         return target_db.metadatas[None]
     return target_db.metadata
@@ -90,12 +107,19 @@ def run_migrations_online():
                 directives[:] = []
                 logger.info('No changes in schema detected.')
 
-    conf_args = current_app.extensions['migrate'].configure_args
+    if target_db is not None:
+        conf_args = current_app.extensions['migrate'].configure_args
+        connectable = get_engine()
+    else:
+        conf_args = {}
+        connectable = engine_from_config(
+            config.get_section(config.config_ini_section, {}),
+            prefix='sqlalchemy.',
+            poolclass=pool.NullPool,
+        )
     if conf_args.get("process_revision_directives") is None:
         conf_args["process_revision_directives"] = process_revision_directives
 
-    connectable = get_engine()
-
     with connectable.connect() as connection:
         context.configure(
             connection=connection,
@@ -0,0 +1,66 @@
+"""core schema for stations and vehicles
+
+Revision ID: 3b9d2c4e1a07
+Revises: 
+Create Date: 2026-10-19 09:12:40.118230
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b9d2c4e1a07'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # IF NOT EXISTS so databases created by hand before the migrations can be stamped forward
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS stations (
+            id SERIAL PRIMARY KEY,
+            station_name VARCHAR(255) NOT NULL,
+            platform_code VARCHAR(50),
+            zone_id VARCHAR(50),
+            longitude DOUBLE PRECISION,
+            latitude DOUBLE PRECISION
+        )
+    """)
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS vehicles (
+            id SERIAL PRIMARY KEY,
+            type VARCHAR(50) NOT NULL,
+            station_id INTEGER,
+            timestamp TIMESTAMP NOT NULL,
+            status VARCHAR(50) NOT NULL DEFAULT 'ACTIVE'
+        )
+    """)
+
+    # Remove duplicates left by the old check-then-insert sync before adding the dedupe keys
+    op.execute("""
+        DELETE FROM vehicles a USING vehicles b
+        WHERE a.id > b.id
+          AND a.type = b.type AND a.station_id = b.station_id AND a.timestamp = b.timestamp
+    """)
+    op.execute("""
+        DELETE FROM stations a USING stations b
+        WHERE a.id > b.id
+          AND a.station_name = b.station_name AND a.platform_code = b.platform_code
+    """)
+
+    # Ingest dedupe keys, used by ON CONFLICT DO NOTHING in app.services.live_feed
+    op.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS vehicles_type_station_timestamp_key
+        ON vehicles (type, station_id, timestamp)
+    """)
+    op.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS stations_name_platform_key
+        ON stations (station_name, platform_code)
+    """)
+
+
+def downgrade():
+    op.drop_table('vehicles')
+    op.drop_table('stations')
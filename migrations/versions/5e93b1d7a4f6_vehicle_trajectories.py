@@ -0,0 +1,46 @@
+"""delta-encoded vehicle position history
+
+Revision ID: 5e93b1d7a4f6
+Revises: c27a5f19e8b4
+Create Date: 2026-10-19 14:12:05.418337
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e93b1d7a4f6'
+down_revision = 'c27a5f19e8b4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # One row per vehicle and time bucket; data holds the bucket's samples
+    # as delta/varint runs (app.services.trajectories)
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS vehicle_trajectories (
+            vehicle_id VARCHAR(64) NOT NULL,
+            bucket TIMESTAMP NOT NULL,
+            route_id VARCHAR(64),
+            mode VARCHAR(16),
+            first_at TIMESTAMP NOT NULL,
+            last_at TIMESTAMP NOT NULL,
+            min_lat DOUBLE PRECISION NOT NULL,
+            max_lat DOUBLE PRECISION NOT NULL,
+            min_lon DOUBLE PRECISION NOT NULL,
+            max_lon DOUBLE PRECISION NOT NULL,
+            samples INTEGER NOT NULL,
+            data BYTEA NOT NULL,
+            PRIMARY KEY (vehicle_id, bucket)
+        )
+    """)
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS vehicle_trajectories_bucket
+        ON vehicle_trajectories (bucket)
+    """)
+
+
+def downgrade():
+    op.execute("DROP TABLE IF EXISTS vehicle_trajectories")
@@ -0,0 +1,46 @@
+"""indexes for the hot endpoint queries
+
+Revision ID: 8f41e6a0c5d2
+Revises: 3b9d2c4e1a07
+Create Date: 2026-10-19 09:31:05.502114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8f41e6a0c5d2'
+down_revision = '3b9d2c4e1a07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+    # CONCURRENTLY keeps ingest running while the indexes build on a populated table,
+    # and it cannot run inside the migration transaction
+    with op.get_context().autocommit_block():
+        # Append-only, time-ordered inserts make BRIN a tiny index for the hourly/daily ranges
+        op.execute("""
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS vehicles_timestamp_brin
+            ON vehicles USING brin (timestamp)
+        """)
+        # Station join and per-station time ranges
+        op.execute("""
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS vehicles_station_timestamp
+            ON vehicles (station_id, timestamp)
+        """)
+        # Substring search: station_name ILIKE '%query%'
+        op.execute("""
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS stations_name_trgm
+            ON stations USING gin (station_name gin_trgm_ops)
+        """)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS stations_name_trgm")
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS vehicles_station_timestamp")
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS vehicles_timestamp_brin")
@@ -0,0 +1,57 @@
+"""per-route speed, headway and bunching slots
+
+Revision ID: 9a0c6e2f5b18
+Revises: 5e93b1d7a4f6
+Create Date: 2026-10-19 16:40:51.902614
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9a0c6e2f5b18'
+down_revision = '5e93b1d7a4f6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Sums rather than averages, so any range of slots aggregates exactly
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS route_stats (
+            route_id VARCHAR(64) NOT NULL,
+            bucket TIMESTAMP NOT NULL,
+            speed_sum DOUBLE PRECISION NOT NULL,
+            speed_count INTEGER NOT NULL,
+            headway_sum DOUBLE PRECISION NOT NULL,
+            headway_sq DOUBLE PRECISION NOT NULL,
+            headway_count INTEGER NOT NULL,
+            bunching INTEGER NOT NULL,
+            PRIMARY KEY (route_id, bucket)
+        )
+    """)
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS route_stats_bucket
+        ON route_stats (bucket)
+    """)
+
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS bunching_events (
+            route_id VARCHAR(64) NOT NULL,
+            at TIMESTAMP NOT NULL,
+            vehicle_a VARCHAR(64) NOT NULL,
+            vehicle_b VARCHAR(64) NOT NULL,
+            distance_m DOUBLE PRECISION NOT NULL,
+            PRIMARY KEY (route_id, at, vehicle_a, vehicle_b)
+        )
+    """)
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS bunching_events_at
+        ON bunching_events (at DESC)
+    """)
+
+
+def downgrade():
+    op.execute("DROP TABLE IF EXISTS bunching_events")
+    op.execute("DROP TABLE IF EXISTS route_stats")
@@ -0,0 +1,66 @@
+"""materialized views for the dashboard aggregates
+
+Revision ID: c27a5f19e8b4
+Revises: 8f41e6a0c5d2
+Create Date: 2026-10-19 09:47:22.730951
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c27a5f19e8b4'
+down_revision = '8f41e6a0c5d2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS materialized_view_refreshes (
+            view_name VARCHAR PRIMARY KEY,
+            refreshed_at TIMESTAMP NOT NULL
+        )
+    """)
+
+    op.execute("""
+        CREATE MATERIALIZED VIEW IF NOT EXISTS vehicle_counts_by_type AS
+        SELECT type, COUNT(*) AS count
+        FROM vehicles
+        GROUP BY type
+    """)
+    op.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS vehicle_counts_by_type_type
+        ON vehicle_counts_by_type (type)
+    """)
+
+    op.execute("""
+        CREATE MATERIALIZED VIEW IF NOT EXISTS vehicle_counts_by_station AS
+        SELECT s.station_name, COUNT(*) AS count
+        FROM vehicles v
+        JOIN stations s ON v.station_id = s.id
+        GROUP BY s.station_name
+    """)
+    op.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS vehicle_counts_by_station_name
+        ON vehicle_counts_by_station (station_name)
+    """)
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS vehicle_counts_by_station_count
+        ON vehicle_counts_by_station (count DESC)
+    """)
+
+    # Both views were populated just now; the endpoints version them by this time
+    op.execute("""
+        INSERT INTO materialized_view_refreshes (view_name, refreshed_at)
+        VALUES ('vehicle_counts_by_type', now() AT TIME ZONE 'UTC'),
+               ('vehicle_counts_by_station', now() AT TIME ZONE 'UTC')
+        ON CONFLICT (view_name) DO NOTHING
+    """)
+
+
+def downgrade():
+    op.execute("DROP MATERIALIZED VIEW IF EXISTS vehicle_counts_by_station")
+    op.execute("DROP MATERIALIZED VIEW IF EXISTS vehicle_counts_by_type")
+    op.execute("DROP TABLE IF EXISTS materialized_view_refreshes")
@@ -134,87 +134,69 @@ function createTopStationsChart() {
 }
 
 function updateCharts() {
-    updateVehicleTypeChart();
-    updateHourlyActivityChart();
-    updateDailyActivityChart();
-    updateTopStationsChart();
-}
-
-function updateVehicleTypeChart() {
-    fetch('/api/stats/by_type')
-        .then(res => res.json())
-        .then(data => {
-            const counts = [0, 0, 0, 0, 0];
-            data.forEach(item => {
-                switch (item.details.mode) {
-                    case 'BUS': counts[0] = item.count; break;
-                    case 'TRAM': counts[1] = item.count; break;
-                    case 'TRAIN': counts[2] = item.count; break;
-                    case 'SUBWAY': counts[3] = item.count; break;
-                    case 'FERRY': counts[4] = item.count; break;
-                }
-            });
-            vehicleTypeChart.data.datasets[0].data = counts;
-            vehicleTypeChart.update();
-        });
-}
-
-function updateHourlyActivityChart() {
+    // One request for all four charts; the server reads them concurrently and caches the result
     const today = new Date().toISOString().split('T')[0];
-    fetch(`/api/stats/hourly?date=${today}`)
+    fetch(`/api/dashboard/summary?date=${today}&days=7&limit=10`)
         .then(res => res.json())
-        .then(data => {
-            const labels = [];
-            const values = [];
-            data.forEach(entry => {
-                const hour = new Date(entry.timestamp).getHours();
-                labels.push(`${hour}:00`);
-                values.push(entry.count);
-            });
-            hourlyActivityChart.data.labels = labels;
-            hourlyActivityChart.data.datasets[0].data = values;
-            hourlyActivityChart.update();
+        .then(summary => {
+            updateVehicleTypeChart(summary.by_type);
+            updateHourlyActivityChart(summary.hourly);
+            updateDailyActivityChart(summary.daily);
+            updateTopStationsChart(summary.by_station);
         });
 }
 
-function updateDailyActivityChart() {
-    const end = new Date();
-    const start = new Date();
-    start.setDate(start.getDate() - 6);
+function updateVehicleTypeChart(data) {
+    const counts = [0, 0, 0, 0, 0];
+    data.forEach(item => {
+        switch (item.details.mode) {
+            case 'BUS': counts[0] = item.count; break;
+            case 'TRAM': counts[1] = item.count; break;
+            case 'TRAIN': counts[2] = item.count; break;
+            case 'SUBWAY': counts[3] = item.count; break;
+            case 'FERRY': counts[4] = item.count; break;
+        }
+    });
+    vehicleTypeChart.data.datasets[0].data = counts;
+    vehicleTypeChart.update();
+}
 
-    const startDate = start.toISOString().split('T')[0];
-    const endDate = end.toISOString().split('T')[0];
+function updateHourlyActivityChart(data) {
+    const labels = [];
+    const values = [];
+    data.forEach(entry => {
+        const hour = new Date(entry.timestamp).getHours();
+        labels.push(`${hour}:00`);
+        values.push(entry.count);
+    });
+    hourlyActivityChart.data.labels = labels;
+    hourlyActivityChart.data.datasets[0].data = values;
+    hourlyActivityChart.update();
+}
 
-    fetch(`/api/stats/daily?start_date=${startDate}&end_date=${endDate}`)
-        .then(res => res.json())
-        .then(data => {
-            const labels = [];
-            const values = [];
-            data.forEach(entry => {
-                const date = new Date(entry.timestamp).toLocaleDateString('en-US', { month: 'short', day: 'numeric' });
-                labels.push(date);
-                values.push(entry.count);
-            });
-            dailyActivityChart.data.labels = labels;
-            dailyActivityChart.data.datasets[0].data = values;
-            dailyActivityChart.update();
-        });
+function updateDailyActivityChart(data) {
+    const labels = [];
+    const values = [];
+    data.forEach(entry => {
+        const date = new Date(entry.timestamp).toLocaleDateString('en-US', { month: 'short', day: 'numeric' });
+        labels.push(date);
+        values.push(entry.count);
+    });
+    dailyActivityChart.data.labels = labels;
+    dailyActivityChart.data.datasets[0].data = values;
+    dailyActivityChart.update();
 }
 
-function updateTopStationsChart() {
-    fetch('/api/stats/by_station?limit=10')
-        .then(res => res.json())
-        .then(data => {
-            const labels = [];
-            const values = [];
-            data.forEach(entry => {
-                labels.push(entry.details.station_name);
-                values.push(entry.count);
-            });
-            topStationsChart.data.labels = labels;
-            topStationsChart.data.datasets[0].data = values;
-            topStationsChart.update();
-        });
+function updateTopStationsChart(data) {
+    const labels = [];
+    const values = [];
+    data.forEach(entry => {
+        labels.push(entry.details.station_name);
+        values.push(entry.count);
+    });
+    topStationsChart.data.labels = labels;
+    topStationsChart.data.datasets[0].data = values;
+    topStationsChart.update();
 }
 
 document.addEventListener('DOMContentLoaded', initDashboard);
@@ -1,9 +1,13 @@
 // Initialize map with Helsinki coordinates
 let map;
 let vehicleMarkers = {};
-let stationMarkers = {};
 let routeLines = {};
 let refreshInterval;
+let replay = null; // While playing back history: the stream's abort controller, vehicles by index and clock
+let vehicleDensity; // Live fleet drawn from /tiles while zoomed out
+let stationActivity; // Vehicle events per station, from /tiles
+
+const MARKER_ZOOM = 14; // Below this zoom vehicles are a density layer instead of markers
 
 
 // Vehicle and station icons
@@ -57,12 +61,164 @@ function initMap() {
         maxZoom: 19
     }).addTo(map);
 
+    vehicleDensity = new DensityLayer({ layer: 'vehicles' });
+    stationActivity = new DensityLayer({ layer: 'stations', zIndex: 2 });
+    L.control.layers(null, { 'Station activity': stationActivity }).addTo(map);
+
     // Add legend
     addLegend();
 
     // Start fetching vehicles
+    startLive();
+    initPlayback();
+}
+
+function startLive() {
     fetchVehicles();
     refreshInterval = setInterval(fetchVehicles, 10000); // Refresh every 10 seconds
+    map.on('moveend', fetchVehicles); // Only the visible area is fetched
+}
+
+function stopLive() {
+    clearInterval(refreshInterval);
+    map.off('moveend', fetchVehicles);
+    map.removeLayer(vehicleDensity);
+}
+
+function initPlayback() {
+    // Default to an hour ago, in local time as datetime-local expects
+    const start = new Date(Date.now() - 3600 * 1000);
+    start.setMinutes(start.getMinutes() - start.getTimezoneOffset());
+    document.getElementById('replayStart').value = start.toISOString().slice(0, 16);
+    document.getElementById('replayButton').addEventListener('click', () => {
+        const value = document.getElementById('replayStart').value;
+        if (value) {
+            startReplay(new Date(value));
+        }
+    });
+    document.getElementById('liveButton').addEventListener('click', showLive);
+}
+
+function startReplay(start) {
+    if (replay) {
+        stopReplay();
+    } else {
+        stopLive();
+        map.on('moveend', moveReplay);
+    }
+    const controller = new AbortController();
+    replay = { controller: controller, vehicles: [], clock: start.getTime() / 1000 };
+    document.getElementById('liveButton').disabled = false;
+
+    const params = new URLSearchParams({
+        start: start.toISOString(),
+        speed: document.getElementById('replaySpeed').value,
+        bbox: map.getBounds().pad(0.1).toBBoxString()
+    });
+    fetch(`/api/replay?${params}`, { signal: controller.signal })
+        .then(response => {
+            if (!response.ok) {
+                throw new Error(`HTTP error! Status: ${response.status}`);
+            }
+            return readFrames(response.body.getReader(), applyFrame);
+        })
+        .catch(error => {
+            if (error.name !== 'AbortError') {
+                console.error('Error replaying history:', error);
+            }
+        });
+}
+
+function moveReplay() {
+    // The stream only covers the area it started with: resume from the current time over the new one
+    startReplay(new Date(replay.clock * 1000));
+}
+
+function stopReplay() {
+    if (replay) {
+        replay.controller.abort();
+        replay = null;
+    }
+}
+
+function showLive() {
+    stopReplay();
+    map.off('moveend', moveReplay);
+    document.getElementById('liveButton').disabled = true;
+    document.getElementById('replayClock').textContent = 'Live';
+    startLive();
+}
+
+function readFrames(reader, onFrame) {
+    // Newline-delimited JSON, one frame per line
+    const decoder = new TextDecoder();
+    let buffered = '';
+    function pump() {
+        return reader.read().then(({ done, value }) => {
+            if (done) {
+                return;
+            }
+            buffered += decoder.decode(value, { stream: true });
+            const lines = buffered.split('\n');
+            buffered = lines.pop();
+            lines.forEach(line => {
+                if (line) {
+                    onFrame(JSON.parse(line));
+                }
+            });
+            return pump();
+        });
+    }
+    return pump();
+}
+
+function applyFrame(frame) {
+    if (!replay) {
+        return;
+    }
+    const clock = document.getElementById('replayClock');
+    if (frame.end) {
+        clock.textContent = `${clock.textContent} (end)`;
+        return;
+    }
+
+    // Keyframes list every vehicle in view; deltas add, move or drop vehicles by index
+    if (frame.key) {
+        replay.vehicles = frame.id.map((id, n) => ({
+            id: id, route_id: frame.route[n], mode: frame.mode[n],
+            lat: frame.lat[n], lon: frame.lon[n], heading: frame.h[n]
+        }));
+    } else {
+        (frame.del || []).forEach(index => {
+            delete replay.vehicles[index];
+        });
+        if (frame.add) {
+            frame.add.i.forEach((index, n) => {
+                replay.vehicles[index] = {
+                    id: frame.add.id[n], route_id: frame.add.route[n], mode: frame.add.mode[n],
+                    lat: frame.add.lat[n], lon: frame.add.lon[n], heading: frame.add.h[n]
+                };
+            });
+        }
+        if (frame.move) {
+            frame.move.i.forEach((index, n) => {
+                const vehicle = replay.vehicles[index];
+                vehicle.lat += frame.move.dlat[n];
+                vehicle.lon += frame.move.dlon[n];
+                vehicle.heading = frame.move.h[n];
+            });
+        }
+    }
+    replay.clock = frame.t;
+    clock.textContent = new Date(frame.t * 1000).toLocaleString();
+
+    updateVehicles(replay.vehicles.filter(vehicle => vehicle).map(vehicle => ({
+        id: vehicle.id,
+        route_id: vehicle.route_id,
+        mode: vehicle.mode,
+        heading: vehicle.heading >= 0 ? vehicle.heading : null,
+        position: { latitude: vehicle.lat / 1e6, longitude: vehicle.lon / 1e6 }
+    })));
 }
 
 function addLegend() {
@@ -85,7 +241,18 @@ function addLegend() {
 }
 
 function fetchVehicles() {
-    fetch('/api/vehicles')
+    if (map.getZoom() < MARKER_ZOOM) {
+        // Thousands of markers are slow to draw: show where the vehicles are from the density tiles
+        clearVehicleMarkers();
+        if (map.hasLayer(vehicleDensity)) {
+            vehicleDensity.redraw();
+        } else {
+            vehicleDensity.addTo(map);
+        }
+        return;
+    }
+    map.removeLayer(vehicleDensity);
+    fetch(`/api/vehicles/live?bbox=${map.getBounds().pad(0.1).toBBoxString()}`)
         .then(response => {
             if (!response.ok) {
                 throw new Error(`HTTP error! Status: ${response.status}`);
@@ -165,6 +332,83 @@ function updateVehicles(vehicles) {
     document.getElementById('ferryCount').textContent = vehicleCounts.FERRY || 0;
 }
 
+function clearVehicleMarkers() {
+    for (const vehicleId in vehicleMarkers) {
+        map.removeLayer(vehicleMarkers[vehicleId]);
+    }
+    vehicleMarkers = {};
+}
+
+// Canvas tiles drawn from /tiles/{z}/{x}/{y}: a tile either lists its points or
+// gives the non-empty cells of a density grid with their count, weight and centroid
+const DensityLayer = L.GridLayer.extend({
+    createTile: function(coords, done) {
+        const tile = L.DomUtil.create('canvas', 'density-tile');
+        const size = this.getTileSize();
+        tile.width = size.x;
+        tile.height = size.y;
+        fetch(`/tiles/${coords.z}/${coords.x}/${coords.y}?layer=${this.options.layer}`)
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error(`HTTP error! Status: ${response.status}`);
+                }
+                return response.json();
+            })
+            .then(data => {
+                const context = tile.getContext('2d');
+                if (this.options.layer === 'stations') {
+                    this.drawActivity(context, coords, data);
+                } else {
+                    this.drawVehicles(context, coords, data, size);
+                }
+                done(null, tile);
+            })
+            .catch(error => done(error, tile));
+        return tile;
+    },
+
+    pixel: function(coords, lat, lon) {
+        return this._map.project([lat, lon], coords.z).subtract(coords.scaleBy(this.getTileSize()));
+    },
+
+    drawVehicles: function(context, coords, data, size) {
+        if (data.points) {
+            data.points.lat.forEach((lat, n) => {
+                const point = this.pixel(coords, lat, data.points.lon[n]);
+                context.fillStyle = getVehicleColor(data.points.mode[n]);
+                context.beginPath();
+                context.arc(point.x, point.y, 3, 0, 2 * Math.PI);
+                context.fill();
+            });
+            return;
+        }
+        // Heatmap: the more vehicles in a cell, the more opaque
+        const cell = size.x / data.grid;
+        data.cells.forEach((index, n) => {
+            context.fillStyle = `rgba(253, 126, 20, ${Math.min(1, 0.25 + Math.log2(1 + data.n[n]) / 5)})`;
+            context.fillRect((index % data.grid) * cell, Math.floor(index / data.grid) * cell, cell, cell);
+        });
+    },
+
+    drawActivity: function(context, coords, data) {
+        // A circle per station, or per cluster of stations, sized by its vehicle events
+        const clusters = data.points || data;
+        clusters.lat.forEach((lat, n) => {
+            const weight = clusters.w[n];
+            if (!weight) {
+                return;
+            }
+            const point = this.pixel(coords, lat, clusters.lon[n]);
+            context.fillStyle = 'rgba(35, 163, 218, 0.45)';
+            context.strokeStyle = '#23a3da';
+            context.beginPath();
+            context.arc(point.x, point.y, 2 + Math.log2(1 + weight), 0, 2 * Math.PI);
+            context.fill();
+            context.stroke();
+        });
+    }
+});
+
 function createVehiclePopup(vehicle) {
     const content = `
         <div class="vehicle-popup">
@@ -192,42 +436,8 @@ function getVehicleColor(mode) {
 }
 
 function showStations() {
-    // Fetch all stations
-    fetch('/api/stations')
-        .then(response => {
-            if (!response.ok) {
-                throw new Error(`HTTP error! Status: ${response.status}`);
-            }
-            return response.json();
-        })
-        .then(stations => {
-            stations.forEach(station => {
-                if (!stationMarkers[station.id]) {
-                    const marker = L.marker([station.position.latitude, station.position.longitude], {
-                        icon: stationIcon
-                    });
-                    
-                    const popup = `
-                        <div class="station-popup">
-                            <div class="station-name">${station.name} ${station.code ? '(' + station.code + ')' : ''}</div>
-                            <div class="station-details">
-                                <div>Zone: ${station.zone_id || 'N/A'}</div>
-                                <div>Platform: ${station.platform_code || 'N/A'}</div>
-                                <div>Routes: ${station.routes ? station.routes.length : 0}</div>
-                            </div>
-                            ${station.routes && station.routes.length > 0 ? 
-                                `<button class="btn btn-sm btn-primary mt-2" onclick="showRoute('${station.routes[0]}')">Show Route</button>` : 
-                                ''}
-                        </div>
-                    `;
-                    
-                    marker.bindPopup(popup);
-                    marker.addTo(map);
-                    stationMarkers[station.id] = marker;
-                }
-            });
-        })
-        .catch(error => console.error('Error fetching stations:', error));
+    // Station activity comes as tiles rather than a marker per station
+    stationActivity.addTo(map);
 }
 
 function showRoute(routeId) {
@@ -0,0 +1,32 @@
+import os
+
+from app.simulation.archive import ArchiveWriter, read_manifest, read_records, segment_paths, summary
+
+
+def test_records_round_trip_with_filters(tmp_path):
+    writer = ArchiveWriter(str(tmp_path), segment_seconds=10, source="test")
+    for i in range(6):
+        writer.append("vehicles" if i % 2 == 0 else "stations", f"body {i}".encode(), recorded_at=100.0 + 5 * i)
+    writer.close()
+    assert len(segment_paths(str(tmp_path))) == 3
+    assert read_manifest(str(tmp_path))["source"] == "test"
+
+    records = list(read_records(str(tmp_path)))
+    assert [body for _, _, body in records] == [f"body {i}".encode() for i in range(6)]
+    assert [at for at, _, _ in read_records(str(tmp_path), feeds=["stations"])] == [105.0, 115.0, 125.0]
+    assert [at for at, _, _ in read_records(str(tmp_path), start=110, end=120)] == [110.0, 115.0, 120.0]
+    assert summary(str(tmp_path)) == {
+        "vehicles": {"records": 3, "first": 100.0, "last": 120.0},
+        "stations": {"records": 3, "first": 105.0, "last": 125.0},
+    }
+
+
+def test_reading_stops_at_a_torn_record(tmp_path):
+    writer = ArchiveWriter(str(tmp_path))
+    writer.append("vehicles", b"complete", recorded_at=1.0)
+    writer.append("vehicles", b"torn" * 100, recorded_at=2.0)
+    writer.close()
+    path = segment_paths(str(tmp_path))[-1]
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) - 10)
+    assert [body for _, _, body in read_records(str(tmp_path))] == [b"complete"]
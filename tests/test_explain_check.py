@@ -0,0 +1,17 @@
+import asyncio
+import os
+
+import pytest
+
+from app.db.explain_check import CHECKS, run_checks
+
+DSN = os.getenv("TEST_DATABASE_URL")
+
+pytestmark = pytest.mark.skipif(not DSN, reason="TEST_DATABASE_URL (a database migrated to head) is not set")
+
+
+def test_every_endpoint_query_uses_an_index():
+    results = asyncio.run(run_checks(DSN))
+    assert [name for name, _, _ in results] == [name for name, _, _ in CHECKS]
+    failed = {name: nodes for name, passed, nodes in results if not passed}
+    assert not failed, f"queries without an index: {failed}"
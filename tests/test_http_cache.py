@@ -0,0 +1,44 @@
+from datetime import datetime
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+
+from app.core import http_cache
+
+
+def make_client(size: int) -> TestClient:
+    app = FastAPI()
+    app.add_middleware(http_cache.HttpCacheMiddleware, minimum_size=1024)
+
+    @app.get("/data")
+    async def data(request: Request):
+        not_modified = http_cache.check(request, http_cache.freshness(request, "v1", datetime(2026, 1, 1), 5))
+        return not_modified or JSONResponse({"values": list(range(size))})
+
+    return TestClient(app)
+
+
+@pytest.mark.parametrize("size, suffix", [(2000, "-gz"), (3, "")])
+def test_not_modified_carries_the_etag_of_the_200(size, suffix):
+    client = make_client(size)
+    headers = {"Accept-Encoding": "gzip"}
+    full = client.get("/data", headers=headers)
+    etag = full.headers["etag"]
+    assert etag.endswith(suffix + '"')
+    again = client.get("/data", headers={**headers, "If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.headers["etag"] == etag
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("gzip", "gzip"),
+    ("gzip;q=1, br;q=0.5", "gzip"),
+    ("gzip;q=0.2, *;q=0.8", "br" if http_cache.brotli is not None else "gzip"),
+    ("br;q=0, gzip;q=0", None),
+    ("gzip;q=0.5, identity", None),
+    ("", None),
+])
+def test_negotiate_by_q_value(header, expected):
+    assert http_cache.negotiate(header) == expected
@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from app.services.recent_window import RecentWindow, _epoch, _utcnow
+
+
+def ready_window(capacity=5, hours=48):
+    window = RecentWindow(capacity, hours)
+    window.ready = True
+    return window
+
+
+def test_ring_wraps_and_coverage_moves_past_overwritten_events():
+    window = ready_window(capacity=5)
+    start = _utcnow().replace(minute=0, second=0, microsecond=0) - timedelta(hours=10)
+    times = [start + timedelta(hours=i) for i in range(8)]
+    window.append([("BUS", 1, at, None) for at in times])
+    assert window.size == 5
+    assert sorted(window.ts.tolist()) == _epoch(times[3:]).tolist()
+    # The three oldest were overwritten: the window no longer covers them
+    assert window.covered_since == int(_epoch([times[2]])[0]) + 1
+    assert window.station_counts(int(_epoch([times[0]])[0]), int(_epoch([times[-1]])[0])) is None
+    counts = window.station_counts(int(_epoch([times[3]])[0]), int(_epoch([times[-1]])[0]) + 1)
+    assert counts.tolist() == [0, 5]
+    # The all-time totals still count every event
+    assert window.counts_by_mode() == [("BUS", 8)]
+
+
+def test_hourly_counts_and_coverage_limit():
+    window = ready_window(capacity=100, hours=48)
+    day = (_utcnow() - timedelta(days=1)).date()
+    midnight = datetime(day.year, day.month, day.day)
+    window.append([("TRAM", 2, midnight + timedelta(hours=h, minutes=5), None) for h in (0, 0, 13)])
+    assert window.hourly(day) == [(midnight, 2), (midnight + timedelta(hours=13), 1)]
+    # Three days back is outside a 48-hour window
+    assert window.hourly(day - timedelta(days=2)) is None
+
+
+def test_appends_before_the_load_are_left_to_it():
+    window = RecentWindow(10, 48)
+    window.append([("BUS", 1, _utcnow(), None)])
+    assert window.size == 0 and window.counts_by_mode() == []
+
+
+def test_unseen_drops_rows_the_snapshot_has():
+    window = ready_window(capacity=10)
+    now = _utcnow().replace(microsecond=0)
+    loaded = [("BUS", 1, now), ("TRAM", 2, now)]
+    ts = _epoch([row[2] for row in loaded])
+    modes = np.array([window._mode_code(row[0]) for row in loaded], dtype=np.uint8)
+    stations = np.array([row[1] for row in loaded], dtype=np.int32)
+    held = [("BUS", 1, now, None), ("BUS", 2, now, None), ("TRAM", 2, now + timedelta(seconds=1), None)]
+    assert window._unseen(held, ts, modes, stations) == held[1:]
+
+
+def test_events_without_a_station_count_only_by_mode():
+    window = ready_window(capacity=10)
+    now = _utcnow()
+    window.append([("BUS", None, now, None), ("BUS", 3, now, None)])
+    assert window.counts_by_mode() == [("BUS", 2)]
+    assert window.station_totals.tolist() == [0, 0, 0, 1]
+    start = int(_epoch([now])[0])
+    assert window.station_counts(start, start + 1).tolist() == [0, 0, 0, 1]
@@ -0,0 +1,52 @@
+import asyncio
+import json
+
+import numpy as np
+
+from app.services.replay import Bucket, replay_frames
+
+
+class FakeBuckets:
+    bucket_seconds = 600
+    active = replays = frames = 0
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+
+    async def get(self, start):
+        empty = np.zeros(0, dtype=np.int64)
+        return self.buckets.get(start, Bucket(start, [], [], [], np.zeros(0), empty, empty, empty, empty))
+
+
+def bucket(start, samples):
+    """Bucket of (vehicle id, epoch seconds) samples, all at the same position"""
+    ids = sorted({vehicle for vehicle, _ in samples})
+    samples = sorted(samples, key=lambda sample: sample[1])
+    n = len(samples)
+    return Bucket(
+        start, ids, [None] * len(ids), ["bus"] * len(ids),
+        np.array([t for _, t in samples], dtype=np.float64),
+        np.array([ids.index(vehicle) for vehicle, _ in samples], dtype=np.int32),
+        np.full(n, 60_170_000), np.full(n, 24_940_000), np.full(n, -1),
+    )
+
+
+def frames(buckets, start, end, **options):
+    async def collect():
+        return [json.loads(frame) async for frame in replay_frames(buckets, start, end, 1000, frame_interval=0.001, **options)]
+    return asyncio.run(collect())
+
+
+def test_first_keyframe_leaves_out_stale_vehicles():
+    # The bucket holding start - stale_seconds also holds samples from long before it
+    buckets = FakeBuckets({600: bucket(600, [("old", 610), ("recent", 1170)])})
+    first = frames(buckets, 1200, 1200, stale_seconds=60)[0]
+    assert first["key"] == 1
+    assert first["id"] == ["recent"]
+
+
+def test_vehicles_leave_once_stale():
+    buckets = FakeBuckets({0: bucket(0, [("a", 10), ("b", 10), ("b", 100)])})
+    result = frames(buckets, 10, 140, stale_seconds=60, keyframe_seconds=1000)
+    index = {vehicle: i for i, vehicle in enumerate(result[0]["id"])}
+    assert [frame["del"] for frame in result if "del" in frame] == [[index["a"]]]
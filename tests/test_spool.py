@@ -0,0 +1,63 @@
+import os
+
+from app.services.spool import Spool
+
+
+def test_read_commit_and_resume_from_checkpoint(tmp_path):
+    spool = Spool(str(tmp_path), "vehicles")
+    for batch in ([1, 2], [3], [4, 5, 6]):
+        assert spool.append(batch)
+    rows, position = spool.read(3)
+    assert rows == [1, 2, 3]
+    spool.commit(position, len(rows))
+    assert spool.has_pending()
+
+    # A restart picks up after the last commit
+    reopened = Spool(str(tmp_path), "vehicles")
+    rows, position = reopened.read(100)
+    assert rows == [4, 5, 6]
+    reopened.commit(position)
+    assert not reopened.has_pending()
+    assert reopened.stats()["segments"] == 0
+
+
+def test_uncommitted_rows_are_read_again(tmp_path):
+    spool = Spool(str(tmp_path), "vehicles")
+    spool.append(["a"])
+    assert spool.read(10)[0] == ["a"]
+    assert Spool(str(tmp_path), "vehicles").read(10)[0] == ["a"]
+
+
+def test_torn_record_at_the_tail_is_skipped(tmp_path):
+    spool = Spool(str(tmp_path), "vehicles")
+    spool.append([1])
+    spool.append([2])
+    path = spool._path(max(spool._sizes))
+    # A crash in the middle of the second write
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) - 3)
+    rows, _ = Spool(str(tmp_path), "vehicles").read(10)
+    assert rows == [1]
+
+
+def test_rolls_segments_and_drops_the_oldest_when_full(tmp_path):
+    spool = Spool(str(tmp_path), "vehicles", segment_bytes=64, max_bytes=256)
+    for i in range(40):
+        spool.append([i] * 5)
+    stats = spool.stats()
+    assert stats["dropped_segments"] > 0
+    assert stats["bytes"] <= 256
+    rows, _ = spool.read(1000)
+    # Whatever is left is the newest rows, in order
+    assert rows == sorted(rows) and rows[-1] == 39
+
+
+def test_quarantine_moves_past_the_record(tmp_path):
+    spool = Spool(str(tmp_path), "vehicles")
+    spool.append(["bad"])
+    spool.append(["good"])
+    rows, position = spool.read(1)
+    spool.quarantine(position, rows)
+    assert spool.read(10)[0] == ["good"]
+    assert spool.stats()["quarantined_rows"] == 1
+    assert os.path.getsize(tmp_path / "vehicles.quarantine") > 0
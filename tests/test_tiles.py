@@ -0,0 +1,37 @@
+import math
+
+import numpy as np
+
+from app.services.tiles import ZOOM, _compact, _spread, codes, tile_range
+
+
+def slippy(lat, lon, z):
+    """Tile x, y holding a point, by the usual web map formula"""
+    n = 2 ** z
+    x = int((lon + 180) / 360 * n)
+    y = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n)
+    return x, y
+
+
+def test_spread_and_compact_are_inverse():
+    values = np.array([0, 1, 2, 3, 0xFFFF, 0x123456, (1 << ZOOM) - 1], dtype=np.int64)
+    spread = _spread(values)
+    assert spread[:4].tolist() == [0b0, 0b1, 0b100, 0b101]
+    assert np.array_equal(_compact(spread), values)
+
+
+def test_point_code_falls_in_its_tile_range():
+    points = [(60.1699, 24.9384), (60.2055, 24.6559), (-33.8688, 151.2093), (0.0, 0.0), (85.0, -179.9)]
+    lat, lon = np.array(points).T
+    point_codes = codes(lat, lon)
+    for (la, lo), code in zip(points, point_codes.tolist()):
+        for z in (0, 5, 12, 18):
+            low, high = tile_range(z, *slippy(la, lo, z))
+            assert low <= code < high
+
+
+def test_child_ranges_split_the_parent():
+    low, high = tile_range(10, 583, 296)
+    children = sorted(tile_range(11, 2 * 583 + dx, 2 * 296 + dy) for dx in (0, 1) for dy in (0, 1))
+    assert children[0][0] == low and children[-1][1] == high
+    assert all(a[1] == b[0] for a, b in zip(children, children[1:]))
@@ -0,0 +1,45 @@
+import numpy as np
+
+from app.services.trajectories import (
+    FIELDS, decode_chunk, decode_varints, encode_run, encode_varints, unzigzag, zigzag,
+)
+
+
+def test_zigzag_round_trip():
+    values = np.array([0, -1, 1, -2, 2, 2 ** 62, -(2 ** 62), 2 ** 63 - 1, -(2 ** 63)], dtype=np.int64)
+    encoded = zigzag(values)
+    assert encoded[:5].tolist() == [0, 1, 2, 3, 4]
+    assert np.array_equal(unzigzag(encoded), values)
+
+
+def test_varints_round_trip():
+    values = np.array([0, 1, 127, 128, 300, 16383, 16384, 2 ** 35, 2 ** 64 - 1], dtype=np.uint64)
+    data = encode_varints(values)
+    assert encode_varints(np.array([300], dtype=np.uint64)) == b"\xac\x02"
+    assert np.array_equal(decode_varints(data), values)
+
+
+def test_varints_empty():
+    assert encode_varints(np.zeros(0, dtype=np.uint64)) == b""
+    assert len(decode_varints(b"")) == 0
+
+
+def run(t, lat=60_170_000, lon=24_940_000, speed=-1, heading=-1):
+    t = np.asarray(t, dtype=np.int64)
+    return {"t": t, "lat": lat + t, "lon": lon - t, "speed": np.full(len(t), speed), "heading": np.full(len(t), heading)}
+
+
+def test_chunk_round_trip_with_chained_and_interleaved_runs():
+    first = run([0, 1000, 2000])
+    last = np.array([first[name][-1] for name in FIELDS])
+    chained = run([3000, 4000], speed=55, heading=270)
+    # A run from another leader, interleaving in time with the first one
+    other = run([500, 1500], lat=60_200_000)
+    chunk = decode_chunk(encode_run(first) + encode_run(chained, last) + encode_run(other))
+    assert chunk["t"].tolist() == [0, 500, 1000, 1500, 2000, 3000, 4000]
+    assert chunk["lat"].tolist() == [60_170_000, 60_200_500, 60_171_000, 60_201_500, 60_172_000, 60_173_000, 60_174_000]
+    assert chunk["speed"].tolist() == [-1, -1, -1, -1, -1, 55, 55]
+
+
+def test_empty_chunk():
+    assert all(len(values) == 0 for values in decode_chunk(b"").values())